@@ -0,0 +1,70 @@
+import re
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+
+# The block between the repeat markers of these pages is repeated at load time,
+# so large pages do not have to be checked in as megabytes of HTML.
+REPEATS = {
+    'listing_large.html': 2000,
+    'head_heavy.html': 3000,
+}
+REPEAT_PATTERN = re.compile(rb'(<!-- repeat -->|/\* repeat \*/)(.*?)(<!-- /repeat -->|/\* /repeat \*/)', re.S)
+
+# Content-Type headers sent by the stub server. The broken charset page lies about its encoding
+# in the header as well, like the origin it was saved from.
+CONTENT_TYPES = {
+    'broken_charset.html': 'text/html; charset=utf-8',
+    'no_opengraph.html': 'text/html',
+}
+DEFAULT_CONTENT_TYPE = 'text/html; charset=utf-8'
+
+
+@dataclass
+class Page:
+    name: str
+    body: bytes
+    content_type: str
+
+
+@dataclass
+class SampleImage:
+    name: str
+    body: bytes
+    content_type: str
+
+
+def load_pages(names: list[str] | None = None) -> list[Page]:
+    """Loads the saved pages of the corpus, expanding the repeated blocks of large pages."""
+    pages = []
+    for path in sorted(CORPUS_DIR.glob('*.html')):
+        if names and path.name not in names:
+            continue
+        body = path.read_bytes()
+        count = REPEATS.get(path.name, 1)
+        body = REPEAT_PATTERN.sub(lambda m: m.group(2) * count, body)
+        pages.append(Page(name=path.name,
+                          body=body,
+                          content_type=CONTENT_TYPES.get(path.name, DEFAULT_CONTENT_TYPE)))
+    return pages
+
+
+def make_images() -> list[SampleImage]:
+    """
+    Renders product-like images of common sizes and formats.
+    Images are generated instead of checked in; the noise keeps encoders from compressing them away.
+    """
+    images = []
+    for name, size, fmt, content_type in [('thumbnail.jpg', (200, 200), 'JPEG', 'image/jpeg'),
+                                          ('product.jpg', (1200, 1200), 'JPEG', 'image/jpeg'),
+                                          ('banner.png', (1600, 600), 'PNG', 'image/png'),
+                                          ('product.webp', (1000, 1000), 'WEBP', 'image/webp'),
+                                          ('cdn-image-without-extension', (800, 800), 'JPEG', 'image/jpeg')]:
+        buffer = BytesIO()
+        Image.effect_noise(size, 64).convert('RGB').save(buffer, format=fmt)
+        images.append(SampleImage(name=name, body=buffer.getvalue(), content_type=content_type))
+    return images
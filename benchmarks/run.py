@@ -0,0 +1,222 @@
+"""
+Benchmarks of the crawler over the recorded corpus in benchmarks/corpus.
+
+Usage:
+    python -m benchmarks.run [--iterations N] [--case NAME ...] [--per-page]
+                             [--output result.json] [--baseline result.json] [--tolerance 0.2]
+
+Each case is timed per call (throughput and latency percentiles), then run once more under
+tracemalloc for its peak memory, so the tracing overhead does not distort the timings.
+With --baseline, the run fails if the median latency of a case regressed by more than the tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'capellawish.settings')
+django.setup()
+
+import requests
+from bs4.builder import builder_registry
+from django.conf import settings
+
+from benchmarks.corpus import load_pages, make_images
+from benchmarks.server import StubServer
+from crawler.client import close_session
+from crawler.extractor import extract_head
+from crawler.images import fetch_image, guess_filename
+from crawler.parseworker import create_soup, parse_opengraph_properties
+from crawler.tasks import HEAD_CHUNK_SIZE, retrieve_data
+
+PARSER_BACKENDS = ['lxml', 'html.parser', 'html5lib']
+
+
+@dataclass
+class Call:
+    """A single input of a benchmark case."""
+    label: str
+    func: Callable[[], object]
+    size: int
+
+
+@dataclass
+class CaseResult:
+    case: str
+    label: str
+    samples: list[float] = field(default_factory=list)
+    size: int = 0
+    peak_memory: int = 0
+
+    def percentile(self, p: int) -> float:
+        if len(self.samples) < 2:
+            return self.samples[0] if self.samples else 0.0
+        return statistics.quantiles(self.samples, n=100, method='inclusive')[p - 1]
+
+    def summary(self) -> dict:
+        total = sum(self.samples)
+        return {
+            'calls': len(self.samples),
+            'calls_per_second': len(self.samples) / total if total else 0.0,
+            'mb_per_second': self.size / total / 1024 / 1024 if total else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p90_ms': self.percentile(90) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'peak_memory_kib': self.peak_memory / 1024,
+        }
+
+
+def split_chunks(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def make_response(url: str, content_type: str) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    return response
+
+
+def build_cases(pages, images, base_url: str) -> dict[str, list[Call]]:
+    cases = {}
+
+    # Parser backends over whole pages, against the streaming extractor reading only <head>
+    for backend in PARSER_BACKENDS:
+        if builder_registry.lookup(backend) is None:
+            print(f'Skipping parser backend {backend}: not installed', file=sys.stderr)
+            continue
+        cases[f'create_soup[{backend}]'] = [
+            Call(p.name, lambda body=p.body, backend=backend: create_soup(body, backend), len(p.body))
+            for p in pages]
+    cases['extract_head'] = [
+        Call(p.name,
+             lambda body=p.body: extract_head(split_chunks(body, HEAD_CHUNK_SIZE),
+                                              max_bytes=settings.CRAWLER_HEAD_MAX_BYTES),
+             len(p.body))
+        for p in pages]
+
+    soups = {p.name: create_soup(p.body, 'lxml') for p in pages}
+    cases['parse_opengraph_properties'] = [
+        Call(p.name, lambda soup=soups[p.name]: parse_opengraph_properties(soup), len(p.body))
+        for p in pages]
+
+    cases['retrieve_data'] = [
+        Call(p.name, lambda url=f'{base_url}/pages/{p.name}': retrieve_data(url, use_cache=False), len(p.body))
+        for p in pages]
+
+    cases['guess_filename'] = [
+        Call(i.name,
+             lambda url=f'{base_url}/images/{i.name}', ct=i.content_type: guess_filename(url, make_response(url, ct)),
+             0)
+        for i in images]
+    cases['fetch_image'] = [
+        Call(i.name, lambda url=f'{base_url}/images/{i.name}': fetch_image(url).close(), len(i.body))
+        for i in images]
+    return cases
+
+
+def run_case(case: str, calls: list[Call], iterations: int) -> list[CaseResult]:
+    results = [CaseResult(case=case, label=c.label) for c in calls]
+    for call in calls:
+        # Warm up connections, imports and caches of the parsers
+        call.func()
+    for _ in range(iterations):
+        for call, result in zip(calls, results):
+            start = time.perf_counter()
+            call.func()
+            result.samples.append(time.perf_counter() - start)
+            result.size += call.size
+
+    gc.collect()
+    tracemalloc.start()
+    for call, result in zip(calls, results):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call.func()
+        result.peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return results
+
+
+def merge(case: str, results: list[CaseResult]) -> CaseResult:
+    merged = CaseResult(case=case, label='*')
+    for r in results:
+        merged.samples.extend(r.samples)
+        merged.size += r.size
+        merged.peak_memory = max(merged.peak_memory, r.peak_memory)
+    return merged
+
+
+def print_table(rows: list[tuple[str, dict]]) -> None:
+    header = f'{"case":<52} {"calls":>6} {"calls/s":>10} {"MB/s":>8} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"peak KiB":>10}'
+    print(header)
+    print('-' * len(header))
+    for name, s in rows:
+        print(f'{name:<52} {s["calls"]:>6} {s["calls_per_second"]:>10.1f} {s["mb_per_second"]:>8.2f} '
+              f'{s["p50_ms"]:>9.3f} {s["p90_ms"]:>9.3f} {s["p99_ms"]:>9.3f} {s["peak_memory_kib"]:>10.1f}')
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for case, s in summary.items():
+        before = baseline.get(case)
+        if not before or not before['p50_ms']:
+            continue
+        change = s['p50_ms'] / before['p50_ms'] - 1
+        if change > tolerance:
+            regressions.append(f'{case}: p50 {before["p50_ms"]:.3f} ms -> {s["p50_ms"]:.3f} ms (+{change:.0%})')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks the crawler over the recorded HTML corpus.')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed passes over the inputs of each case')
+    parser.add_argument('--case', action='append', help='Run only cases starting with this name')
+    parser.add_argument('--page', action='append', help='Use only this page of the corpus')
+    parser.add_argument('--per-page', action='store_true', help='Report each page of a case separately')
+    parser.add_argument('--output', help='Write the summary as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against a summary written by --output')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args.page)
+    images = make_images()
+    summary = {}
+    rows = []
+    with StubServer(pages, images) as server:
+        cases = build_cases(pages, images, server.base_url)
+        for case, calls in cases.items():
+            if args.case and not any(case.startswith(c) for c in args.case):
+                continue
+            results = run_case(case, calls, args.iterations)
+            merged = merge(case, results)
+            summary[case] = merged.summary()
+            rows.append((case, summary[case]))
+            if args.per_page:
+                rows.extend((f'  {r.label}', r.summary()) for r in results)
+        close_session()
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f'REGRESSION {r}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
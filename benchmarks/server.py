@@ -0,0 +1,59 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import Page, SampleImage
+
+
+class StubServer:
+    """
+    Local HTTP server serving the corpus from memory, so network benchmarks only measure the crawler.
+    Pages are served under /pages/<name> and images under /images/<name>.
+    """
+
+    def __init__(self, pages: list[Page], images: list[SampleImage]):
+        routes = {f'/pages/{p.name}': (p.body, p.content_type) for p in pages}
+        routes.update({f'/images/{i.name}': (i.body, i.content_type) for i in images})
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; Nagle would add delayed-ACK stalls to every response
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # The crawler closes the connection as soon as it has read <head>
+                    pass
+
+            def do_GET(self):
+                route = routes.get(self.path.split('?')[0])
+                if route is None:
+                    self.send_error(404)
+                    return
+                body, content_type = route
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
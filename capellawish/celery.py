@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'capellawish.settings')
@@ -7,6 +8,20 @@ app = Celery('capellawish')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+@worker_init.connect
+def start_metrics_server(**kwargs) -> None:
+    if settings.CRAWLER_METRICS_PORT:
+        from crawler.metrics import start_metrics_server
+        start_metrics_server(settings.CRAWLER_METRICS_PORT)
+
+@worker_process_shutdown.connect
+def mark_process_dead(pid: int | None = None, **kwargs) -> None:
+    from crawler.parsepool import close_pool
+    close_pool()
+    if settings.CRAWLER_METRICS_PORT:
+        from crawler.metrics import mark_process_dead
+        mark_process_dead(pid or os.getpid())
+
 @app.task
 def example_divide(x: int, y: int) -> float:
     import time
@@ -0,0 +1,24 @@
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis | None:
+    """
+    Returns the Redis client shared by the application, or None if REDIS_URL is not configured.
+    Features built on Redis should keep working (with less sharing) when this returns None.
+    """
+    global _client
+    if not settings.REDIS_URL:
+        return None
+    if _client is None:
+        # The connection pool of redis-py reconnects by itself after a fork.
+        _client = redis.Redis.from_url(settings.REDIS_URL,
+                                       socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                                       socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT)
+    return _client
@@ -135,7 +135,8 @@ INSTALLED_APPS = [
     # Apps
     'account',
     'wishlist',
-    'list'
+    'list',
+    'crawler',
 ]
 
 SITE_ID = 1
@@ -533,6 +534,161 @@ CELERY_RESULT_BACKEND = SECRETS.get('CELERY_RESULT_BACKEND', os.getenv('CELERY_R
 
 USE_METADATA_CRAWLER = False
 
+# 'fused' crawls an item (page, image and save) in a single task.
+# 'staged' downloads images in a separate task, passing only the id of a StagedCrawl through the broker.
+CRAWLER_PIPELINE_MODE = os.getenv('CRAWLER_PIPELINE_MODE', 'fused')
+
+# Items with several sources crawl all of them at once and merge their metadata (crawler.enrichment)
+CRAWLER_ENRICH_ALL_SOURCES = os.getenv('CRAWLER_ENRICH_ALL_SOURCES', 'True') == 'True'
+
+# Redis Settings (Shared state of crawler workers. Leave empty to disable Redis-backed features)
+
+REDIS_URL = SECRETS.get('REDIS_URL', os.getenv('REDIS_URL', ''))
+
+REDIS_SOCKET_TIMEOUT = 2
+
+# Seconds the collection endpoints keep a user's responses in Redis (0 disables the cache).
+# Every write to the user's items or lists drops them earlier. (See wishlist.cache)
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60 * 60))
+
+# Maximum number of responses (distinct query parameters) cached per user
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 50))
+
+# Crawler HTTP Client Settings
+
+CRAWLER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:146.0) Gecko/20100101 Firefox/146.0'
+
+# Number of hosts whose keep-alive connection pools are kept per worker process
+CRAWLER_POOL_CONNECTIONS = int(os.getenv('CRAWLER_POOL_CONNECTIONS', 64))
+
+# Number of keep-alive connections kept per host
+CRAWLER_POOL_MAXSIZE = int(os.getenv('CRAWLER_POOL_MAXSIZE', 8))
+
+# Maximum number of fetches in flight per worker process on the concurrent fetch path
+CRAWLER_MAX_CONCURRENCY = int(os.getenv('CRAWLER_MAX_CONCURRENCY', 32))
+
+# Seconds to cache DNS answers of the crawler's connections in worker processes (0 disables the cache)
+CRAWLER_DNS_CACHE_TTL = int(os.getenv('CRAWLER_DNS_CACHE_TTL', 300))
+
+# Maximum number of DNS answers cached per worker process; the least recently used are evicted
+CRAWLER_DNS_CACHE_SIZE = int(os.getenv('CRAWLER_DNS_CACHE_SIZE', 1024))
+
+# (connect, read) timeout in seconds
+CRAWLER_TIMEOUT = (3.05, 10)
+
+# Maximum number of bytes read from a page while looking for metadata in <head>
+CRAWLER_HEAD_MAX_BYTES = int(os.getenv('CRAWLER_HEAD_MAX_BYTES', 512 * 1024))
+
+# Pages declaring a larger Content-Length are not read at all
+CRAWLER_PAGE_MAX_BYTES = int(os.getenv('CRAWLER_PAGE_MAX_BYTES', 10 * 1024 * 1024))
+
+# Pages the streaming extractor cannot handle are parsed with BeautifulSoup in separate processes,
+# at most CRAWLER_PARSE_WORKERS at once per worker process (0 parses them in the worker process itself).
+# Pages are truncated to CRAWLER_PARSE_MAX_BYTES, a parse is killed after CRAWLER_PARSE_TIMEOUT seconds,
+# and a parse process is capped to CRAWLER_PARSE_MAX_MEMORY of address space. It is replaced after
+# CRAWLER_PARSE_MAX_TASKS pages, or once its peak resident memory exceeds CRAWLER_PARSE_MAX_RSS.
+CRAWLER_PARSE_WORKERS = int(os.getenv('CRAWLER_PARSE_WORKERS', 2))
+CRAWLER_PARSE_MAX_BYTES = int(os.getenv('CRAWLER_PARSE_MAX_BYTES', 2 * 1024 * 1024))
+CRAWLER_PARSE_TIMEOUT = float(os.getenv('CRAWLER_PARSE_TIMEOUT', 10))
+CRAWLER_PARSE_MAX_MEMORY = int(os.getenv('CRAWLER_PARSE_MAX_MEMORY', 1024 * 1024 * 1024))
+CRAWLER_PARSE_MAX_RSS = int(os.getenv('CRAWLER_PARSE_MAX_RSS', 256 * 1024 * 1024))
+CRAWLER_PARSE_MAX_TASKS = int(os.getenv('CRAWLER_PARSE_MAX_TASKS', 200))
+
+# Maximum number of bytes of a page kept as a snapshot for re-extraction (0 disables snapshots)
+CRAWLER_SNAPSHOT_MAX_BYTES = int(os.getenv('CRAWLER_SNAPSHOT_MAX_BYTES', 512 * 1024))
+
+# Seconds a crawl result is served from the cache before it is revalidated
+CRAWLER_CACHE_TTL = int(os.getenv('CRAWLER_CACHE_TTL', 6 * 60 * 60))
+
+# Seconds a crawl of a URL blocks other crawls of the same URL, which wait for its result instead.
+# The waiters of a crawl which expired without a result are re-scheduled by Celery beat at the same interval.
+CRAWLER_FLIGHT_TTL = int(os.getenv('CRAWLER_FLIGHT_TTL', 5 * 60))
+
+# Maximum size of an image downloaded by the crawler
+CRAWLER_IMAGE_MAX_BYTES = int(os.getenv('CRAWLER_IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+
+# Pages declaring several images have the first CRAWLER_IMAGE_CANDIDATES probed with partial downloads
+# of up to CRAWLER_IMAGE_PROBE_BYTES, and the largest image of at most CRAWLER_IMAGE_BUDGET_BYTES is downloaded.
+CRAWLER_IMAGE_CANDIDATES = int(os.getenv('CRAWLER_IMAGE_CANDIDATES', 5))
+CRAWLER_IMAGE_PROBE_BYTES = int(os.getenv('CRAWLER_IMAGE_PROBE_BYTES', 64 * 1024))
+CRAWLER_IMAGE_BUDGET_BYTES = int(os.getenv('CRAWLER_IMAGE_BUDGET_BYTES', 2 * 1024 * 1024))
+
+# Bulk Import Settings
+
+# Maximum number of URLs in a single import request
+WISHLIST_IMPORT_MAX_URLS = 5000
+
+# Number of URLs crawled by one import task (Each task fetches them concurrently)
+WISHLIST_IMPORT_CHUNK_SIZE = 25
+
+# Crawler Politeness Settings
+
+# Requests per second and burst size allowed per host (Crawl-delay of robots.txt lowers the rate)
+CRAWLER_DOMAIN_RATE = float(os.getenv('CRAWLER_DOMAIN_RATE', 1.0))
+CRAWLER_DOMAIN_BURST = int(os.getenv('CRAWLER_DOMAIN_BURST', 5))
+
+CRAWLER_RESPECT_ROBOTS = True
+
+# Seconds to cache robots.txt of a host
+CRAWLER_ROBOTS_TTL = 24 * 60 * 60
+
+# Seconds to disallow a host whose robots.txt could not be retrieved (server or network error), per RFC 9309
+CRAWLER_ROBOTS_ERROR_TTL = 10 * 60
+
+# Maximum number of parsed robots.txt kept per worker process; the least recently used are evicted
+CRAWLER_ROBOTS_CACHE_SIZE = 1024
+
+# How many times a crawl task is deferred for a saturated host before it gives up
+CRAWLER_MAX_DEFERRALS = 50
+
+# Crawler Refresh Settings (Scheduled re-crawls of item metadata)
+
+# Seconds between runs of the refresh scheduler
+CRAWLER_REFRESH_INTERVAL = int(os.getenv('CRAWLER_REFRESH_INTERVAL', 10 * 60))
+
+# Maximum number of pages revalidated per hour, spread over the runs
+CRAWLER_REFRESH_BUDGET = int(os.getenv('CRAWLER_REFRESH_BUDGET', 600))
+
+# Products crawled more recently than this are not refreshed
+CRAWLER_REFRESH_MIN_AGE = int(os.getenv('CRAWLER_REFRESH_MIN_AGE', 24 * 60 * 60))
+
+# Number of products refreshed by a single task
+CRAWLER_REFRESH_CHUNK_SIZE = 25
+
+# How much a product viewed by an owner in the last day is preferred (1 doubles its priority)
+CRAWLER_REFRESH_VIEW_WEIGHT = 1.0
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh-stale-items': {
+        'task': 'crawler.tasks.schedule_refresh',
+        'schedule': CRAWLER_REFRESH_INTERVAL,
+    },
+    'recover-orphaned-flights': {
+        'task': 'crawler.tasks.recover_orphaned_flights',
+        'schedule': CRAWLER_FLIGHT_TTL,
+    },
+}
+
+# Crawler Failure Settings
+
+# Seconds a failed URL is not requested again. Doubles with each consecutive failure, up to the maximum.
+# The same cool-down applies to a host whose circuit breaker has opened.
+CRAWLER_FAILURE_COOLDOWN = int(os.getenv('CRAWLER_FAILURE_COOLDOWN', 30))
+CRAWLER_FAILURE_MAX_COOLDOWN = int(os.getenv('CRAWLER_FAILURE_MAX_COOLDOWN', 60 * 60))
+
+# The circuit breaker of a host opens when at least CRAWLER_BREAKER_FAILURE_RATE of the requests
+# in a window of CRAWLER_BREAKER_WINDOW seconds failed, counting at least CRAWLER_BREAKER_MIN_REQUESTS requests.
+CRAWLER_BREAKER_WINDOW = 60
+CRAWLER_BREAKER_MIN_REQUESTS = 5
+CRAWLER_BREAKER_FAILURE_RATE = 0.5
+
+# Port of the Prometheus metrics server started by Celery workers (0 disables it).
+# Set PROMETHEUS_MULTIPROC_DIR to an empty directory as well, so the metrics of every worker process are served.
+CRAWLER_METRICS_PORT = int(os.getenv('CRAWLER_METRICS_PORT', 0))
+
+# Hosts with their own label in the crawler metrics of a process; the others are counted as 'other'
+CRAWLER_METRICS_MAX_DOMAINS = int(os.getenv('CRAWLER_METRICS_MAX_DOMAINS', 200))
+
 # Post Office Settings
 
 POST_OFFICE = {
@@ -0,0 +1,243 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import redis
+import requests
+from django.conf import settings
+
+from capellawish.redis import get_redis
+from crawler.cache import get_url_key
+from crawler.politeness import get_host
+
+logger = logging.getLogger(__name__)
+
+FAILED_URL_KEY_PREFIX = 'crawl:failed:'
+BREAKER_KEY_PREFIX = 'crawl:breaker:'
+PROBE_KEY_PREFIX = 'crawl:probe:'
+
+# Outcomes of a request
+SUCCESS = 'ok'
+URL_FAILURE = 'url'    # The URL is broken (404, 410, ...), but its host is healthy
+HOST_FAILURE = 'host'  # The host is unreachable or failing (timeouts, connection errors, 5xx, 429)
+
+# Returns milliseconds until a request to the URL may be sent, 0 if it may be sent now.
+# A failed URL is blocked until its cool-down ends. An open breaker blocks its whole host; once its
+# cool-down ends, the breaker is half-open and lets a single probe request through at a time.
+CHECK_SCRIPT = '''
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local url_until = tonumber(redis.call('HGET', KEYS[1], 'until') or '0')
+if url_until > now then
+    return url_until - now
+end
+local opened_until = tonumber(redis.call('HGET', KEYS[2], 'opened_until') or '0')
+if opened_until == 0 then
+    return 0
+end
+if opened_until > now then
+    return opened_until - now
+end
+if redis.call('SET', KEYS[3], '1', 'NX', 'PX', ARGV[1]) then
+    return 0
+end
+return tonumber(ARGV[1])
+'''
+
+# Records the outcome of a request. Failures put the URL into the negative cache with an
+# exponentially growing cool-down, and host failures count towards the failure rate of the host
+# in the current window. The breaker opens when the rate exceeds the threshold, or when a probe
+# of a half-open breaker fails, again with an exponentially growing cool-down.
+RECORD_SCRIPT = '''
+local outcome = ARGV[1]
+local window = tonumber(ARGV[2]) * 1000
+local min_requests = tonumber(ARGV[3])
+local threshold = tonumber(ARGV[4])
+local base = tonumber(ARGV[5]) * 1000
+local max_cooldown = tonumber(ARGV[6]) * 1000
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[2], 'ok', 'fail', 'since', 'opened_until', 'trips')
+local ok = tonumber(state[1]) or 0
+local fail = tonumber(state[2]) or 0
+local since = tonumber(state[3]) or now
+local opened_until = tonumber(state[4]) or 0
+local trips = tonumber(state[5]) or 0
+if now - since > window then
+    ok, fail, since = 0, 0, now
+end
+local probing = opened_until ~= 0 and opened_until <= now
+
+if outcome == 'ok' then
+    redis.call('DEL', KEYS[1])
+else
+    local count = redis.call('HINCRBY', KEYS[1], 'count', 1)
+    local cooldown = math.min(base * 2 ^ (count - 1), max_cooldown)
+    redis.call('HSET', KEYS[1], 'until', now + cooldown)
+    redis.call('PEXPIRE', KEYS[1], cooldown + max_cooldown)
+end
+if outcome == 'host' then
+    fail = fail + 1
+    if probing or (ok + fail >= min_requests and fail / (ok + fail) >= threshold) then
+        trips = trips + 1
+        opened_until = now + math.min(base * 2 ^ (trips - 1), max_cooldown)
+        ok, fail, since = 0, 0, now
+    end
+else
+    -- The host answered, even if the URL is broken
+    ok = ok + 1
+    if probing then
+        opened_until, trips, ok, fail, since = 0, 0, 0, 0, now
+    end
+end
+redis.call('DEL', KEYS[3])
+redis.call('HSET', KEYS[2], 'ok', ok, 'fail', fail, 'since', since, 'opened_until', opened_until, 'trips', trips)
+redis.call('PEXPIRE', KEYS[2], window + 2 * max_cooldown)
+return opened_until
+'''
+
+_check_script = None
+_record_script = None
+
+
+class TargetUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a URL in cool-down, or to a host with an open breaker."""
+    pass
+
+
+@dataclass
+class _HostState:
+    ok: int = 0
+    fail: int = 0
+    since: float = 0.0
+    opened_until: float = 0.0
+    trips: int = 0
+    probing_until: float = 0.0
+
+
+# Fallbacks of the current process when Redis is not configured
+_local_lock = threading.Lock()
+_local_urls: dict[str, tuple[int, float]] = {}
+_local_hosts: dict[str, _HostState] = {}
+
+
+def _get_keys(url: str) -> list[str]:
+    host = get_host(url)
+    return [FAILED_URL_KEY_PREFIX + get_url_key(url), BREAKER_KEY_PREFIX + host, PROBE_KEY_PREFIX + host]
+
+
+def _get_probe_ttl() -> float:
+    """A probe request blocks other requests to the host for at most the request timeout."""
+    timeout = settings.CRAWLER_TIMEOUT
+    return sum(timeout) if isinstance(timeout, tuple) else timeout
+
+
+def _get_cooldown(count: int) -> float:
+    return min(settings.CRAWLER_FAILURE_COOLDOWN * 2 ** (count - 1), settings.CRAWLER_FAILURE_MAX_COOLDOWN)
+
+
+def _check_local(url: str) -> float:
+    now = time.monotonic()
+    with _local_lock:
+        _, url_until = _local_urls.get(get_url_key(url), (0, 0.0))
+        if url_until > now:
+            return url_until - now
+        host = _local_hosts.get(get_host(url))
+        if host is None or not host.opened_until:
+            return 0.0
+        if host.opened_until > now:
+            return host.opened_until - now
+        if host.probing_until > now:
+            return host.probing_until - now
+        host.probing_until = now + _get_probe_ttl()
+        return 0.0
+
+
+def _record_local(url: str, outcome: str) -> None:
+    now = time.monotonic()
+    url_key = get_url_key(url)
+    with _local_lock:
+        host = _local_hosts.setdefault(get_host(url), _HostState(since=now))
+        if now - host.since > settings.CRAWLER_BREAKER_WINDOW:
+            host.ok, host.fail, host.since = 0, 0, now
+        probing = host.opened_until and host.opened_until <= now
+
+        if outcome == SUCCESS:
+            _local_urls.pop(url_key, None)
+        else:
+            count = _local_urls.get(url_key, (0, 0.0))[0] + 1
+            _local_urls[url_key] = (count, now + _get_cooldown(count))
+
+        if outcome == HOST_FAILURE:
+            host.fail += 1
+            total = host.ok + host.fail
+            if probing or (total >= settings.CRAWLER_BREAKER_MIN_REQUESTS
+                           and host.fail / total >= settings.CRAWLER_BREAKER_FAILURE_RATE):
+                host.trips += 1
+                host.opened_until = now + _get_cooldown(host.trips)
+                host.ok, host.fail, host.since = 0, 0, now
+        else:
+            # The host answered, even if the URL is broken
+            host.ok += 1
+            if probing:
+                host.ok, host.fail, host.since, host.opened_until, host.trips = 0, 0, now, 0.0, 0
+        host.probing_until = 0.0
+
+
+def check_target(url: str) -> float:
+    """
+    Returns the seconds until a request to the URL may be sent, or 0 if it may be sent now.
+    While the breaker of the host is half-open, a return value of 0 grants the single probe request,
+    so the caller must send the request and record its outcome.
+    """
+    global _check_script
+    client = get_redis()
+    if client is None:
+        return _check_local(url)
+    try:
+        if _check_script is None:
+            _check_script = client.register_script(CHECK_SCRIPT)
+        return _check_script(keys=_get_keys(url), args=[int(_get_probe_ttl() * 1000)]) / 1000
+    except redis.RedisError as e:
+        logger.warning('Could not check the circuit breaker in Redis. Using the local state: %s', e)
+        return _check_local(url)
+
+
+def ensure_available(url: str) -> None:
+    """Raises TargetUnavailable if no request may be sent to the URL now."""
+    wait = check_target(url)
+    if wait > 0:
+        raise TargetUnavailable(f'{url} is cooling down after failures. Retry in {wait:.0f} seconds.')
+
+
+def record_outcome(url: str, outcome: str) -> None:
+    global _record_script
+    client = get_redis()
+    if client is None:
+        _record_local(url, outcome)
+        return
+    try:
+        if _record_script is None:
+            _record_script = client.register_script(RECORD_SCRIPT)
+        opened_until = _record_script(keys=_get_keys(url),
+                                      args=[outcome,
+                                            settings.CRAWLER_BREAKER_WINDOW,
+                                            settings.CRAWLER_BREAKER_MIN_REQUESTS,
+                                            settings.CRAWLER_BREAKER_FAILURE_RATE,
+                                            settings.CRAWLER_FAILURE_COOLDOWN,
+                                            settings.CRAWLER_FAILURE_MAX_COOLDOWN])
+        if outcome == HOST_FAILURE and opened_until:
+            logger.info('Circuit breaker of %s is open', get_host(url))
+    except redis.RedisError as e:
+        logger.warning('Could not record the request outcome in Redis. Using the local state: %s', e)
+        _record_local(url, outcome)
+
+
+def classify_exception(e: requests.exceptions.RequestException) -> str:
+    """Tells whether a failed request blames the URL or its whole host."""
+    response = getattr(e, 'response', None)
+    if response is not None and response.status_code < 500 and response.status_code != 429:
+        return URL_FAILURE
+    return HOST_FAILURE
@@ -0,0 +1,132 @@
+import json
+import logging
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from capellawish.redis import get_redis
+from crawler.canonical import get_fingerprint
+from crawler.models import CrawlResult
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'crawl:result:'
+
+
+def get_url_key(url: str) -> str:
+    """Cache key of a URL. All spellings of the same page share the key (see crawler.canonical)."""
+    return get_fingerprint(url)
+
+
+def _serialize(entry: CrawlResult) -> str:
+    return json.dumps({
+        'url': entry.url,
+        'data': entry.data,
+        'etag': entry.etag,
+        'last_modified': entry.last_modified,
+        'fetched_at': entry.fetched_at.isoformat(),
+        'expires_at': entry.expires_at.isoformat(),
+    })
+
+
+def _deserialize(url_key: str, raw: bytes) -> CrawlResult:
+    value = json.loads(raw)
+    return CrawlResult(url_key=url_key,
+                       url=value['url'],
+                       data=value['data'],
+                       etag=value['etag'],
+                       last_modified=value['last_modified'],
+                       fetched_at=parse_datetime(value['fetched_at']),
+                       expires_at=parse_datetime(value['expires_at']))
+
+
+def _put_redis(entry: CrawlResult) -> None:
+    client = get_redis()
+    ttl = int((entry.expires_at - timezone.now()).total_seconds())
+    if client is None or ttl <= 0:
+        return
+    try:
+        client.set(REDIS_KEY_PREFIX + entry.url_key, _serialize(entry), ex=ttl)
+    except redis.RedisError as e:
+        logger.warning('Could not write crawl result to Redis: %s', e)
+
+
+def get_cached_result(url: str) -> CrawlResult | None:
+    """
+    Returns the cached crawl result of the URL, fresh or stale, or None if the URL was never crawled.
+    Redis only holds fresh entries, so a hit there never touches the database.
+    """
+    url_key = get_url_key(url)
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.get(REDIS_KEY_PREFIX + url_key)
+            if raw:
+                return _deserialize(url_key, raw)
+        except redis.RedisError as e:
+            logger.warning('Could not read crawl result from Redis: %s', e)
+
+    entry = CrawlResult.objects.filter(url_key=url_key).first()
+    if entry and entry.is_fresh():
+        _put_redis(entry)
+    return entry
+
+
+def get_conditional_headers(entry: CrawlResult | None) -> dict:
+    """Returns the headers of a conditional GET revalidating the cached entry."""
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+def store_result(url: str, data: dict, response_headers: dict | None = None) -> CrawlResult:
+    """Stores freshly extracted metadata with the validators of the response."""
+    response_headers = response_headers or {}
+    now = timezone.now()
+    entry, _ = CrawlResult.objects.update_or_create(
+        url_key=get_url_key(url),
+        defaults={
+            'url': url,
+            'data': data,
+            'etag': response_headers.get('ETag', ''),
+            'last_modified': response_headers.get('Last-Modified', ''),
+            'fetched_at': now,
+            'expires_at': now + timedelta(seconds=settings.CRAWLER_CACHE_TTL),
+        })
+    _put_redis(entry)
+    return entry
+
+
+def refresh_result(entry: CrawlResult, response_headers: dict | None = None) -> CrawlResult:
+    """Extends the lifetime of a cached entry after the origin answered 304 Not Modified."""
+    response_headers = response_headers or {}
+    now = timezone.now()
+    entry.etag = response_headers.get('ETag', entry.etag)
+    entry.last_modified = response_headers.get('Last-Modified', entry.last_modified)
+    entry.fetched_at = now
+    entry.expires_at = now + timedelta(seconds=settings.CRAWLER_CACHE_TTL)
+    CrawlResult.objects.filter(url_key=entry.url_key).update(etag=entry.etag,
+                                                             last_modified=entry.last_modified,
+                                                             fetched_at=entry.fetched_at,
+                                                             expires_at=entry.expires_at)
+    _put_redis(entry)
+    return entry
+
+
+def forget_results(url_keys: list[str]) -> None:
+    """Drops entries from Redis after their data was rewritten in the database, so the next read sees the new data."""
+    client = get_redis()
+    if client is None or not url_keys:
+        return
+    try:
+        client.delete(*(REDIS_KEY_PREFIX + k for k in url_keys))
+    except redis.RedisError as e:
+        logger.warning('Could not drop crawl results from Redis: %s', e)
@@ -0,0 +1,88 @@
+import hashlib
+import posixpath
+import re
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urljoin, urlsplit, urlunsplit
+
+# Query parameters which only track where a visitor came from, and never select a product
+TRACKING_PARAMS = {
+    'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'ttclid',
+    'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'spm', 'scm',
+    'ref_src', 'ref_url', 'srsltid', 'si', 'trk', 'trkid', 'campaign_id', 'ad_id', 'adgroup_id',
+    'n_media', 'n_query', 'n_rank', 'n_ad_group', 'n_ad', 'n_keyword_id', 'n_keyword', 'n_campaign_type',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_', 'itm_')
+
+# Host prefixes serving the same pages as the bare host (desktop, mobile)
+EQUIVALENT_HOST_PREFIXES = ('www.', 'm.', 'mobile.')
+
+_MULTIPLE_SLASHES = re.compile(r'/{2,}')
+
+
+def is_tracking_param(key: str) -> bool:
+    lowered = key.lower()
+    return lowered in TRACKING_PARAMS or lowered.startswith(TRACKING_PREFIXES)
+
+
+def strip_tracking_params(url: str) -> str:
+    """Removes tracking parameters and the fragment from a URL, keeping everything else as it is."""
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Reduces the spellings of a product URL to one form: https, lowercase host without www/mobile
+    prefixes or default port, normalized path without a trailing slash, sorted query without tracking
+    parameters, and no fragment. The result identifies a page; it is not meant to be requested.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower().rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    for prefix in EQUIVALENT_HOST_PREFIXES:
+        if host.startswith(prefix) and host.count('.') > 1:
+            host = host.removeprefix(prefix)
+            break
+    try:
+        port = parts.port
+    except ValueError:
+        # Out of range (URLValidator accepts any five digits); such a URL can never be requested
+        port = None
+    if port and port not in (80, 443):
+        host = f'{host}:{port}'
+
+    path = quote(unquote(parts.path), safe="/:@!$&'()*+,;=-._~")
+    path = _MULTIPLE_SLASHES.sub('/', path)
+    path = posixpath.normpath(path) if path else '/'
+    path = '/' if path in ('.', '//') else path.rstrip('/') or '/'
+
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k))
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def get_fingerprint(url: str) -> str:
+    """Fixed-width fingerprint of the canonical form of a URL (SHA-256, 64 hexadecimal digits)."""
+    return hashlib.sha256(canonicalize_url(url).encode()).hexdigest()
+
+
+def get_canonical_url(page_url: str, data: dict) -> str | None:
+    """
+    Returns the canonical URL a crawled page declares (<link rel=canonical>, then og:url),
+    resolved against the page URL. Declarations pointing to another site or to the home page,
+    which some shops set on every page, are ignored.
+    """
+    for candidate in (data.get('canonical_url'), data.get('url')):
+        candidate = candidate[0] if isinstance(candidate, list) else candidate
+        if not candidate or not isinstance(candidate, str):
+            continue
+        resolved = urljoin(page_url, candidate.strip())
+        parts = urlsplit(resolved)
+        if parts.scheme not in ('http', 'https') or parts.path in ('', '/'):
+            continue
+        if urlsplit(canonicalize_url(resolved)).hostname != urlsplit(canonicalize_url(page_url)).hostname:
+            continue
+        return resolved
+    return None
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from django import db
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+
+from crawler.metrics import CONNECT, DNS, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Process-wide state. Celery prefork workers fork after import, so everything here is
+# created lazily and rebuilt when the PID changes to avoid sharing sockets across processes.
+_lock = threading.Lock()
+_owner_pid: int | None = None
+_session: requests.Session | None = None
+_executor: ThreadPoolExecutor | None = None
+
+# DNS answers of the crawler's connections only; other clients of the process (database, broker)
+# resolve as usual. Ordered from the least to the most recently used.
+_dns_cache: OrderedDict[tuple, tuple[float, list]] = OrderedDict()
+_dns_lock = threading.Lock()
+
+
+def _resolve(host: str, port: int) -> list:
+    """
+    socket.getaddrinfo with a TTL cache of at most CRAWLER_DNS_CACHE_SIZE answers,
+    so fresh connections to known hosts skip DNS.
+    """
+    key = (host, port, allowed_gai_family())
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+        if entry and entry[0] > now:
+            _dns_cache.move_to_end(key)
+            return entry[1]
+    start = time.perf_counter()
+    result = socket.getaddrinfo(host, port, key[2], socket.SOCK_STREAM)
+    observe_stage(DNS, time.perf_counter() - start, host=host)
+    with _dns_lock:
+        for expired in [k for k, (expires_at, _) in _dns_cache.items() if expires_at <= now]:
+            del _dns_cache[expired]
+        _dns_cache[key] = (now + settings.CRAWLER_DNS_CACHE_TTL, result)
+        _dns_cache.move_to_end(key)
+        while len(_dns_cache) > settings.CRAWLER_DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+    return result
+
+
+def clear_dns_cache() -> None:
+    with _dns_lock:
+        _dns_cache.clear()
+
+
+def _create_connection(host: str, port: int, timeout, source_address, socket_options) -> socket.socket:
+    """urllib3.util.connection.create_connection, resolving the host through the DNS cache."""
+    error = None
+    for family, socktype, proto, _, address in _resolve(host.strip('[]'), port):
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            for option in socket_options or ():
+                sock.setsockopt(*option)
+            if timeout is not _DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(address)
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    if error is not None:
+        raise error
+    raise OSError('getaddrinfo returns an empty list')
+
+
+class _CrawlerConnectionMixin:
+    """Opens the connections through the DNS cache, and reports the time of the TCP connection and TLS handshake."""
+
+    def _new_conn(self) -> socket.socket:
+        if not settings.CRAWLER_DNS_CACHE_TTL:
+            return super()._new_conn()
+        try:
+            return _create_connection(self._dns_host, self.port, self.timeout,
+                                      self.source_address, self.socket_options)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except TimeoutError as e:
+            raise ConnectTimeoutError(self, f'Connection to {self.host} timed out. '
+                                            f'(connect timeout={self.timeout})') from e
+        except OSError as e:
+            raise NewConnectionError(self, f'Failed to establish a new connection: {e}') from e
+
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        observe_stage(CONNECT, time.perf_counter() - start, host=self.host)
+
+
+class _TimedHTTPConnection(_CrawlerConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_CrawlerConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose new connections resolve their host through the DNS cache of the crawler,
+    and report the time of their TCP connection and TLS handshake.
+    """
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    # urllib3 keeps one connection pool per (scheme, host, port), so this bounds
+    # both how many hosts stay warm and how many keep-alive sockets each host gets.
+    adapter = TimedHTTPAdapter(pool_connections=settings.CRAWLER_POOL_CONNECTIONS,
+                               pool_maxsize=settings.CRAWLER_POOL_MAXSIZE,
+                               pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _ensure_process_state() -> None:
+    global _owner_pid, _session, _executor
+    pid = os.getpid()
+    if _owner_pid == pid:
+        return
+    with _lock:
+        if _owner_pid == pid:
+            return
+        _session = _build_session()
+        _executor = ThreadPoolExecutor(max_workers=settings.CRAWLER_MAX_CONCURRENCY,
+                                       thread_name_prefix='crawler-fetch')
+        _owner_pid = pid
+
+
+def get_session() -> requests.Session:
+    """Returns the keep-alive session shared by every crawl in this worker process."""
+    _ensure_process_state()
+    return _session
+
+
+def close_session() -> None:
+    """Drops pooled connections and worker threads of the current process."""
+    global _owner_pid, _session, _executor
+    with _lock:
+        if _session is not None:
+            _session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _owner_pid = _session = _executor = None
+
+
+def fetch(url: str,
+          headers: dict | None = None,
+          timeout: float | tuple | None = None,
+          stream: bool = False) -> requests.Response:
+    """
+    Sends a GET request through the shared session.
+    Raises requests exceptions as is; callers decide how to handle them.
+    """
+    return get_session().get(url,
+                             headers=headers,
+                             timeout=timeout or settings.CRAWLER_TIMEOUT,
+                             stream=stream)
+
+
+def _call_and_close_connections(func: Callable, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Pool threads outlive the call, so do not let them hold database connections.
+        db.connections.close_all()
+
+
+async def run_async(func: Callable, *args, **kwargs):
+    """Runs a blocking crawl function on the crawler thread pool, keeping the event loop free."""
+    _ensure_process_state()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(_call_and_close_connections, func, *args, **kwargs))
+
+
+async def run_many_async(func: Callable, items: Iterable, limit: int | None = None) -> list:
+    """
+    Calls func(item) for every item concurrently, at most `limit` at a time.
+    Results keep the order of `items`; raised exceptions are returned in place of results.
+    """
+    semaphore = asyncio.Semaphore(limit or settings.CRAWLER_MAX_CONCURRENCY)
+
+    async def bounded(item):
+        async with semaphore:
+            return await run_async(func, item)
+
+    return await asyncio.gather(*(bounded(i) for i in items), return_exceptions=True)
+
+
+def run_many(func: Callable, items: Iterable, limit: int | None = None) -> list:
+    """Synchronous entry point of run_many_async() for Celery tasks."""
+    return asyncio.run(run_many_async(func, items, limit=limit))
+
+
+async def fetch_async(url: str,
+                      headers: dict | None = None,
+                      timeout: float | tuple | None = None,
+                      stream: bool = False) -> requests.Response:
+    return await run_async(fetch, url, headers=headers, timeout=timeout, stream=stream)
+
+
+def fetch_many(urls: Iterable[str],
+               headers: dict | None = None,
+               timeout: float | tuple | None = None,
+               limit: int | None = None,
+               stream: bool = False) -> list[requests.Response | Exception]:
+    """Fetches the given URLs concurrently. Failed fetches are returned as exceptions."""
+    return run_many(partial(fetch, headers=headers, timeout=timeout, stream=stream), urls, limit=limit)
@@ -2,6 +2,8 @@ import logging
 
 import requests
 
+from crawler.client import fetch
+
 logger = logging.getLogger(__name__)
 
 image_types_and_ext = {
@@ -12,15 +14,37 @@ image_types_and_ext = {
     'image/avif': 'avif',
 }
 
+def sniff_image_type(head: bytes) -> str | None:
+    """
+    Returns the type in image_types_and_ext matching the magic bytes at the start of a file, or None.
+    `head` should hold at least the first 32 bytes of the file.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        # ISO BMFF: the major brand, then compatible brands until the end of the ftyp box
+        box_end = min(int.from_bytes(head[:4], 'big'), len(head))
+        brands = [head[8:12]] + [head[i:i + 4] for i in range(16, box_end, 4)]
+        if b'avif' in brands or b'avis' in brands:
+            return 'image/avif'
+    return None
+
 def retrieve_image(url: str, headers: dict | None = None, timeout: int = 10) -> bytes | None:
     """Retrieve image data from a given URL. (synchronous)"""
     headers = headers or {}
     try:
-        response = requests.get(url, headers=headers, timeout=timeout)
+        response = fetch(url, headers=headers, timeout=timeout)
         response.raise_for_status()
     except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
         logger.info('Could not retrieve image from %s: %s', url, e)
         return None
     except requests.exceptions.RequestException as e:
-
-
+        logger.exception('Request exception occurred while retrieving image from %s: %s', url, e)
+        return None
+    return response.content
@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation
+
+# Prices at or above this do not fit WishItem.price_min and price_max, and are never real prices
+MAX_PRICE = Decimal('1e12')
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _to_decimal(value) -> Decimal | None:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        rt = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        return None
+    return rt.quantize(Decimal('0.01')) if rt.is_finite() and 0 <= rt < MAX_PRICE else None
+
+
+def _to_int(value) -> int:
+    try:
+        return int(str(_first(value)).strip())
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_prices(data: dict) -> list[tuple[Decimal, str]]:
+    """
+    Collects the prices a page declares, as (amount, currency) pairs:
+    og:price:amount, and the offers of its JSON-LD products (price, lowPrice and highPrice).
+    """
+    rt = []
+    amount = _to_decimal(_first(data.get('price:amount')))
+    if amount is not None:
+        rt.append((amount, str(_first(data.get('price:currency')) or '').upper()))
+    for product in data.get('products', []):
+        offers = product.get('offers', []) if isinstance(product, dict) else []
+        for offer in offers if isinstance(offers, list) else [offers]:
+            if not isinstance(offer, dict):
+                continue
+            currency = str(offer.get('priceCurrency') or '').upper()
+            for key in ('price', 'lowPrice', 'highPrice'):
+                amount = _to_decimal(offer.get(key))
+                if amount is not None:
+                    rt.append((amount, currency))
+    return rt
+
+
+def get_image_area(data: dict) -> int:
+    """Area of the primary image declared by og:image:width and og:image:height, or 0 if not declared."""
+    return _to_int(data.get('image:width')) * _to_int(data.get('image:height'))
+
+
+def merge_metadata(results: list[dict]) -> dict:
+    """
+    Merges the metadata of several pages of the same item, given in order of precedence
+    (the primary source first, then the other sources in the order they were added):
+
+    - title: the first page declaring one
+    - description: the longest one, the first page winning ties
+    - image: the largest declared image, the first page winning ties and undeclared sizes
+    - price_min and price_max: the range of all prices in the currency of the first page declaring a price
+
+    :param results: Metadata of the pages (Same format as crawler.tasks.retrieve_data)
+    :return: Dictionary with the merged fields, without the fields no page provided
+    """
+    merged = {}
+    titles = [str(_first(d.get('title'))) for d in results if _first(d.get('title'))]
+    if titles:
+        merged['title'] = titles[0]
+
+    descriptions = [str(_first(d.get('description'))) for d in results if _first(d.get('description'))]
+    if descriptions:
+        merged['description'] = max(descriptions, key=len)
+
+    images = [(get_image_area(d), -i, str(_first(d.get('image')))) for i, d in enumerate(results)
+              if _first(d.get('image'))]
+    if images:
+        merged['image'] = max(images)[2]
+
+    prices = [p for d in results for p in get_prices(d)]
+    if prices:
+        currency = prices[0][1]
+        amounts = [amount for amount, c in prices if c == currency]
+        merged.update(price_min=min(amounts), price_max=max(amounts), price_currency=currency)
+    return merged
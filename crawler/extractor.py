@@ -0,0 +1,180 @@
+import json
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Tags ending the part of the document we are interested in
+HEAD_END_EVENTS = {('end', 'head'), ('start', 'body')}
+
+PRODUCT_TYPES = {'Product', 'ProductGroup', 'IndividualProduct'}
+
+
+def _add_property(target: dict, key: str, value: str) -> None:
+    """Adds a property, turning repeated properties into a list. (Same as parse_opengraph_properties)"""
+    existing = target.get(key, None)
+    if not existing:
+        target[key] = value
+    elif isinstance(existing, list):
+        existing.append(value)
+    else:
+        target[key] = [existing, value]
+
+
+def _first(value: str | list | None) -> str | None:
+    return value[0] if isinstance(value, list) else value
+
+
+def _find_products(node) -> list[dict]:
+    """Collects schema.org Product objects from a parsed JSON-LD block, including @graph entries."""
+    if isinstance(node, list):
+        return [p for n in node for p in _find_products(n)]
+    if not isinstance(node, dict):
+        return []
+    rt = []
+    types = node.get('@type', [])
+    types = types if isinstance(types, list) else [types]
+    if PRODUCT_TYPES.intersection(types):
+        rt.append(node)
+    if '@graph' in node:
+        rt.extend(_find_products(node['@graph']))
+    return rt
+
+
+@dataclass
+class HeadMetadata:
+    """Metadata collected from the <head> of a page."""
+    opengraph: dict = field(default_factory=dict)
+    twitter: dict = field(default_factory=dict)
+    title: str | None = None
+    description: str | None = None
+    canonical_url: str | None = None
+    products: list[dict] = field(default_factory=list)
+    # True when </head> was reached, False when the byte budget or the body ran out first
+    complete: bool = False
+    bytes_read: int = 0
+
+    def is_empty(self) -> bool:
+        return not (self.opengraph or self.twitter or self.title or self.products)
+
+    def to_data(self) -> dict:
+        """
+        Flattens the metadata into the dictionary format used by the crawl tasks.
+        OpenGraph properties come first; Twitter cards and plain tags only fill the gaps.
+        """
+        data = dict(self.opengraph)
+        fallbacks = {
+            'title': [self.twitter.get('title'), self.title],
+            'description': [self.twitter.get('description'), self.description],
+            'image': [self.twitter.get('image'), self.twitter.get('image:src')],
+        }
+        for key, candidates in fallbacks.items():
+            if data.get(key):
+                continue
+            value = next((_first(c) for c in candidates if c), None)
+            if value:
+                data[key] = value
+        if self.canonical_url:
+            data['canonical_url'] = self.canonical_url
+        if self.products:
+            data['products'] = self.products
+        return data
+
+
+class HeadExtractor:
+    """
+    Incremental extractor of OpenGraph, Twitter card, <title>, canonical link and JSON-LD product data.
+    Chunks are fed as they arrive from the network, and the extractor reports when it is done,
+    so the caller can close the connection without downloading the body of the page.
+    """
+
+    def __init__(self, max_bytes: int, encoding: str | None = None):
+        self.max_bytes = max_bytes
+        self.metadata = HeadMetadata()
+        self.done = False
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding,
+                                            remove_comments=True, no_network=True)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feeds a chunk of the document. Returns True once no more input is needed."""
+        if self.done:
+            return True
+        remaining = self.max_bytes - self.metadata.bytes_read
+        if len(chunk) >= remaining:
+            chunk = chunk[:remaining]
+            self.done = True
+        self.metadata.bytes_read += len(chunk)
+        self._parser.feed(chunk)
+        self._handle_events()
+        return self.done
+
+    def close(self) -> HeadMetadata:
+        if not self.metadata.complete:
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                pass
+            # Closing the parser implies </head>, which does not mean we have seen it
+            self._handle_events()
+            self.metadata.complete = False
+        self.done = True
+        return self.metadata
+
+    def _handle_events(self) -> None:
+        for event, element in self._parser.read_events():
+            if (event, element.tag) in HEAD_END_EVENTS:
+                self.metadata.complete = True
+                self.done = True
+                return
+            if event == 'end':
+                self._handle_element(element)
+
+    def _handle_element(self, element) -> None:
+        meta = self.metadata
+        match element.tag:
+            case 'meta':
+                key = (element.get('property') or element.get('name') or '').strip()
+                content = (element.get('content') or '').strip()
+                if not key or not content:
+                    return
+                lowered = key.lower()
+                if lowered.startswith('og:'):
+                    _add_property(meta.opengraph, key[3:], content)
+                elif lowered.startswith('twitter:'):
+                    _add_property(meta.twitter, key[8:], content)
+                elif lowered == 'description' and not meta.description:
+                    meta.description = content
+            case 'title':
+                if meta.title is None and element.text:
+                    meta.title = element.text.strip()
+            case 'link':
+                rel = (element.get('rel') or '').lower().split()
+                if 'canonical' in rel and element.get('href') and not meta.canonical_url:
+                    meta.canonical_url = element.get('href').strip()
+            case 'script':
+                if (element.get('type') or '').lower() == 'application/ld+json' and element.text:
+                    try:
+                        meta.products.extend(_find_products(json.loads(element.text)))
+                    except ValueError:
+                        logger.debug('Skipping malformed JSON-LD block')
+
+
+def extract_head(chunks: Iterable[bytes],
+                 max_bytes: int,
+                 encoding: str | None = None,
+                 buffer: bytearray | None = None) -> HeadMetadata:
+    """
+    Runs a HeadExtractor over the chunks, and stops consuming them as soon as the head is parsed
+    or `max_bytes` are read. If `buffer` is given, the consumed bytes are copied into it,
+    so the caller can fall back to a full parser on malformed pages.
+    """
+    extractor = HeadExtractor(max_bytes, encoding=encoding)
+    for chunk in chunks:
+        if buffer is not None:
+            buffer.extend(chunk[:max_bytes - len(buffer)])
+        if extractor.feed(chunk):
+            break
+    return extractor.close()
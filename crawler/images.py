@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import mimetypes
+import secrets
+import string
+import tempfile
+from dataclasses import dataclass
+from functools import partial
+from typing import IO
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import IntegrityError, transaction
+from PIL import ImageFile
+
+from crawler.breaker import (SUCCESS, URL_FAILURE, TargetUnavailable, classify_exception, ensure_available,
+                             record_outcome)
+from crawler.client import fetch, run_many
+from crawler.metrics import TTFB, MeteredBody, count_outcome, describe_error, observe_stage
+from crawler.crawler import image_types_and_ext, sniff_image_type
+from list.models import ListModel
+from wishlist.models import BlobImage, ImageAlias, WishItem
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Downloads larger than this spill from memory to a temporary file on disk
+IMAGE_SPOOL_SIZE = 1024 * 1024
+
+# Content types of servers which do not tell the type of the image; the magic bytes decide
+GENERIC_CONTENT_TYPES = {'application/octet-stream', 'binary/octet-stream', 'application/binary'}
+
+
+class ImageTooLarge(Exception):
+    """Raised when an image exceeds CRAWLER_IMAGE_MAX_BYTES."""
+    pass
+
+
+class NotAnImage(Exception):
+    """Raised when a URL serves something other than an image type in image_types_and_ext."""
+    pass
+
+
+@dataclass
+class DownloadedImage:
+    """An image streamed into a temporary file, with its digest computed on the way."""
+    file: IO[bytes]
+    filename: str
+    sha256_hash: str
+    size: int
+    etag: str = ''
+
+    def close(self) -> None:
+        self.file.close()
+
+
+@dataclass
+class ImageCandidate:
+    """Format and dimensions of an image read from its first bytes, and its full size if the server told it."""
+    url: str
+    format: str
+    width: int
+    height: int
+    size: int | None = None
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+
+def get_filename(url: str) -> str:
+    filename = urlparse(url).path.split('/')[-1]
+    return filename
+
+def has_file_extension(target: str) -> bool:
+    idx = target.rfind('.')
+    return False if idx == -1 else True
+
+def guess_filename(url: str, response: requests.Response, content_type: str | None = None) -> str:
+    rt = get_filename(url)
+    if not has_file_extension(rt):
+        if len(rt) > 20:
+            rand_filename = '_' + ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
+            rt += rand_filename
+        content_type = content_type or response.headers.get('content-type', '').split(';')[0].strip()
+        ext = '.' + image_types_and_ext[content_type] if content_type in image_types_and_ext else None
+        ext = ext or mimetypes.guess_extension(content_type)
+        if not ext:
+            ext = '.bin'
+        rt += ext
+    return rt
+
+def get_content_length(response: requests.Response) -> int | None:
+    """Content-Length of a response, or None if it is missing or malformed (e.g. "abc" or "12, 12")."""
+    length = response.headers.get('content-length', '').strip()
+    return int(length) if length.isdigit() else None
+
+def validate_image_headers(url: str, response: requests.Response, max_bytes: int) -> None:
+    """Rejects a response by its headers, before any of the body is read."""
+    content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type and not content_type.startswith('image/') and content_type not in GENERIC_CONTENT_TYPES:
+        raise NotAnImage(f'{url} serves {content_type}, not an image')
+    declared_size = get_content_length(response)
+    if declared_size is not None and declared_size > max_bytes:
+        raise ImageTooLarge(f'Image of {declared_size} bytes exceeds the limit of {max_bytes} bytes')
+
+def fetch_image(url: str,
+                headers: dict | None = None,
+                max_bytes: int | None = None) -> DownloadedImage:
+    """
+    Streams an image into a spooled temporary file, updating its SHA-256 digest chunk by chunk.
+    Memory use is bounded by IMAGE_SPOOL_SIZE regardless of the image size.
+    The response is rejected by its Content-Type and Content-Length headers before the body is read,
+    and by the magic bytes of its first chunk, raising NotAnImage or ImageTooLarge.
+    Raises ImageTooLarge as soon as the image exceeds `max_bytes`, and requests exceptions on HTTP errors.
+    Images in cool-down after failures, or on a host with an open circuit breaker, raise TargetUnavailable.
+    The caller owns the returned file and must close it.
+    """
+    max_bytes = max_bytes or settings.CRAWLER_IMAGE_MAX_BYTES
+    try:
+        ensure_available(url)
+    except TargetUnavailable:
+        count_outcome('fetch_image', 'unavailable', url)
+        raise
+    response = None
+    body = None
+    spool = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE)
+    try:
+        response = fetch(url, headers=headers, stream=True)
+        observe_stage(TTFB, response.elapsed.total_seconds(), url)
+        response.raise_for_status()
+        validate_image_headers(url, response, max_bytes)
+
+        hasher = hashlib.sha256()
+        size = 0
+        image_type = None
+        body = MeteredBody(response.iter_content(chunk_size=IMAGE_CHUNK_SIZE), 'image', url)
+        for chunk in body:
+            if not image_type:
+                image_type = sniff_image_type(chunk)
+                if not image_type:
+                    raise NotAnImage(f'{url} does not start with the magic bytes of a known image type')
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImageTooLarge(f'Image exceeds the limit of {max_bytes} bytes')
+            hasher.update(chunk)
+            spool.write(chunk)
+        if not image_type:
+            raise NotAnImage(f'{url} returned an empty body')
+    except requests.exceptions.RequestException as e:
+        spool.close()
+        record_outcome(url, classify_exception(e))
+        count_outcome('fetch_image', describe_error(e), url)
+        raise
+    except (NotAnImage, ImageTooLarge) as e:
+        spool.close()
+        record_outcome(url, URL_FAILURE)
+        count_outcome('fetch_image', 'not_image' if isinstance(e, NotAnImage) else 'too_large', url)
+        raise
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        if response is not None:
+            response.close()
+        if body is not None:
+            body.record()
+
+    record_outcome(url, SUCCESS)
+    count_outcome('fetch_image', 'ok', url)
+    spool.seek(0)
+    return DownloadedImage(file=spool,
+                           filename=guess_filename(url, response, image_type),
+                           sha256_hash=hasher.hexdigest(),
+                           size=size,
+                           etag=response.headers.get('etag', ''))
+
+def get_total_size(response: requests.Response) -> int | None:
+    """Full size of the resource of a partial or a whole response, or None if the server did not tell it."""
+    if response.status_code == 206:
+        total = response.headers.get('content-range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    return get_content_length(response)
+
+def probe_image(url: str, headers: dict | None = None, probe_bytes: int | None = None) -> ImageCandidate:
+    """
+    Reads the format and dimensions of an image from its first bytes with a ranged GET, feeding the chunks
+    to the lazy header parser of Pillow until it knows the image. Servers ignoring the range are read
+    up to `probe_bytes` as well, then the connection is dropped.
+    Raises NotAnImage if the header cannot be parsed within `probe_bytes`, and requests exceptions on HTTP errors.
+    """
+    probe_bytes = probe_bytes or settings.CRAWLER_IMAGE_PROBE_BYTES
+    ensure_available(url)
+    # Ranges of compressed responses would count encoded bytes
+    headers = {**(headers or {}), 'Range': f'bytes=0-{probe_bytes - 1}', 'Accept-Encoding': 'identity'}
+    response = None
+    body = None
+    parser = ImageFile.Parser()
+    try:
+        response = fetch(url, headers=headers, stream=True)
+        observe_stage(TTFB, response.elapsed.total_seconds(), url)
+        response.raise_for_status()
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type and not content_type.startswith('image/') and content_type not in GENERIC_CONTENT_TYPES:
+            raise NotAnImage(f'{url} serves {content_type}, not an image')
+
+        read = 0
+        body = MeteredBody(response.iter_content(chunk_size=IMAGE_CHUNK_SIZE), 'image', url)
+        for chunk in body:
+            try:
+                parser.feed(chunk[:probe_bytes - read])
+            except Exception as e:
+                raise NotAnImage(f'{url} could not be parsed as an image: {e}') from e
+            read += len(chunk)
+            if parser.image or read >= probe_bytes:
+                break
+    except requests.exceptions.RequestException as e:
+        record_outcome(url, classify_exception(e))
+        count_outcome('probe_image', describe_error(e), url)
+        raise
+    except NotAnImage:
+        count_outcome('probe_image', 'not_image', url)
+        raise
+    finally:
+        if response is not None:
+            response.close()
+        if body is not None:
+            body.record()
+
+    if not parser.image:
+        count_outcome('probe_image', 'not_image', url)
+        raise NotAnImage(f'The header of {url} does not fit in {probe_bytes} bytes')
+    count_outcome('probe_image', 'ok', url)
+    width, height = parser.image.size
+    return ImageCandidate(url=url, format=parser.image.format, width=width, height=height,
+                          size=get_total_size(response))
+
+def pick_image(candidates: list[ImageCandidate], budget: int | None = None) -> ImageCandidate | None:
+    """
+    Picks the largest image (in pixels) within the size budget, the first candidate winning ties.
+    Images of unknown size count as within the budget. If every image exceeds the budget,
+    the smallest one that can still be downloaded is picked.
+    """
+    budget = budget or settings.CRAWLER_IMAGE_BUDGET_BYTES
+    within = [c for c in candidates if c.size is None or c.size <= budget]
+    if within:
+        return max(within, key=lambda c: c.area)
+    allowed = [c for c in candidates if c.size <= settings.CRAWLER_IMAGE_MAX_BYTES]
+    return min(allowed, key=lambda c: c.size) if allowed else None
+
+def select_images(candidates: dict, headers: dict | None = None) -> dict:
+    """
+    Selects the image to download for each key among its candidate URLs, probing the candidates
+    of all keys concurrently. Keys with a single candidate keep it without any request, and keys
+    whose candidates could not be probed keep their first one, so the download reports the error.
+    :param candidates: Dictionary mapping keys (page URLs, item ids, ...) to image URLs in order of preference
+    :param headers: Request headers of the probes
+    :return: Dictionary mapping keys to the selected image URL, without the keys with no candidate
+    """
+    rt = {key: urls[0] for key, urls in candidates.items() if urls}
+    probe_urls = list(dict.fromkeys(u for urls in candidates.values() if len(urls) > 1 for u in urls))
+    if not probe_urls:
+        return rt
+
+    probed = {}
+    for url, result in zip(probe_urls, run_many(partial(probe_image, headers=headers), probe_urls)):
+        if isinstance(result, Exception):
+            logger.info('Could not probe image %s: %s', url, result)
+        else:
+            probed[url] = result
+    for key, urls in candidates.items():
+        if len(urls) > 1:
+            picked = pick_image([probed[u] for u in urls if u in probed])
+            if picked:
+                rt[key] = picked.url
+    return rt
+
+def find_image_by_url(url: str) -> BlobImage | None:
+    """Returns the blob previously downloaded from the URL, if any. (No network or file I/O)"""
+    alias = (ImageAlias.objects
+             .select_related('blob')
+             .filter(url_hash=ImageAlias.hash_url(url))
+             .first())
+    return alias.blob if alias else None
+
+def register_alias(blob: BlobImage, url: str, etag: str = '') -> None:
+    """Records that the URL serves the blob, so later crawls of the URL skip the download."""
+    ImageAlias.objects.update_or_create(url_hash=ImageAlias.hash_url(url),
+                                        defaults={'url': url, 'blob': blob, 'etag': etag})
+
+def link_image(model: type[WishItem] | type[ListModel], pk: int, blob_id: int) -> bool:
+    """
+    Sets the image of a WishItem or ListModel which has none yet, with a single UPDATE.
+    Returns whether the row was linked.
+    """
+    return model.objects.filter(pk=pk, image__isnull=True).update(image_id=blob_id) > 0
+
+def store_image(image: DownloadedImage, url: str) -> BlobImage:
+    """
+    Returns the BlobImage with the digest of the downloaded image, writing the image to storage
+    only if no such blob exists yet. The URL is registered as an alias of the blob either way.
+    """
+    blob = BlobImage.objects.filter(sha256_hash=image.sha256_hash).first()
+    if blob:
+        logger.debug('Image from %s is a duplicate of blob %s', url, blob.pk)
+    else:
+        blob = BlobImage(sha256_hash=image.sha256_hash)
+        blob.image.save(image.filename, DjangoFile(image.file, name=image.filename), save=False)
+        try:
+            with transaction.atomic():
+                blob.save()
+        except IntegrityError:
+            # Another worker stored the same image in the meantime
+            blob.image.delete(save=False)
+            blob = BlobImage.objects.get(sha256_hash=image.sha256_hash)
+
+    register_alias(blob, url, image.etag)
+    return blob
+
+def ingest_image(url: str, headers: dict | None = None) -> BlobImage:
+    """
+    Downloads, hashes and stores an image in a single pass over the network response.
+    URLs which were downloaded before are resolved from the alias table without any request.
+    """
+    blob = find_image_by_url(url)
+    if blob:
+        return blob
+
+    image = fetch_image(url, headers=headers)
+    try:
+        return store_image(image, url)
+    finally:
+        image.close()
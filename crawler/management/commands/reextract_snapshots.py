@@ -0,0 +1,114 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django import db
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.utils import timezone
+
+from crawler.cache import forget_results
+from crawler.canonical import get_canonical_url, get_fingerprint
+from crawler.models import CrawlResult, PageSnapshot
+from crawler.snapshots import decompress
+from crawler.tasks import extract_snapshot
+from wishlist.cache import bump_products
+from wishlist.models import Product
+
+
+def reextract(snapshots: list[tuple[str, str, str, bytes, str]]) -> list[tuple[str, str, dict | None]]:
+    """
+    Runs the extraction over a chunk of snapshots in a pool process.
+    :param snapshots: Tuples of (url_key, url, codec, content, encoding)
+    :return: Tuples of (url_key, url, extracted data), with None for snapshots nothing could be extracted from
+    """
+    rt = []
+    for url_key, url, codec, content, encoding in snapshots:
+        try:
+            data = extract_snapshot(url, decompress(codec, content), encoding or None)
+        except ValueError:
+            data = None
+        rt.append((url_key, url, data))
+    return rt
+
+
+class Command(BaseCommand):
+    help = ('Runs the metadata extraction again over the saved page snapshots, and writes the results '
+            'back to the crawl cache and the products. No page is fetched.')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Snapshots read from the database and written back at once')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of extraction processes')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Extract and count the changes without writing them')
+
+    def handle(self, *args, **options) -> None:
+        batch_size = options['batch_size']
+        workers = options['workers']
+        processed = changed = failed = 0
+
+        # Pool processes set Django up themselves, whatever the start method is
+        db.connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            last_id = 0
+            while True:
+                batch = list(PageSnapshot.objects
+                             .filter(pk__gt=last_id)
+                             .order_by('pk')
+                             .values_list('pk', 'url_key', 'url', 'codec', 'content', 'encoding')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                snapshots = [(key, url, codec, bytes(content), encoding)
+                             for _, key, url, codec, content, encoding in batch]
+                size = -(-len(snapshots) // workers)
+                results = {}
+                for chunk in pool.map(reextract, [snapshots[i:i + size] for i in range(0, len(snapshots), size)]):
+                    for url_key, url, data in chunk:
+                        if data is None:
+                            failed += 1
+                        else:
+                            results[url_key] = (url, data)
+                processed += len(batch)
+                changed += self.write_results(results, options['dry_run'])
+                self.stdout.write(f'{processed} snapshots processed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-extracted {processed} snapshots: {changed} changed, {failed} without metadata'))
+
+    def write_results(self, results: dict[str, tuple[str, dict]], dry_run: bool) -> int:
+        """
+        Writes the changed results of a batch to the crawl cache and to the products crawled from the same URLs.
+        :param results: Dictionary mapping URL keys to the URL and its extracted data
+        :param dry_run: Count the changes without writing them
+        :return: Number of changed crawl results
+        """
+        entries = [e for e in CrawlResult.objects.filter(url_key__in=results.keys()).only('url_key', 'data')
+                   if e.data != results[e.url_key][1]]
+        for entry in entries:
+            entry.data = results[entry.url_key][1]
+
+        # Products are keyed by the fingerprint of the canonical URL their page declares (See save_products),
+        # or of the crawled URL; both are looked up by the unique index on the fingerprint.
+        by_fingerprint = {}
+        for url, data in results.values():
+            for fingerprint in (get_fingerprint(get_canonical_url(url, data) or url), get_fingerprint(url)):
+                by_fingerprint.setdefault(fingerprint, data)
+        now = timezone.now()
+        products = []
+        for product in Product.objects.filter(fingerprint__in=by_fingerprint.keys()):
+            data = by_fingerprint[product.fingerprint]
+            if product.data != data:
+                product.set_data(data, count_change=False)
+                product.updated_at = now
+                products.append(product)
+
+        if not dry_run:
+            with transaction.atomic():
+                CrawlResult.objects.bulk_update(entries, ['data'], batch_size=500)
+                Product.objects.bulk_update(products, ['title', 'description', 'data', 'updated_at'], batch_size=500)
+                bump_products([p.pk for p in products])
+            forget_results([e.url_key for e in entries])
+        return len(entries)
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Stages of a crawl, from the first packet to the database
+DNS = 'dns'
+CONNECT = 'connect'    # TCP connection and TLS handshake of a new pooled connection
+TTFB = 'ttfb'          # Request sent until the response headers arrived (Including connection setup)
+BODY = 'body'          # Reading the body, excluding the time spent by the parser in between
+PARSE = 'parse'        # Streaming extraction of <head>
+PARSE_SOUP = 'parse_soup'   # BeautifulSoup fallback in the parse pool, including the round trip
+DB = 'db'
+CRAWL = 'crawl'        # A whole crawl task
+
+# Label of hosts beyond CRAWLER_METRICS_MAX_DOMAINS, and of work not tied to a single host
+OTHER_DOMAIN = 'other'
+
+STAGE_SECONDS = Histogram('crawler_stage_seconds', 'Time spent in a stage of a crawl',
+                          ['stage', 'domain'],
+                          buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+TRANSFERRED_BYTES = Counter('crawler_transferred_bytes', 'Bytes of response bodies read by the crawler',
+                            ['kind', 'domain'])
+OUTCOMES = Counter('crawler_outcomes', 'Outcomes of crawl operations by reason',
+                   ['operation', 'outcome', 'domain'])
+
+# Hosts with their own label in this process. Domains are unbounded, and every label value is a time series.
+_domains: set[str] = set()
+_domains_lock = threading.Lock()
+
+
+def get_domain(url: str | None = None, host: str | None = None) -> str:
+    """Returns the domain label of a URL or host, or OTHER_DOMAIN once CRAWLER_METRICS_MAX_DOMAINS are labelled."""
+    host = host if host is not None else urlsplit(url or '').hostname
+    host = (host or '').lower().removeprefix('www.')
+    if not host:
+        return OTHER_DOMAIN
+    with _domains_lock:
+        if host in _domains:
+            return host
+        if len(_domains) >= settings.CRAWLER_METRICS_MAX_DOMAINS:
+            return OTHER_DOMAIN
+        _domains.add(host)
+    return host
+
+
+def observe_stage(stage: str, seconds: float, url: str | None = None, host: str | None = None) -> None:
+    STAGE_SECONDS.labels(stage, get_domain(url, host)).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage: str, url: str | None = None) -> Iterator[None]:
+    """Observes the time spent in the block as a stage of the crawl of the URL, even if the block raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, url)
+
+
+def count_outcome(operation: str, outcome: str, url: str | None = None) -> None:
+    OUTCOMES.labels(operation, outcome, get_domain(url)).inc()
+
+
+def count_bytes(kind: str, size: int, url: str | None = None) -> None:
+    if size:
+        TRANSFERRED_BYTES.labels(kind, get_domain(url)).inc(size)
+
+
+def describe_error(e: requests.exceptions.RequestException) -> str:
+    """Outcome label of a failed request: its HTTP status, or the kind of network failure."""
+    response = getattr(e, 'response', None)
+    if response is not None:
+        return f'http_{response.status_code}'
+    if isinstance(e, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return 'connection_error'
+    return 'error'
+
+
+class MeteredBody:
+    """
+    Passes the chunks of a streamed body through, measuring the time spent waiting for them and their size.
+    The time the consumer spends between chunks is not counted, so it can be reported as parsing.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], kind: str, url: str):
+        self.chunks = chunks
+        self.kind = kind
+        self.url = url
+        self.waited = 0.0
+        self.size = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        iterator = iter(self.chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.waited += time.perf_counter() - start
+            self.size += len(chunk)
+            yield chunk
+
+    def record(self) -> None:
+        observe_stage(BODY, self.waited, self.url)
+        count_bytes(self.kind, self.size, self.url)
+
+
+def start_metrics_server(port: int) -> None:
+    """
+    Serves the metrics of every process of a Celery worker over HTTP, from its main process.
+    Prefork children write their samples to PROMETHEUS_MULTIPROC_DIR, which must be set and empty
+    before the worker starts.
+    """
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        logger.warning('PROMETHEUS_MULTIPROC_DIR is not set. Serving the metrics of the main process only.')
+        start_http_server(port)
+        return
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drops the live gauges of an exited worker process. (Counters and histograms are kept)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlResult',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('url_key', models.CharField(max_length=64, unique=True)),
+                ('url', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('etag', models.CharField(blank=True, max_length=512)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('fetched_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='idx_crawlresult_expires_at')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0001_initial'),
+        ('wishlist', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedCrawl',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('url', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('image_url', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image_blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staged_crawls', to='wishlist.blobimage')),
+                ('wish_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_crawls', to='wishlist.wishitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='idx_stagedcrawl_created_at')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0002_stagedcrawl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('url_key', models.CharField(max_length=64, unique=True)),
+                ('url', models.TextField()),
+                ('codec', models.CharField(max_length=16)),
+                ('content', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('encoding', models.CharField(blank=True, max_length=64)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,3 +1,73 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+class CrawlResult(models.Model):
+    """Cached metadata of a crawled page, keyed by the hash of its normalized URL."""
+    id = models.BigAutoField(primary_key=True)
+    url_key = models.CharField(max_length=64, unique=True)
+    url = models.TextField(blank=False)
+
+    # Extracted metadata (Same format as crawler.tasks.retrieve_data)
+    data = models.JSONField(default=dict, blank=True)
+
+    # Validators for conditional requests
+    etag = models.CharField(max_length=512, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='idx_crawlresult_expires_at'),
+        ]
+
+    def is_fresh(self) -> bool:
+        return self.expires_at > timezone.now()
+
+
+class StagedCrawl(models.Model):
+    """
+    Intermediate state of a crawl split into several tasks.
+    Only the primary key travels through the broker; the extracted metadata and the image stay here
+    until save_data writes them to the product of the wishlist item.
+    """
+    id = models.BigAutoField(primary_key=True)
+    wish_item = models.ForeignKey('wishlist.WishItem', related_name='staged_crawls', on_delete=models.CASCADE)
+    url = models.TextField(blank=False)
+
+    # Extracted metadata (Same format as crawler.tasks.retrieve_data)
+    data = models.JSONField(default=dict, blank=True)
+
+    image_url = models.TextField(blank=True)
+    image_blob = models.ForeignKey('wishlist.BlobImage', related_name='staged_crawls',
+                                   on_delete=models.SET_NULL, null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='idx_stagedcrawl_created_at'),
+        ]
+
+
+class PageSnapshot(models.Model):
+    """
+    Compressed bytes of a crawled page as read by the extractor (<head>, and whatever arrived with it),
+    so the extraction can be run again without fetching the page. Only the last successful crawl of a URL is kept.
+    """
+    id = models.BigAutoField(primary_key=True)
+    url_key = models.CharField(max_length=64, unique=True)
+    url = models.TextField(blank=False)
+
+    # Compression of the content (See crawler.snapshots)
+    codec = models.CharField(max_length=16)
+    content = models.BinaryField()
+    # Uncompressed size in bytes
+    size = models.PositiveIntegerField()
+    # Charset declared in the Content-Type header, if any
+    encoding = models.CharField(max_length=64, blank=True)
+
+    fetched_at = models.DateTimeField()
@@ -0,0 +1,186 @@
+import atexit
+import json
+import logging
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from crawler.parseworker import CRASHED, EMPTY, ERROR, FRAME_HEADER_SIZE, MEMORY, OK, TIMEOUT, parse_page
+
+logger = logging.getLogger(__name__)
+
+# Idle parse processes of the current process, and the number of parses which may run at once
+_lock = threading.Lock()
+_idle: list['ParseProcess'] = []
+_slots: threading.BoundedSemaphore | None = None
+_owner_pid: int | None = None
+
+
+@dataclass
+class ParseOutcome:
+    """Result of parsing a page in the pool. `data` is set only when the status is OK or EMPTY."""
+    status: str
+    data: dict | None = None
+    truncated: bool = False
+    error: str = ''
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (OK, EMPTY)
+
+
+class ParseProcess:
+    """A parse process started from crawler.parseworker, talking over its stdin and stdout."""
+
+    def __init__(self) -> None:
+        self.process = subprocess.Popen([sys.executable, '-m', 'crawler.parseworker',
+                                         str(settings.CRAWLER_PARSE_MAX_MEMORY)],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        cwd=settings.BASE_DIR)
+        self.tasks = 0
+        self.max_rss = 0
+        self.last_status = None
+
+    def parse(self, content: bytes, timeout: float) -> dict:
+        """
+        Sends a page to the process and waits for the reply.
+        Raises TimeoutError when the process does not reply in time, and EOFError when it exits.
+        """
+        self.tasks += 1
+        try:
+            self.process.stdin.write(len(content).to_bytes(FRAME_HEADER_SIZE, 'big') + content)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise EOFError(f'Parse process {self.process.pid} is gone') from e
+        deadline = time.monotonic() + timeout
+        header = self._read(FRAME_HEADER_SIZE, deadline)
+        reply = json.loads(self._read(int.from_bytes(header, 'big'), deadline))
+        self.max_rss = reply.get('max_rss', 0)
+        self.last_status = reply.get('status')
+        return reply
+
+    def _read(self, size: int, deadline: float) -> bytes:
+        fd = self.process.stdout.fileno()
+        chunks = []
+        while size > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError(f'Parse process {self.process.pid} did not reply in time')
+            chunk = os.read(fd, size)
+            if not chunk:
+                raise EOFError(f'Parse process {self.process.pid} exited')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def is_reusable(self) -> bool:
+        return (self.process.poll() is None
+                and self.tasks < settings.CRAWLER_PARSE_MAX_TASKS
+                and self.max_rss <= settings.CRAWLER_PARSE_MAX_RSS)
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+
+def _ensure_process_state() -> None:
+    global _owner_pid, _slots
+    pid = os.getpid()
+    if _owner_pid == pid:
+        return
+    with _lock:
+        if _owner_pid == pid:
+            return
+        # Processes inherited through fork belong to the parent
+        _idle.clear()
+        _slots = threading.BoundedSemaphore(settings.CRAWLER_PARSE_WORKERS)
+        _owner_pid = pid
+
+
+def _checkout() -> ParseProcess:
+    with _lock:
+        if _idle:
+            return _idle.pop()
+    return ParseProcess()
+
+
+def _checkin(process: ParseProcess) -> None:
+    if process.is_reusable() and process.last_status != MEMORY:
+        with _lock:
+            _idle.append(process)
+    else:
+        logger.debug('Recycling parse process %s after %s tasks (peak RSS %s bytes)',
+                     process.process.pid, process.tasks, process.max_rss)
+        process.close()
+
+
+def _parse_in_pool(content: bytes) -> ParseOutcome:
+    try:
+        process = _checkout()
+    except OSError as e:
+        return ParseOutcome(ERROR, error=f'Could not start a parse process: {e}')
+    try:
+        reply = process.parse(content, settings.CRAWLER_PARSE_TIMEOUT)
+    except TimeoutError as e:
+        process.close()
+        return ParseOutcome(TIMEOUT, error=str(e))
+    except EOFError as e:
+        # Killed by the kernel, or crashed in the parser
+        process.close()
+        return ParseOutcome(CRASHED, error=f'{e} with code {process.process.returncode}')
+    _checkin(process)
+    return ParseOutcome(reply['status'], data=reply.get('data'), error=reply.get('error', ''))
+
+
+def parse_isolated(content: bytes) -> ParseOutcome:
+    """
+    Extracts the OpenGraph properties of a page with BeautifulSoup in a separate process, so a pathological
+    page cannot exhaust the memory of the worker or block it: pages are truncated to CRAWLER_PARSE_MAX_BYTES,
+    a process gets CRAWLER_PARSE_MAX_MEMORY of address space and is killed after CRAWLER_PARSE_TIMEOUT seconds,
+    and processes are replaced after CRAWLER_PARSE_MAX_TASKS pages or once they grow past CRAWLER_PARSE_MAX_RSS.
+    With CRAWLER_PARSE_WORKERS = 0 the page is parsed in the calling process, with the same truncation.
+    Failures are returned as the status of the outcome, never raised.
+    """
+    start = time.perf_counter()
+    max_bytes = settings.CRAWLER_PARSE_MAX_BYTES
+    truncated = len(content) > max_bytes
+    if truncated:
+        content = content[:max_bytes]
+
+    if not settings.CRAWLER_PARSE_WORKERS:
+        try:
+            data = parse_page(content)
+            outcome = ParseOutcome(OK if data else EMPTY, data=data)
+        except MemoryError:
+            outcome = ParseOutcome(MEMORY)
+        except Exception as e:
+            outcome = ParseOutcome(ERROR, error=f'{type(e).__name__}: {e}')
+    else:
+        _ensure_process_state()
+        with _slots:
+            outcome = _parse_in_pool(content)
+
+    outcome.truncated = truncated
+    outcome.elapsed = time.perf_counter() - start
+    return outcome
+
+
+@atexit.register
+def close_pool() -> None:
+    """Stops the idle parse processes of the current process."""
+    with _lock:
+        processes = _idle[:] if _owner_pid == os.getpid() else []
+        _idle.clear()
+    for process in processes:
+        process.close()
@@ -0,0 +1,132 @@
+"""
+Entry point of the processes parsing pages for crawler.parsepool. (python -m crawler.parseworker MAX_MEMORY)
+
+The process reads pages from stdin and writes the extracted properties to stdout, both framed by
+a 4-byte big-endian length. Pages are sent as raw bytes; replies are JSON objects.
+This module must not import Django, so the processes start fast and stay small.
+"""
+import json
+import logging
+import os
+import re
+import sys
+
+import requests
+from bs4 import BeautifulSoup, FeatureNotFound
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the processes run without a memory limit there
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Statuses of a parse, reported by the process or decided by the pool
+OK = 'ok'
+EMPTY = 'empty'
+ERROR = 'error'
+MEMORY = 'memory'
+TIMEOUT = 'timeout'
+CRASHED = 'crashed'
+
+FRAME_HEADER_SIZE = 4
+
+
+def parse_opengraph_properties(soup: BeautifulSoup,
+                               pattern_str: str | None = None) -> dict | None:
+    """Parse OpenGraph properties from a BeautifulSoup object."""
+    if not soup:
+        logger.info('No valid crawled webpage provided. Cannot extract data.')
+        raise ValueError('No valid crawled webpage provided. Cannot extract data.')
+    pattern = re.compile(r'^og:' if not pattern_str else fr'{pattern_str}', re.IGNORECASE)
+    meta_objects = soup.find_all('meta',
+                                 attrs={'property': pattern,
+                                        'content': True})
+    rt = {}
+    for m in meta_objects:
+        prop = (m.get('property') or '').strip().removeprefix('og:')
+        content = (m.get('content') or '').strip()
+        if not prop or not content:
+            continue
+
+        existing = rt.get(prop, None)
+        if not existing:
+            rt[prop] = content
+        elif isinstance(existing, list):
+            existing.append(content)
+        else:
+            rt[prop] = [existing, content]
+    return rt
+
+def create_soup(response: requests.Response | bytes,
+                parser: str = 'lxml') -> BeautifulSoup | None:
+    """Create a BeautifulSoup object from the HTTP response content (or raw bytes of a page)."""
+    markup = response.content if isinstance(response, requests.Response) else response
+    try:
+        soup = BeautifulSoup(markup, parser)
+    except FeatureNotFound:
+        logger.warning('Parser %s not found. Falling back to \'lxml\'.', parser)
+        return BeautifulSoup(markup, 'lxml')
+    except MemoryError:
+        # The pool recycles the process; do not mistake it for an unparsable page
+        raise
+    except Exception as e:
+        logger.exception('Unexpected error while parsing the page: %s', e)
+        return None
+    return soup
+
+def parse_page(content: bytes) -> dict:
+    """Extracts the OpenGraph properties of a page with BeautifulSoup. Raises ValueError if parsing fails."""
+    return parse_opengraph_properties(create_soup(content, 'lxml'))
+
+def get_max_rss() -> int:
+    """Peak resident set size of this process in bytes, or 0 if unknown."""
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def limit_memory(max_bytes: int) -> None:
+    """Caps the address space of this process, so runaway parses raise MemoryError instead of swapping."""
+    if resource is None or not max_bytes:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = max_bytes if hard == resource.RLIM_INFINITY else min(max_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+def read_frame(stream) -> bytes | None:
+    header = stream.read(FRAME_HEADER_SIZE)
+    if len(header) < FRAME_HEADER_SIZE:
+        return None
+    return stream.read(int.from_bytes(header, 'big'))
+
+def write_frame(stream, payload: bytes) -> None:
+    stream.write(len(payload).to_bytes(FRAME_HEADER_SIZE, 'big') + payload)
+    stream.flush()
+
+def main(max_memory: int) -> None:
+    # Keep stdout for the replies; stray prints of the libraries go to stderr
+    stdin = sys.stdin.buffer
+    stdout = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    limit_memory(max_memory)
+
+    while (content := read_frame(stdin)) is not None:
+        try:
+            data = parse_page(content)
+            reply = {'status': OK if data else EMPTY, 'data': data}
+        except MemoryError:
+            reply = {'status': MEMORY}
+        except Exception as e:
+            reply = {'status': ERROR, 'error': f'{type(e).__name__}: {e}'}
+        del content
+        reply['max_rss'] = get_max_rss()
+        write_frame(stdout, json.dumps(reply).encode())
+        if reply['status'] == MEMORY:
+            # The heap may be fragmented or half-freed; let the pool start a fresh process
+            return
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import redis
+import requests
+from django.conf import settings
+
+from capellawish.redis import get_redis
+from crawler.client import fetch
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = 'crawl:bucket:'
+ROBOTS_KEY_PREFIX = 'crawl:robots:'
+
+# Takes a token from the bucket of a host, refilling it by the elapsed time first.
+# Returns 0 when a token was taken, otherwise milliseconds until the next token is available.
+# With reservation, a missing token is borrowed from the future (the bucket goes negative)
+# and the returned wait is the time slot reserved for the caller.
+# The clock of Redis is used, so workers on different hosts agree on the time.
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = ARGV[3] == '1'
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) / 1000 * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+    if reserve then
+        tokens = tokens - 1
+    end
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return wait
+'''
+
+_script = None
+
+# Fallbacks of the current process when Redis is not configured
+_local_lock = threading.Lock()
+_local_buckets: dict[str, tuple[float, float]] = {}
+# Parsed robots.txt by host, from the least to the most recently used
+_robots: OrderedDict[str, tuple[float, RobotFileParser]] = OrderedDict()
+_robots_lock = threading.Lock()
+
+DISALLOW_ALL = 'User-agent: *\nDisallow: /'
+# Only the first 500 KiB of robots.txt is parsed; the rest is ignored (RFC 9309)
+ROBOTS_MAX_BYTES = 500 * 1024
+
+
+def get_host(url: str) -> str:
+    return (urlsplit(url).hostname or '').lower()
+
+
+def _fetch_robots(url: str) -> tuple[str, int]:
+    """
+    Downloads robots.txt of the URL's origin. Returns rules as text (an empty text allows everything),
+    and the seconds to cache them. Server and network errors disallow everything for
+    CRAWLER_ROBOTS_ERROR_TTL, so the host is not crawled while its rules are unknown;
+    client errors (including 401 and 403) mean robots.txt is unavailable, which allows everything.
+    Only the first ROBOTS_MAX_BYTES of the rules are read. (RFC 9309)
+    """
+    parts = urlsplit(url)
+    robots_url = f'{parts.scheme}://{parts.netloc}/robots.txt'
+    response = None
+    body = bytearray()
+    try:
+        response = fetch(robots_url, headers={'User-Agent': settings.CRAWLER_USER_AGENT}, timeout=5, stream=True)
+        if response.status_code == 200:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body += chunk
+                if len(body) >= ROBOTS_MAX_BYTES:
+                    break
+    except requests.exceptions.RequestException as e:
+        logger.info('Could not retrieve %s: %s', robots_url, e)
+        return DISALLOW_ALL, settings.CRAWLER_ROBOTS_ERROR_TTL
+    finally:
+        if response is not None:
+            response.close()
+    if response.status_code >= 500:
+        logger.info('Could not retrieve %s: HTTP %s', robots_url, response.status_code)
+        return DISALLOW_ALL, settings.CRAWLER_ROBOTS_ERROR_TTL
+    if response.status_code != 200:
+        return '', settings.CRAWLER_ROBOTS_TTL
+    return body[:ROBOTS_MAX_BYTES].decode('utf-8', errors='replace'), settings.CRAWLER_ROBOTS_TTL
+
+
+def _remember_robots(host: str, expires_at: float, parser: RobotFileParser) -> None:
+    now = time.monotonic()
+    with _robots_lock:
+        for expired in [h for h, (until, _) in _robots.items() if until <= now]:
+            del _robots[expired]
+        _robots[host] = (expires_at, parser)
+        _robots.move_to_end(host)
+        while len(_robots) > settings.CRAWLER_ROBOTS_CACHE_SIZE:
+            _robots.popitem(last=False)
+
+
+def get_robots(url: str) -> RobotFileParser:
+    """Returns the parsed robots.txt of the URL's host, cached in the process and in Redis."""
+    host = get_host(url)
+    now = time.monotonic()
+    with _robots_lock:
+        cached = _robots.get(host)
+        if cached and cached[0] > now:
+            _robots.move_to_end(host)
+            return cached[1]
+
+    text = None
+    ttl = settings.CRAWLER_ROBOTS_TTL
+    client = get_redis()
+    if client is not None:
+        try:
+            with client.pipeline(transaction=False) as pipe:
+                raw, remaining = pipe.get(ROBOTS_KEY_PREFIX + host).ttl(ROBOTS_KEY_PREFIX + host).execute()
+            if raw is not None:
+                text = raw.decode('utf-8', errors='replace')
+                # Rules cached after an error expire with the Redis key, not a full TTL later
+                ttl = min(ttl, remaining) if remaining > 0 else ttl
+        except redis.RedisError as e:
+            logger.warning('Could not read robots.txt from Redis: %s', e)
+    if text is None:
+        text, ttl = _fetch_robots(url)
+        if client is not None:
+            try:
+                client.set(ROBOTS_KEY_PREFIX + host, text, ex=ttl)
+            except redis.RedisError as e:
+                logger.warning('Could not write robots.txt to Redis: %s', e)
+
+    parser = RobotFileParser()
+    parser.parse(text.splitlines())
+    _remember_robots(host, now + ttl, parser)
+    return parser
+
+
+def is_allowed(url: str) -> bool:
+    if not settings.CRAWLER_RESPECT_ROBOTS:
+        return True
+    return get_robots(url).can_fetch(settings.CRAWLER_USER_AGENT, url)
+
+
+def get_rate(url: str) -> tuple[float, float]:
+    """Returns (requests per second, burst) for the URL's host, honoring Crawl-delay of robots.txt."""
+    rate, burst = settings.CRAWLER_DOMAIN_RATE, settings.CRAWLER_DOMAIN_BURST
+    if settings.CRAWLER_RESPECT_ROBOTS:
+        delay = get_robots(url).crawl_delay(settings.CRAWLER_USER_AGENT)
+        if delay:
+            rate, burst = min(rate, 1 / float(delay)), 1
+    return rate, burst
+
+
+def _acquire_local(host: str, rate: float, burst: float, reserve: bool) -> float:
+    now = time.monotonic()
+    with _local_lock:
+        tokens, ts = _local_buckets.get(host, (burst, now))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+            if reserve:
+                tokens -= 1
+        _local_buckets[host] = (tokens, now)
+    return wait
+
+
+def acquire(url: str, reserve: bool = False) -> float:
+    """
+    Takes a request token for the URL's host.
+    Returns 0 if the request may be sent now, otherwise the seconds to wait before trying again.
+    With reserve=True the token is taken in any case, and the returned wait is the reserved slot:
+    the request may be sent after that many seconds without acquiring a token again.
+    """
+    global _script
+    host = get_host(url)
+    rate, burst = get_rate(url)
+    client = get_redis()
+    if client is None:
+        return _acquire_local(host, rate, burst, reserve)
+    try:
+        if _script is None:
+            _script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return _script(keys=[BUCKET_KEY_PREFIX + host], args=[rate, burst, int(reserve)]) / 1000
+    except redis.RedisError as e:
+        logger.warning('Could not take a token from Redis. Using the local bucket: %s', e)
+        return _acquire_local(host, rate, burst, reserve)
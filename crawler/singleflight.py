@@ -0,0 +1,131 @@
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from capellawish.redis import get_redis
+from crawler.cache import get_url_key
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_KEY_PREFIX = 'crawl:flight:'
+WAITERS_KEY_PREFIX = 'crawl:waiters:'
+# Sorted set of the URLs in flight, scored by the time their flight expires
+FLIGHTS_KEY = 'crawl:flights'
+
+# Makes the item the leader of the crawl of a URL if no crawl is in flight (or it already leads it),
+# otherwise registers the item as a waiter of the crawl in flight. Returns 1 for the leader.
+# Both happen in one step, so a waiter never registers after the leader has drained the waiters.
+# The waiters outlive the flight, so the waiters of a leader which vanished are served by the next leader,
+# or re-scheduled by recover_flights.
+JOIN_SCRIPT = '''
+local holder = redis.call('GET', KEYS[1])
+local ttl = tonumber(ARGV[2])
+if not holder or holder == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+    redis.call('ZADD', KEYS[3], tonumber(ARGV[4]) + ttl, ARGV[3])
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('EXPIRE', KEYS[2], ttl * 3)
+    end
+    return 1
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ttl * 3)
+return 0
+'''
+
+# Ends the crawl led by the item, and returns the waiters registered in the meantime.
+LEAVE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], ARGV[2])
+local waiters = redis.call('SMEMBERS', KEYS[2])
+redis.call('DEL', KEYS[2])
+return waiters
+'''
+
+# Ends a flight whose leader vanished without leaving it, and returns its waiters.
+# Does nothing if a leader holds the flight again.
+RECOVER_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return {}
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+local waiters = redis.call('SMEMBERS', KEYS[2])
+redis.call('DEL', KEYS[2])
+return waiters
+'''
+
+_join_script = None
+_leave_script = None
+_recover_script = None
+
+
+def _get_keys(url: str) -> list[str]:
+    url_key = get_url_key(url)
+    return [FLIGHT_KEY_PREFIX + url_key, WAITERS_KEY_PREFIX + url_key, FLIGHTS_KEY]
+
+
+def join_flight(url: str, item_id: int) -> bool:
+    """
+    Joins the crawl of the URL on behalf of a wishlist item.
+    Returns True if the caller should crawl the URL (it leads the flight, or Redis is not available),
+    False if another crawl of the URL is in flight and will fill the item when it finishes.
+    The leader is identified by its item, so a deferred and retried task keeps leading the flight.
+    """
+    global _join_script
+    client = get_redis()
+    if client is None:
+        return True
+    try:
+        if _join_script is None:
+            _join_script = client.register_script(JOIN_SCRIPT)
+        return _join_script(keys=_get_keys(url), args=[item_id, settings.CRAWLER_FLIGHT_TTL, url, int(time.time())]) == 1
+    except redis.RedisError as e:
+        logger.warning('Could not join the crawl in flight. Crawling without deduplication: %s', e)
+        return True
+
+
+def leave_flight(url: str, item_id: int) -> list[int]:
+    """
+    Ends the crawl of the URL led by the item, and returns the ids of the items waiting for its result.
+    Does nothing if the item does not lead the flight.
+    """
+    global _leave_script
+    client = get_redis()
+    if client is None:
+        return []
+    try:
+        if _leave_script is None:
+            _leave_script = client.register_script(LEAVE_SCRIPT)
+        return [int(i) for i in _leave_script(keys=_get_keys(url), args=[item_id, url])]
+    except redis.RedisError as e:
+        logger.warning('Could not leave the crawl in flight: %s', e)
+        return []
+
+
+def recover_flights(limit: int = 100) -> dict[str, list[int]]:
+    """
+    Ends the flights which expired without their leader leaving them (e.g. its worker died),
+    and returns the ids of the items which waited for each of them, by URL.
+    """
+    global _recover_script
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        if _recover_script is None:
+            _recover_script = client.register_script(RECOVER_SCRIPT)
+        orphaned = {}
+        for url in client.zrangebyscore(FLIGHTS_KEY, '-inf', int(time.time()), start=0, num=limit):
+            url = url.decode()
+            waiters = _recover_script(keys=_get_keys(url), args=[url])
+            if waiters:
+                orphaned[url] = [int(i) for i in waiters]
+        return orphaned
+    except redis.RedisError as e:
+        logger.warning('Could not recover the crawls in flight: %s', e)
+        return {}
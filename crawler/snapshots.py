@@ -0,0 +1,48 @@
+import zlib
+
+import zstandard
+from django.conf import settings
+from django.utils import timezone
+
+from crawler.cache import get_url_key
+from crawler.models import PageSnapshot
+
+# Codecs of PageSnapshot.content. Snapshots are written with zstd; zlib is only read,
+# for snapshots written before zstandard was a dependency.
+ZSTD = 'zstd'
+ZLIB = 'zlib'
+
+ZSTD_LEVEL = 3
+
+
+def compress(data: bytes) -> tuple[str, bytes]:
+    """Compresses snapshot content. Returns the codec and the compressed bytes."""
+    return ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f'Unknown snapshot codec {codec}')
+
+
+def save_snapshot(url: str, content: bytes, encoding: str | None = None) -> None:
+    """Keeps the bytes read from a page, up to CRAWLER_SNAPSHOT_MAX_BYTES, replacing its previous snapshot."""
+    limit = settings.CRAWLER_SNAPSHOT_MAX_BYTES
+    if not limit or not content:
+        return
+    content = bytes(content[:limit])
+    codec, compressed = compress(content)
+    snapshot = PageSnapshot(url_key=get_url_key(url),
+                            url=url,
+                            codec=codec,
+                            content=compressed,
+                            size=len(content),
+                            encoding=encoding or '',
+                            fetched_at=timezone.now())
+    PageSnapshot.objects.bulk_create([snapshot],
+                                     update_conflicts=True,
+                                     unique_fields=['url_key'],
+                                     update_fields=['url', 'codec', 'content', 'size', 'encoding', 'fetched_at'])
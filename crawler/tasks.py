@@ -1,155 +1,618 @@
-import hashlib
-import mimetypes
-import re
-import secrets
-import string
+import math
+import random
+import time
+from datetime import timedelta
+from collections import defaultdict
+from functools import partial
 from io import BytesIO
-from pathlib import Path
-from urllib.parse import urlparse
 
 import requests
-from django.core.files import File as DjangoFile
-from bs4 import BeautifulSoup, FeatureNotFound
-from celery import chain
+from celery import chain, group
+from celery.exceptions import Retry
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Case, Exists, ExpressionWrapper, F, FloatField, Max, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce, Extract
+from django.db.models.lookups import IsNull
+from django.utils import timezone
 from requests import HTTPError
+from urllib3.util.request import ACCEPT_ENCODING
 
 from capellawish.celery import app
-from wishlist.models import WishItem, ItemSource, BlobImage
+from crawler.breaker import (HOST_FAILURE, SUCCESS, URL_FAILURE, TargetUnavailable,
+                             classify_exception, ensure_available, record_outcome)
+from crawler.canonical import get_canonical_url, get_fingerprint, strip_tracking_params
+from crawler.cache import get_cached_result, get_conditional_headers, refresh_result, store_result
+from crawler.client import fetch, run_many
+from crawler.enrichment import merge_metadata
+from crawler.extractor import extract_head
+from crawler.metrics import (CRAWL, DB, PARSE, PARSE_SOUP, TTFB, MeteredBody,
+                             count_outcome, describe_error, observe_stage, time_stage)
+from crawler.images import (ImageTooLarge, NotAnImage, find_image_by_url, get_content_length, ingest_image,
+                            select_images)
+from crawler.models import CrawlResult, StagedCrawl
+from crawler.parsepool import parse_isolated
+from crawler.politeness import acquire, is_allowed
+from crawler.singleflight import join_flight, leave_flight, recover_flights
+from crawler.snapshots import save_snapshot
+from wishlist.cache import bump_items, bump_products
+from wishlist.models import WishItem, ItemSource, ImageAlias, ImportJob, Product
 
 logger = get_task_logger(__name__)
 
 SCRAPE_HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:146.0) Gecko/20100101 Firefox/146.0',
+    'User-Agent': settings.CRAWLER_USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.5',
     'Accept-Language': 'en-US,en;q=0.5',
-    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    # Only the encodings urllib3 can decode here (br and zstd need optional packages)
+    'Accept-Encoding': ACCEPT_ENCODING,
 }
 
+HEAD_CHUNK_SIZE = 16 * 1024
+
+# Pages of other content types are rejected by their headers, before the body is read
+PAGE_CONTENT_TYPES = {'text/html', 'application/xhtml+xml'}
+
+
+class CrawlDisallowed(Exception):
+    """Raised when robots.txt of a host disallows crawling the URL."""
+    pass
+
+
+def defer_if_throttled(task, url: str) -> None:
+    """
+    Applies the politeness rules of the URL's host before a request.
+    If the host has no request token left, the task is re-scheduled (Celery ETA) for when one is
+    available, instead of blocking the worker slot.
+    """
+    if not is_allowed(url):
+        raise CrawlDisallowed(f'robots.txt disallows crawling {url}')
+    wait = acquire(url)
+    if wait > 0:
+        logger.info('Host of %s is saturated. Deferring the task by %.1f seconds.', url, wait)
+        raise task.retry(countdown=wait + random.uniform(0, 1),
+                         max_retries=settings.CRAWLER_MAX_DEFERRALS)
+
+
+def schedule_crawl(url: str, id: int, skip_image: bool = False) -> None:
+    """Schedules the crawl of a wishlist item in the mode set by CRAWLER_PIPELINE_MODE."""
+    if settings.CRAWLER_PIPELINE_MODE == 'fused':
+        crawl_item.apply_async(args=(url, id, skip_image))
+    else:
+        retrieve_data_from_url.apply_async(args=(url, id, skip_image))
+
+def get_primary_image(data: dict) -> str | None:
+    image = data.get('image', None)
+    return image[0] if isinstance(image, list) else image
+
+def get_image_candidates(data: dict) -> list[str]:
+    """Images a page declares, in order, up to CRAWLER_IMAGE_CANDIDATES."""
+    images = data.get('image', None) or []
+    images = images if isinstance(images, list) else [images]
+    return list(dict.fromkeys(images))[:settings.CRAWLER_IMAGE_CANDIDATES]
+
+def choose_image(data: dict) -> str | None:
+    """The image of a page worth downloading, probing the candidates when the page declares several."""
+    return select_images({0: get_image_candidates(data)}, headers=SCRAPE_HEADERS).get(0)
+
+def retrieve_item_data(task, url: str, id: int) -> dict | None:
+    """
+    Retrieves the metadata of a page for the crawl of a wishlist item, applying the politeness
+    rules of its host. Returns None if robots.txt disallows the URL, or if another task is already
+    crawling the URL; that task links the item to its result when it finishes.
+    """
+    cached = get_cached_result(url)
+    if cached and cached.is_fresh():
+        count_outcome('crawl', 'cached', url)
+        return cached.data
+
+    if not join_flight(url, id):
+        logger.info('%s is being crawled by another task. Item %s waits for its result.', url, id)
+        count_outcome('crawl', 'joined', url)
+        return None
+    try:
+        defer_if_throttled(task, url)
+        retrieved = retrieve_data(url, cached=cached)
+        if not retrieved:
+            raise ValueError('Failed to retrieve data from url. Halt fetching.')
+    except Retry:
+        count_outcome('crawl', 'deferred', url)
+        raise
+    except CrawlDisallowed as e:
+        logger.info(str(e))
+        count_outcome('crawl', 'disallowed', url)
+        release_flight(url, id)
+        return None
+    except Exception:
+        count_outcome('crawl', 'failed', url)
+        release_flight(url, id)
+        raise
+    count_outcome('crawl', 'crawled', url)
+    return retrieved
+
+def release_flight(url: str, id: int) -> None:
+    """
+    Ends a crawl which saved nothing, re-scheduling the crawl of the items which waited for it:
+    the first of them leads a new flight, and the others join it.
+    """
+    reschedule_waiters(url, id, leave_flight(url, id))
+
+def reschedule_waiters(url: str, id: int | None, waiters: list[int]) -> None:
+    """Re-schedules the crawl of the items which waited for a crawl which saved nothing."""
+    for waiter in waiters:
+        logger.info('Crawl of %s by item %s ended without a result. Re-scheduling item %s.', url, id, waiter)
+        schedule_crawl(url, waiter)
+
+@app.task(bind=True, track_started=True)
+def recover_orphaned_flights(self) -> None:
+    """
+    Re-schedules the items which waited for a crawl whose task vanished without leaving its flight,
+    e.g. when its worker died. (Run by Celery beat)
+    """
+    for url, waiters in recover_flights().items():
+        reschedule_waiters(url, None, waiters)
+
+def stage_image_crawl(id: int, url: str, data: dict, image: str) -> None:
+    """Hands the image download over to another task, passing only the id of a StagedCrawl."""
+    staged = StagedCrawl.objects.create(wish_item_id=id, url=url, data=data, image_url=image)
+    chain(retrieve_image_from_url.s(staged.pk), save_data.s()).apply_async()
+
+@app.task(bind=True, track_started=True)
+def crawl_item(self, url: str, id: int, skip_image: bool) -> None:
+    """
+    Crawls a wishlist item in a single task: fetch, parse, image download and save.
+    Only when the image host is saturated, the image is handed over to the staged tasks,
+    so the page is not fetched again when this task is deferred.
+    """
+    with time_stage(CRAWL, url):
+        retrieved = retrieve_item_data(self, url, id)
+        if retrieved is None:
+            return
+
+        image = None if skip_image else choose_image(retrieved)
+        blob = find_image_by_url(image) if image else None
+        if image and not blob:
+            if not is_allowed(image):
+                logger.info('robots.txt disallows crawling %s', image)
+            elif acquire(image) > 0:
+                stage_image_crawl(id, url, retrieved, image)
+                return
+            else:
+                try:
+                    blob = ingest_image(image, headers=SCRAPE_HEADERS)
+                except (requests.exceptions.RequestException, ImageTooLarge, NotAnImage) as e:
+                    logger.error('Failed to get image data from URL: %s', e)
+
+        finish_crawl(url, id, retrieved, blob.pk if blob else None)
 
 @app.task(bind=True, track_started=True)
 def retrieve_data_from_url(self, url: str, id: int, skip_image: bool) -> None:
-    retrieved = retrieve_data(url)
-    if not retrieved:
-        raise ValueError('Failed to retrieve data from url. Halt fetching.')
+    with time_stage(CRAWL, url):
+        retrieved = retrieve_item_data(self, url, id)
+        if retrieved is None:
+            return
 
-    if not retrieved.get('image', None) or skip_image:
-        # Call the save task directly
-        chain(save_data.s(retrieved, id)).apply_async()
-    else:
-        if isinstance(retrieved['image'], list):
-            image = retrieved['image'][0]
+        image = None if skip_image else choose_image(retrieved)
+        # Images downloaded before are linked without any network or file I/O
+        blob = find_image_by_url(image) if image else None
+        if image and not blob:
+            stage_image_crawl(id, url, retrieved, image)
         else:
-            image = retrieved['image']
-
-        # Find existing image from the database
-        entity = BlobImage.objects.filter(url=image).first()
-        if not entity:
-            chain(retrieve_image_from_url.s(image, retrieved, url),
-                 save_data.s(id)
-                 ).apply_async()
-    return
+            finish_crawl(url, id, retrieved, blob.pk if blob else None)
 
 @app.task(bind=True, track_started=True)
-def retrieve_image_from_url(self, url: str, data: dict) -> dict:
+def retrieve_image_from_url(self, staged_id: int) -> int:
+    staged = StagedCrawl.objects.get(pk=staged_id)
     try:
-        image_path = fetch_image(url)
-        if not image_path:
-            raise Exception('Failed to retrieve image data from URL.')
-    except HTTPError as e:
-        logger.error('Failed to get image data from URL')
-        return data
-    except Exception as e:
-        logger.exception('Failed to process image data from URL.', e)
-        raise e
+        return store_staged_image(self, staged)
+    except Retry:
+        raise
+    except Exception:
+        # The page was crawled, but save_data will never run; the waiters crawl it again
+        release_flight(staged.url, staged.wish_item_id)
+        raise
 
-    data['image'] = str(image_path)
-    return data
+def store_staged_image(task, staged: StagedCrawl) -> int:
+    """Downloads the image of a staged crawl, unless it was downloaded before, and returns the id of the crawl."""
+    blob = find_image_by_url(staged.image_url)
+    if not blob:
+        try:
+            defer_if_throttled(task, staged.image_url)
+        except CrawlDisallowed as e:
+            logger.info(str(e))
+            return staged.pk
+
+        try:
+            blob = ingest_image(staged.image_url, headers=SCRAPE_HEADERS)
+        except (HTTPError, TargetUnavailable, ImageTooLarge, NotAnImage) as e:
+            logger.error('Failed to get image data from URL: %s', e)
+            return staged.pk
+        except Exception:
+            logger.exception('Failed to process image data from URL.')
+            raise
+
+    staged.image_blob = blob
+    staged.save(update_fields=['image_blob'])
+    return staged.pk
 
 @app.task(bind=True, track_started=True)
-def save_data(self, data: dict, id: int, url: str) -> None:
+def save_data(self, staged_id: int) -> None:
+    staged = StagedCrawl.objects.get(pk=staged_id)
+    if staged.data:
+        finish_crawl(staged.url, staged.wish_item_id, staged.data, staged.image_blob_id)
+    elif staged.image_blob_id:
+        # Only the image was left to download; the product was saved by a bulk task, or the item enriched
+        (Product.objects
+         .filter(sources__wish_item_id=staged.wish_item_id, sources__is_primary=True, image__isnull=True)
+         .update(image_id=staged.image_blob_id))
+        (WishItem.objects
+         .filter(pk=staged.wish_item_id, enriched_at__isnull=False, enriched_image__isnull=True)
+         .update(enriched_image_id=staged.image_blob_id))
+        bump_items([staged.wish_item_id])
+    staged.delete()
+
+def finish_crawl(url: str, id: int, data: dict, blob_id: int | None = None) -> None:
+    """Saves the crawled data as the product of the item, and of the items which waited for the same crawl."""
+    waiters = leave_flight(url, id)
+    item_ids = [id, *waiters]
     try:
-        with transaction.atomic():
-            target = WishItem.objects.select_for_update().get(id=id)
-            if not target.title:
-                target.title = data['title']
-            if not target.description:
-                target.description = data['description']
-
-            image_path = data.get('image', None)
-            if not target.image and image_path:
-                if isinstance(image_path, (str, Path)) and Path(image_path).exists():
-                    p = Path(image_path)
-                    filename = p.name
-                    with open(p, 'rb') as f:
-                        hash = hashlib.file_digest(f, 'sha256').hexdigest()
-
-                        existing = BlobImage.objects.filter(sha256_hash=hash).first()
-                        if existing:
-                            target.image = existing
-                        else:
-                            django_file = DjangoFile(f, name=filename)
-                            blob = BlobImage()
-                            blob.image.save(filename, django_file)
-                            blob.sha256_hash = hash
-                            blob.url = url
-                            blob.save()
-                            target.image = blob
-            target.save()
-    except (WishItem.DoesNotExist, ItemSource.DoesNotExist) as exc:
-        logger.info(f'WishItem or ItemSource does not exist: {exc}')
-        raise exc
-    except Exception as exc:
-        logger.exception('Failed to save data: %s', exc)
-        raise exc
-    else:
-        if data.get('image', None):
-            Path.unlink(data['image'], missing_ok=True)
-
-
-def parse_opengraph_properties(soup: BeautifulSoup,
-                               pattern_str: str | None = None) -> dict | None:
-    """Parse OpenGraph properties from a BeautifulSoup object."""
-    if not soup:
-        logger.info('No valid crawled webpage provided. Cannot extract data.')
-        raise ValueError('No valid crawled webpage provided. Cannot extract data.')
-    pattern = re.compile(r'^og:' if not pattern_str else fr'{pattern_str}', re.IGNORECASE)
-    meta_objects = soup.find_all('meta',
-                                 attrs={'property': pattern,
-                                        'content': True})
-    rt = {}
-    for m in meta_objects:
-        prop = (m.get('property') or '').strip().removeprefix('og:')
-        content = (m.get('content') or '').strip()
-        if not prop or not content:
+        with time_stage(DB, url):
+            products = save_products({url: data}, {url: blob_id} if blob_id else None)
+            link_products(products, {item_id: url for item_id in item_ids})
+            apply_canonical_url(url, item_ids, data)
+            bump_products([p.pk for p in products.values()])
+    except Exception:
+        reschedule_waiters(url, id, waiters)
+        raise
+
+def save_products(crawled: dict[str, dict], blob_ids: dict[str, int] | None = None) -> dict[str, Product]:
+    """
+    Saves crawled pages as products with a single upsert, keyed by the fingerprint of the canonical
+    URL each page declares. Pages crawled under several URLs are stored once.
+    :param crawled: Dictionary mapping crawled URLs to their metadata
+    :param blob_ids: Dictionary mapping crawled URLs to the blob of their primary image, if any
+    :return: Dictionary mapping crawled URLs to their products
+    """
+    blob_ids = blob_ids or {}
+    fingerprints = {url: get_fingerprint(get_canonical_url(url, data) or url) for url, data in crawled.items()}
+    existing = Product.objects.in_bulk(set(fingerprints.values()), field_name='fingerprint')
+
+    now = timezone.now()
+    products = {}
+    for url, data in crawled.items():
+        fingerprint = fingerprints[url]
+        if fingerprint in products:
             continue
+        product = existing.get(fingerprint) or Product(fingerprint=fingerprint)
+        # Refreshes fetch the page as it was crawled; the declared canonical URL may not be served
+        product.url = strip_tracking_params(url)
+        product.set_data(data)
+        product.image_id = blob_ids.get(url) or product.image_id
+        product.last_crawled_at = now
+        product.crawl_count += 1
+        products[fingerprint] = product
 
-        existing = rt.get(prop, None)
-        if not existing:
-            rt[prop] = content
-        elif isinstance(existing, list):
-            existing.append(content)
-        else:
-            rt[prop] = [existing, content]
-    return rt
+    Product.objects.bulk_create(products.values(),
+                                update_conflicts=True,
+                                unique_fields=['fingerprint'],
+                                update_fields=['url', 'title', 'description', 'data', 'image', 'last_crawled_at',
+                                               'crawl_count', 'change_count', 'updated_at'])
+    return {url: products[fingerprint] for url, fingerprint in fingerprints.items()}
+
+def link_products(products: dict[str, Product], item_urls: dict[int, str]) -> None:
+    """Links the primary sources of items to the products of their URLs, with one UPDATE per product."""
+    for url, item_ids in group_by_url(item_urls).items():
+        if url in products:
+            (ItemSource.objects
+             .filter(wish_item_id__in=item_ids, is_primary=True)
+             .update(product=products[url]))
+
+def apply_canonical_url(url: str, item_ids: list[int], data: dict) -> None:
+    """
+    Re-keys the primary sources of the items to the canonical URL the crawled page declares
+    (<link rel=canonical> or og:url), so the variants of a product URL share one fingerprint.
+    The result is cached under the canonical URL as well.
+    """
+    canonical = get_canonical_url(url, data)
+    if not canonical:
+        return
+    fingerprint = get_fingerprint(canonical)
+    if fingerprint == get_fingerprint(url):
+        return
+    # Items which already have a source with the canonical URL keep both sources as they are
+    (ItemSource.objects
+     .filter(wish_item_id__in=item_ids, is_primary=True)
+     .exclude(wish_item__in=ItemSource.objects.filter(source_fingerprint=fingerprint).values('wish_item'))
+     .update(source_fingerprint=fingerprint))
+    cached = get_cached_result(canonical)
+    if not (cached and cached.is_fresh()):
+        store_result(canonical, data)
+
+@app.task(bind=True, track_started=True)
+def enrich_item(self, id: int, skip_image: bool = False, reserved_urls: list[str] | None = None) -> None:
+    """
+    Crawls every source of an item concurrently, and merges their metadata into the item by the
+    precedence of crawler.enrichment.merge_metadata, so the item takes as long as its slowest source.
+    Saturated hosts get a reserved request slot, and the task is re-scheduled once for the latest slot.
+    :param id: ID of the wishlist item
+    :param skip_image: Do not download the merged image (The owner uploaded one)
+    :param reserved_urls: Source URLs whose request slot was reserved by a previous run
+    """
+    with time_stage(CRAWL):
+        sources = list(ItemSource.objects
+                       .filter(wish_item_id=id)
+                       .order_by('-is_primary', 'pk')
+                       .only('source_url', 'is_primary'))
+        urls = list(dict.fromkeys(s.source_url for s in sources))
+        results = {}
+        fetch_urls = []
+        wait = 0.0
+        for url in urls:
+            cached = get_cached_result(url)
+            if cached and cached.is_fresh():
+                results[url] = cached.data
+            elif not is_allowed(url):
+                logger.info('robots.txt disallows crawling %s', url)
+            elif reserved_urls is None:
+                # A token is taken in any case; the wait is the slot reserved for the URL
+                fetch_urls.append(url)
+                wait = max(wait, acquire(url, reserve=True))
+            elif url in reserved_urls or acquire(url) == 0:
+                fetch_urls.append(url)
+            else:
+                logger.info('Host of %s is still saturated. Enriching item %s without it.', url, id)
+        if wait > 0:
+            logger.info('Sources of item %s are saturated. Deferring the enrichment by %.1f seconds.', id, wait)
+            enrich_item.apply_async(args=(id, skip_image), kwargs={'reserved_urls': fetch_urls},
+                                    countdown=math.ceil(wait))
+            return
+        results.update(retrieve_data_many(fetch_urls))
+
+        crawled = {url: results[url] for url in urls if results.get(url)}
+        if not crawled:
+            count_outcome('enrich', 'failed')
+            return
+        merged = merge_metadata(list(crawled.values()))
+
+        blob_ids = {}
+        image_saturated = False
+        if merged.get('image') and not skip_image:
+            image_blobs, saturated = resolve_images({merged['image']: merged['image']})
+            blob_ids = {url: image_blobs[merged['image']] for url, data in crawled.items()
+                        if merged['image'] in image_blobs and get_primary_image(data) == merged['image']}
+            image_saturated = bool(saturated)
 
-def create_soup(response: requests.Response,
-                parser: str = 'lxml') -> BeautifulSoup | None:
-    """Create a BeautifulSoup object from the HTTP response content."""
+        with time_stage(DB), transaction.atomic():
+            products = save_products(crawled, blob_ids)
+            for url, product in products.items():
+                ItemSource.objects.filter(wish_item_id=id, source_url=url).update(product=product)
+            WishItem.objects.filter(pk=id).update(enriched_title=merged.get('title', '')[:400],
+                                                  enriched_description=merged.get('description', ''),
+                                                  enriched_image_id=next(iter(blob_ids.values()), None),
+                                                  price_min=merged.get('price_min'),
+                                                  price_max=merged.get('price_max'),
+                                                  price_currency=merged.get('price_currency', '')[:3],
+                                                  enriched_at=timezone.now())
+        if sources and sources[0].is_primary and sources[0].source_url in crawled:
+            apply_canonical_url(sources[0].source_url, [id], crawled[sources[0].source_url])
+        bump_products([p.pk for p in products.values()])
+        if image_saturated:
+            # Let the image task defer itself, now that the item is enriched
+            stage_image_crawl(id, next(iter(crawled)), {}, merged['image'])
+        count_outcome('enrich', 'ok' if len(crawled) == len(urls) else 'partial')
+
+def start_import(job_id: int, item_ids: list[int]) -> None:
+    """Fans the crawl of imported items out as a group of chunk tasks."""
+    size = settings.WISHLIST_IMPORT_CHUNK_SIZE
+    ImportJob.objects.filter(pk=job_id).update(status=ImportJob.Status.RUNNING)
+    group(import_chunk.s(job_id, item_ids[i:i + size])
+          for i in range(0, len(item_ids), size)).apply_async()
+
+def update_import_progress(job_id: int, processed: int, failed: int) -> None:
+    if not processed and not failed:
+        return
+    ImportJob.objects.filter(pk=job_id).update(processed=F('processed') + processed,
+                                               failed=F('failed') + failed)
+    (ImportJob.objects
+     .filter(pk=job_id, finished_at__isnull=True, total__lte=F('processed') + F('failed'))
+     .update(status=ImportJob.Status.COMPLETED, finished_at=timezone.now()))
+
+@app.task(bind=True, track_started=True)
+def import_chunk(self, job_id: int, item_ids: list[int], reserved: bool = False) -> None:
+    """
+    Crawls the primary sources of a chunk of imported items concurrently and writes the results
+    back in batches. URLs of saturated hosts get a reserved request slot and are re-scheduled
+    for it as a separate chunk, so this task never waits for a host.
+    A failed chunk counts its items as failed, so the job still completes.
+    """
+    # Items handed over to a deferred chunk are counted by it
+    deferred = 0
     try:
-        soup = BeautifulSoup(response.content, parser)
-    except FeatureNotFound:
-        logger.warning('Parser %s not found. Falling back to \'lxml\'.', parser)
-        return BeautifulSoup(response.content, 'lxml')
-    except Exception as e:
-        logger.exception('Unexpected error while parsing the page: %s', e)
-        return None
-    return soup
+        urls = dict(ItemSource.objects
+                    .filter(wish_item_id__in=item_ids, is_primary=True)
+                    .values_list('wish_item_id', 'source_url'))
+        failed = len(item_ids) - len(urls)
+
+        ready = {}
+        slots = defaultdict(list)
+        for item_id, url in urls.items():
+            cached = None if reserved else get_cached_result(url)
+            if reserved or (cached and cached.is_fresh()):
+                ready[item_id] = url
+            elif not is_allowed(url):
+                logger.info('robots.txt disallows crawling %s', url)
+                failed += 1
+            else:
+                slots[math.ceil(acquire(url, reserve=True))].append(item_id)
+        ready.update((i, urls[i]) for i in slots.pop(0, []))
+        for wait, ids in slots.items():
+            import_chunk.apply_async(args=(job_id, ids), kwargs={'reserved': True}, countdown=wait)
+            deferred += len(ids)
+
+        results = retrieve_data_many(list(set(ready.values())))
+        crawled = {url: data for url, data in results.items() if data}
+        item_urls = {item_id: url for item_id, url in ready.items() if url in crawled}
+        failed += len(ready) - len(item_urls)
+
+        images = select_images({url: get_image_candidates(data) for url, data in crawled.items()},
+                               headers=SCRAPE_HEADERS)
+        blob_ids, saturated = resolve_images(images)
+        with time_stage(DB):
+            products = save_products(crawled, blob_ids)
+            link_products(products, item_urls)
+        for url, ids in group_by_url(item_urls).items():
+            apply_canonical_url(url, ids, crawled[url])
+            if url in saturated:
+                # Let the image task defer itself, now that the product is linked
+                stage_image_crawl(ids[0], url, {}, images[url])
+        bump_products([p.pk for p in products.values()])
+    except Exception:
+        logger.exception('Import chunk of job %s failed.', job_id)
+        update_import_progress(job_id, processed=0, failed=len(item_ids) - deferred)
+        raise
+    update_import_progress(job_id, processed=len(item_urls), failed=failed)
+
+def group_by_url(urls: dict[int, str]) -> dict[str, list[int]]:
+    rt = defaultdict(list)
+    for item_id, url in urls.items():
+        rt[url].append(item_id)
+    return rt
+
+def resolve_images(image_urls: dict[str | int, str]) -> tuple[dict[str | int, int], set[str | int]]:
+    """
+    Resolves many images to blobs: images known from the alias table with a single query,
+    the others by downloading them concurrently. Images of saturated hosts are not downloaded;
+    the caller hands them over to the staged image task.
+    :param image_urls: Dictionary mapping keys (page URLs, product ids, ...) to image URLs
+    :return: Dictionary mapping keys to blob ids, and the keys whose image host is saturated
+    """
+    known = dict(ImageAlias.objects
+                 .filter(url_hash__in=[ImageAlias.hash_url(u) for u in image_urls.values()])
+                 .values_list('url', 'blob_id'))
+    missing = []
+    saturated = set()
+    for key, image in image_urls.items():
+        if image in known or image in missing or not is_allowed(image):
+            continue
+        if acquire(image) > 0:
+            saturated.add(key)
+            continue
+        missing.append(image)
+    for image, blob in zip(missing, run_many(partial(ingest_image, headers=SCRAPE_HEADERS), missing)):
+        if isinstance(blob, Exception):
+            logger.info('Could not retrieve image from %s: %s', image, blob)
+        else:
+            known[image] = blob.pk
+    return {key: known[image] for key, image in image_urls.items() if image in known}, saturated
+
+def get_refresh_priority(now) -> ExpressionWrapper:
+    """
+    Priority of refreshing a product: hours since its last crawl, weighted by how often its metadata
+    changed on past crawls (smoothed, so new products start at 0.5) and boosted when an owner of
+    the product viewed their item recently. Products never crawled come first.
+    """
+    last_viewed_at = Max('sources__wish_item__last_viewed_at')
+    staleness = Extract(now - Coalesce(F('last_crawled_at'), F('created_at')), 'epoch') / 3600.0
+    change_rate = (F('change_count') + 1.0) / (F('crawl_count') + 2.0)
+    viewed_hours = Extract(now - last_viewed_at, 'epoch') / 3600.0
+    view_boost = Case(When(IsNull(last_viewed_at, True), then=Value(1.0)),
+                      default=1.0 + settings.CRAWLER_REFRESH_VIEW_WEIGHT * 24.0 / (24.0 + viewed_hours))
+    never_crawled = Case(When(last_crawled_at__isnull=True, then=Value(1000000.0)), default=Value(0.0))
+    return ExpressionWrapper(never_crawled + staleness * change_rate * view_boost, output_field=FloatField())
+
+@app.task(bind=True, track_started=True)
+def schedule_refresh(self) -> None:
+    """
+    Picks the products whose metadata is most likely stale, within the share of the hourly
+    request budget for this run, and refreshes them in chunks. Only products saved by an active
+    item are refreshed, once however many items save them. (Run by Celery beat)
+    """
+    now = timezone.now()
+    quota = math.ceil(settings.CRAWLER_REFRESH_BUDGET * settings.CRAWLER_REFRESH_INTERVAL / 3600)
+    active = ItemSource.objects.filter(product=OuterRef('pk'),
+                                       is_primary=True,
+                                       wish_item__deleted_at__isnull=True,
+                                       wish_item__completed_at__isnull=True)
+    product_ids = list(Product.objects
+                       .filter(Exists(active))
+                       .filter(Q(last_crawled_at__isnull=True)
+                               | Q(last_crawled_at__lt=now - timedelta(seconds=settings.CRAWLER_REFRESH_MIN_AGE)))
+                       .annotate(priority=get_refresh_priority(now))
+                       .order_by('-priority')
+                       .values_list('id', flat=True)[:quota])
+    size = settings.CRAWLER_REFRESH_CHUNK_SIZE
+    logger.info('Refreshing %d products', len(product_ids))
+    group(refresh_products.s(product_ids[i:i + size])
+          for i in range(0, len(product_ids), size)).apply_async()
+
+@app.task(bind=True, track_started=True)
+def refresh_products(self, product_ids: list[int]) -> None:
+    """
+    Revalidates the pages of products concurrently with conditional requests, and writes
+    the changes back with bulk_update. Products of saturated hosts are left for the next run.
+    """
+    products = list(Product.objects.filter(pk__in=product_ids))
+    results = {}
+    fetch_urls = []
+    for url in dict.fromkeys(p.url for p in products):
+        cached = get_cached_result(url)
+        if cached and cached.is_fresh():
+            # Crawled for a new item in the meantime
+            results[url] = cached.data
+        elif not is_allowed(url):
+            # Counts as a failed crawl, so the product does not come back on every run
+            results[url] = None
+        elif acquire(url) <= 0:
+            fetch_urls.append(url)
+    results.update(retrieve_data_many(fetch_urls))
+
+    now = timezone.now()
+    refreshed = []
+    changed = []
+    candidates = {}
+    for product in products:
+        if product.url not in results:
+            continue
+        data = results[product.url]
+        if data:
+            shown = (product.title, product.description)
+            product.set_data(data)
+            if (product.title, product.description) != shown:
+                changed.append(product.pk)
+            if not product.image_id:
+                candidates[product.pk] = get_image_candidates(data)
+        product.last_crawled_at = product.updated_at = now
+        product.crawl_count += 1
+        refreshed.append(product)
+
+    image_urls = select_images(candidates, headers=SCRAPE_HEADERS)
+    blob_ids, saturated = resolve_images(image_urls)
+    for product in refreshed:
+        product.image_id = blob_ids.get(product.pk, product.image_id)
+    changed.extend(blob_ids.keys())
+
+    with time_stage(DB), transaction.atomic():
+        Product.objects.bulk_update(refreshed, ['title', 'description', 'data', 'image', 'last_crawled_at',
+                                                'crawl_count', 'change_count', 'updated_at'], batch_size=500)
+        # Only products whose shown metadata changed invalidate the responses of their owners
+        bump_products(changed)
+    if saturated:
+        items = dict(ItemSource.objects
+                     .filter(product_id__in=saturated, is_primary=True)
+                     .values_list('product_id', 'wish_item_id'))
+        for product in refreshed:
+            if product.pk in items:
+                stage_image_crawl(items[product.pk], product.url, {}, image_urls[product.pk])
 
 def fetch_page_from_url(url: str,
                         headers: dict | None = None,
-                        timeout: int = 10) -> requests.Response | None:
-    """Fetches a web page from the given URL with specified headers and timeout."""
+                        timeout: int = 10,
+                        stream: bool = False) -> requests.Response | None:
+    """
+    Fetches a web page from the given URL with specified headers and timeout.
+    With stream=True only the headers are read; the caller must consume or close the response.
+    """
     if not headers:
         headers = {}
     if headers.get('User-Agent') is None:
@@ -157,24 +620,39 @@ def fetch_page_from_url(url: str,
         user_agent = SCRAPE_HEADERS['User-Agent']
         logger.info('Using user agent: %s', user_agent)
         headers.update({'User-Agent': user_agent})
+    try:
+        ensure_available(url)
+    except TargetUnavailable as e:
+        logger.info(str(e))
+        count_outcome('fetch_page', 'unavailable', url)
+        return None
     try:
         # Retrieving the data from the URL
         logger.debug(f'Try fetching page from URL {url}')
-        session = requests.Session()
-        page_response = session.get(url, headers=headers, timeout=timeout)
+        page_response = fetch(url, headers=headers, timeout=timeout, stream=stream)
+        observe_stage(TTFB, page_response.elapsed.total_seconds(), url)
         page_response.raise_for_status()
     except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
         logger.exception('Could not retrieve page from %s: %s', url, e)
+        record_outcome(url, HOST_FAILURE)
+        count_outcome('fetch_page', describe_error(e), url)
         return None
     except requests.exceptions.RequestException as e:
         logger.exception('Request exception occurred while retrieving page from %s: %s', url, e)
+        record_outcome(url, classify_exception(e))
+        count_outcome('fetch_page', describe_error(e), url)
         return None
+    record_outcome(url, SUCCESS)
+    count_outcome('fetch_page', 'not_modified' if page_response.status_code == 304 else 'ok', url)
     return page_response
 
-def retrieve_data(url: str) -> dict | None:
+def retrieve_data(url: str, use_cache: bool = True, cached: CrawlResult | None = None) -> dict | None:
     """
     Retrieves product data from the given URL from a request user.
     Returns a dictionary with product data or None if retrieval fails.
+    Fresh entries of the crawl cache are returned without a request,
+    and stale ones are revalidated with a conditional GET, or returned as they are
+    if the page cannot be fetched. (stale-if-error)
 
     Necessary data:
     title, image, type (metadata)
@@ -182,56 +660,135 @@ def retrieve_data(url: str) -> dict | None:
     Optional:
     description, price (metadata)
     """
-    fetched_page = fetch_page_from_url(url, headers=SCRAPE_HEADERS,
-                                       timeout=10)
+    if use_cache and cached is None:
+        cached = get_cached_result(url)
+    if cached and cached.is_fresh():
+        logger.debug(f'Serving {url} from the crawl cache')
+        return cached.data
+
+    headers = SCRAPE_HEADERS | get_conditional_headers(cached)
+    fetched_page = fetch_page_from_url(url, headers=headers,
+                                       timeout=10, stream=True)
+    if cached and fetched_page is None:
+        logger.info('Could not revalidate %s. Serving it from the crawl cache.', url)
+        return cached.data
+    if cached and fetched_page.status_code == 304:
+        fetched_page.close()
+        return refresh_result(cached, fetched_page.headers).data
+
+    content = bytearray()
+    data = extract_data(url, fetched_page, content)
+    if data is not None and use_cache:
+        store_result(url, data, fetched_page.headers)
+        save_snapshot(url, content, get_charset(fetched_page))
+    return data
+
+def retrieve_data_many(urls: list[str]) -> dict[str, dict | None]:
+    """
+    Retrieves product data from several URLs concurrently through the shared crawler client.
+    Returns a dictionary mapping each URL to its data, or None if retrieval fails.
+    """
+    results = run_many(retrieve_data, urls)
+    rt = {}
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            logger.info('Could not retrieve data from %s: %s', url, result)
+            result = None
+        rt[url] = result
+    return rt
+
+def extract_data(url: str,
+                 fetched_page: requests.Response | None,
+                 buffer: bytearray | None = None) -> dict | None:
+    """
+    Extracts product data from a fetched page. Returns None if the page is not usable.
+    The page is read incrementally and the connection is closed as soon as <head> is parsed
+    or CRAWLER_HEAD_MAX_BYTES are read. Pages the streaming extractor cannot handle
+    are parsed again from the bytes read so far with BeautifulSoup.
+    If `buffer` is given, the bytes read are copied into it.
+    """
     if not fetched_page or fetched_page.status_code != 200:
         return None
+    reason = validate_page_headers(fetched_page)
+    if reason:
+        logger.info('Skipping %s: %s', url, reason)
+        fetched_page.close()
+        record_outcome(url, URL_FAILURE)
+        count_outcome('extract', 'rejected', url)
+        return None
+
+    buffer = bytearray() if buffer is None else buffer
+    metadata = None
+    body = MeteredBody(fetched_page.iter_content(chunk_size=HEAD_CHUNK_SIZE), 'page', url)
+    start = time.perf_counter()
     try:
-        soup = create_soup(fetched_page, 'lxml')
-        data = {}
-        # Try to extract OpenGraph properties
-        og_props = parse_opengraph_properties(soup)
-        # Note: Parsing tags directly is not implemented yet.
-        if not og_props:
-            logger.info(f'No OpenGraph properties found in the page: {url}')
+        metadata = extract_head(body,
+                                max_bytes=settings.CRAWLER_HEAD_MAX_BYTES,
+                                encoding=get_charset(fetched_page),
+                                buffer=buffer)
+    except requests.exceptions.RequestException as e:
+        logger.info('Connection failed while reading the page %s: %s', url, e)
     except Exception as e:
-        logger.exception(f'Unexpected error while parsing the page: %s', e)
+        logger.info('Streaming extraction failed for %s. Falling back to BeautifulSoup: %s', url, e)
+    finally:
+        fetched_page.close()
+        body.record()
+        observe_stage(PARSE, time.perf_counter() - start - body.waited, url)
+
+    if metadata and not metadata.is_empty():
+        count_outcome('extract', 'ok', url)
+        return metadata.to_data()
+    if not buffer:
+        count_outcome('extract', 'empty', url)
         return None
+    return parse_fallback(url, bytes(buffer))
 
-    if len(og_props) > 0:
-        data.update(og_props)
-    return data
+def parse_fallback(url: str, content: bytes) -> dict | None:
+    """
+    Extracts the OpenGraph properties of a page with BeautifulSoup, in the isolated parse pool.
+    Returns None if parsing fails, runs out of time or memory.
+    """
+    outcome = parse_isolated(content)
+    observe_stage(PARSE_SOUP, outcome.elapsed, url)
+    if outcome.truncated:
+        logger.info('%s exceeds %s bytes. Parsed the truncated page.', url, settings.CRAWLER_PARSE_MAX_BYTES)
+    if not outcome.ok:
+        logger.warning('Could not parse the page %s (%s): %s', url, outcome.status, outcome.error)
+        count_outcome('extract', f'parse_{outcome.status}', url)
+        return None
 
-def get_filename(url: str) -> str:
-    filename = urlparse(url).path.split('/')[-1]
-    return filename
-
-def has_file_extension(target: str) -> bool:
-    idx = target.rfind('.')
-    return False if idx == -1 else True
-
-def guess_filename(url: str, response: requests.Response) -> str:
-    rt = get_filename(url)
-    if not has_file_extension(rt):
-        if len(rt) > 20:
-            rand_filename = '_' + ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
-            rt += rand_filename
-        ext = mimetypes.guess_extension(response.headers.get('content-type'))
-        if not ext:
-            ext = '.bin'
-        rt += ext
-    return rt
+    if not outcome.data:
+        logger.info(f'No OpenGraph properties found in the page: {url}')
+    # Note: Parsing tags directly is not implemented yet.
+    count_outcome('extract', 'fallback' if outcome.data else 'empty', url)
+    return outcome.data or {}
 
-def fetch_image(url: str) -> Path | None:
-    response = requests.get(url, headers=SCRAPE_HEADERS)
-    response.raise_for_status()
-    filename = guess_filename(url, response)
-    final_basepath = Path(__file__).parent.parent / 'data' / 'temp'
+def extract_snapshot(url: str, content: bytes, encoding: str | None = None) -> dict | None:
+    """Runs the extraction of extract_data() again over the saved bytes of a page. (No network I/O)"""
+    try:
+        metadata = extract_head([content], max_bytes=len(content), encoding=encoding)
+    except Exception as e:
+        logger.info('Streaming extraction failed for %s. Falling back to BeautifulSoup: %s', url, e)
+        metadata = None
+    if metadata and not metadata.is_empty():
+        return metadata.to_data()
+    return parse_fallback(url, content)
 
-    if not Path.exists(final_basepath):
-        Path.mkdir(final_basepath, parents=True)
-    final_path = final_basepath / filename
+def validate_page_headers(response: requests.Response) -> str | None:
+    """Returns why a page should not be read, judging by its headers only, or None if it looks like HTML."""
+    content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type and content_type not in PAGE_CONTENT_TYPES:
+        return f'Content-Type {content_type} is not HTML'
+    declared_size = get_content_length(response)
+    if declared_size is not None and declared_size > settings.CRAWLER_PAGE_MAX_BYTES:
+        return f'Content-Length {declared_size} exceeds the limit of {settings.CRAWLER_PAGE_MAX_BYTES} bytes'
+    return None
 
-    with open(final_path, 'wb') as f:
-        f.write(response.content)
-    return final_path
+def get_charset(response: requests.Response) -> str | None:
+    """Returns the charset declared in the Content-Type header, if any."""
+    content_type = response.headers.get('content-type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset' and value.strip():
+            return value.strip().strip('"\'')
+    return None
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ListConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'list'
+
+    def ready(self) -> None:
+        # Invalidation of the cached responses (See wishlist.cache)
+        from list import signals
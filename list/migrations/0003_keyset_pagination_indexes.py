@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('list', '0002_alter_listmodel_image'),
+        ('wishlist', '0012_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listmodel',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='idx_list_user_updated'),
+        ),
+    ]
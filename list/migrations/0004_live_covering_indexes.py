@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('list', '0003_keyset_pagination_indexes'),
+        ('wishlist', '0013_live_covering_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listmodel',
+            name='wishitem_li_is_dele_9f1cfc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listmodel',
+            name='idx_list_user_updated',
+        ),
+        migrations.AddIndex(
+            model_name='listmodel',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', '-updated_at', '-id'], include=('uuid', 'title', 'image'), name='idx_list_live_updated'),
+        ),
+    ]
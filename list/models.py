@@ -36,9 +36,11 @@ class ListModel(models.Model):
         db_table_comment = 'Lists of wishlist items'
 
         indexes = [
-            models.Index(fields=['is_deleted']),
             models.Index(fields=['user']),
-            models.Index(fields=['uuid'])
+            models.Index(fields=['uuid']),
+            # Live lists of a user in the order of ListView. (The description is left out; it is unbounded)
+            models.Index(fields=['user', '-updated_at', '-id'], name='idx_list_live_updated',
+                         condition=models.Q(is_deleted=False), include=['uuid', 'title', 'image']),
         ]
         ordering = [
             'user',
@@ -0,0 +1,18 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from list.models import ListModel
+from wishlist.cache import bump_versions
+
+
+@receiver(post_save, sender=ListModel)
+@receiver(post_delete, sender=ListModel)
+def invalidate_list(sender, instance: ListModel, **kwargs) -> None:
+    bump_versions([instance.user_id])
+
+
+@receiver(m2m_changed, sender=ListModel.items.through)
+def invalidate_list_items(sender, instance, action: str, **kwargs) -> None:
+    # The instance is a list or an item, depending on the side the membership was changed from
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions([instance.user_id])
@@ -14,8 +14,11 @@ from rest_framework.views import APIView
 
 from list.models import ListModel
 from list.serializers import ListSerializer, ListDetailSerializer, ListItemSerializer
+from wishlist.cache import cache_per_user, set_validators
+from wishlist.conditional import (check_if_match, get_detail_validators, get_not_modified, is_conditional,
+                                  set_row_tag)
 from wishlist.models import WishItem
-from wishlist.pagination import WishListPagination, WishItemListPagination
+from wishlist.pagination import ListItemPagination, WishListPagination
 from wishlist.serializers import WishListItemSerializer
 
 
@@ -33,13 +36,14 @@ class ListView(GenericAPIView):
     def get_queryset(self):
         return (
             ListModel.objects
-            .filter(user_id=self.request.user.pk)
+            .filter(user_id=self.request.user.pk, is_deleted=False)
             .only(*['uuid', 'title', 'description', 'image', 'updated_at'])
         )
 
     # Search for all lists created by user
+    @cache_per_user
     def get(self, request: Request) -> Response:
-        qs = self.get_queryset()
+        qs = self.get_queryset().order_by('-updated_at', '-id')
 
         paginated = self.paginate_queryset(queryset=qs)
         serialized = self.serializer_class(instance=paginated, many=True)
@@ -68,24 +72,38 @@ class ListDetailView(GenericAPIView):
     queryset = ListModel.objects.filter(is_deleted=False)
 
     def get(self, request: Request, uuid: str) -> Response:
+        if is_conditional(request):
+            current = get_object_or_404(self.get_queryset().only('updated_at'),
+                                        uuid=uuid,
+                                        is_deleted=False,
+                                        user=request.user)
+            not_modified = get_not_modified(request, current.updated_at)
+            if not_modified is not None:
+                return not_modified
+
         target = get_object_or_404(self.get_queryset(),
                                    uuid=uuid,
                                    is_deleted=False,
                                    user=request.user)
-        serialized = self.serializer_class(instance=target)
+        serialized = self.get_serializer(instance=target)
 
-        return Response(data=serialized.data, status=status.HTTP_200_OK)
+        response = Response(data=serialized.data, status=status.HTTP_200_OK)
+        validators = get_detail_validators(request, target.updated_at)
+        return response if validators is None else set_validators(response, *validators)
 
     def patch(self, request: Request, uuid: str) -> Response:
-        target = get_object_or_404(self.get_queryset(),
-                                   uuid=uuid,
-                                   is_deleted=False,
-                                   user=request.user)
-        serialized = self.serializer_class(instance=target, data=request.data, partial=True)
-        serialized.is_valid(raise_exception=True)
-        serialized.save()
-
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            # Locked, so no other write slips in between the If-Match check and the save
+            target = get_object_or_404(self.get_queryset().select_for_update(),
+                                       uuid=uuid,
+                                       is_deleted=False,
+                                       user=request.user)
+            check_if_match(request, target.updated_at)
+            serialized = self.serializer_class(instance=target, data=request.data, partial=True)
+            serialized.is_valid(raise_exception=True)
+            serialized.save()
+
+        return set_row_tag(Response(status=status.HTTP_204_NO_CONTENT), target.updated_at)
 
     def delete(self, request: Request, uuid: str) -> Response:
         target = get_object_or_404(ListModel.objects.only('uuid', 'is_deleted', 'items'),
@@ -104,22 +122,22 @@ class ListItemView(APIView):
     # TODO: Follow user preferences for permissions
     permission_classes = [IsAuthenticated]
 
+    @cache_per_user
     def get(self, request: Request, uuid: str) -> Response:
         target = get_object_or_404(ListModel.objects.only('uuid', 'items', 'is_deleted'),
                                    uuid=uuid,
                                    is_deleted=False,
                                    user_id=request.user.pk)
-        queryset = (
+        queryset = WishListItemSerializer.setup_eager_loading(
             target.items.filter(user_id=request.user.pk, deleted_at__isnull=True)
-            .order_by('-created_at')
-            .only(*WishListItemSerializer.Meta.fields)
+            .order_by('-created_at', '-id')
         )
 
         if request.query_params.get('starred', None):
             queryset = queryset.filter(is_starred=True)
-        paginator = WishItemListPagination()
+        paginator = ListItemPagination()
         paginated = paginator.paginate_queryset(queryset=queryset, request=request, view=self)
-        serialized = WishListItemSerializer(instance=paginated, many=True)
+        serialized = WishListItemSerializer(instance=paginated, many=True, context={'request': request})
 
         return paginator.get_paginated_response(data=serialized.data)
 
@@ -1,6 +1,7 @@
 import secrets
 from typing import Any, Generator
 
+import fakeredis
 import pytest
 from allauth.account.models import EmailAddress
 from pytest_django import DjangoDbBlocker
@@ -105,3 +106,16 @@ def sample_wishlist_item(authenticated_client: APIClient, sample_wishlist_data:
                                          content_type='application/json')
     assert response.status_code == HTTP_201_CREATED
     return response.data
+
+@pytest.fixture
+def response_cache(monkeypatch: pytest.MonkeyPatch) -> fakeredis.FakeRedis:
+    """
+    Backs the response cache with an in-memory Redis. (fakeredis, with Lua support)
+    :param monkeypatch: Pytest monkeypatch fixture
+    :return: FakeRedis instance
+    """
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr('wishlist.cache.get_redis', lambda: client)
+    for script in ('_store_script', '_bump_script', '_init_script'):
+        monkeypatch.setattr(f'wishlist.cache.{script}', None)
+    return client
@@ -0,0 +1,47 @@
+import logging
+from datetime import timedelta
+
+import pytest
+import requests
+from django.utils import timezone
+
+from crawler import tasks
+from crawler.breaker import TargetUnavailable
+from crawler.models import CrawlResult
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.parametrize('failure', ['network', 'server', 'breaker'])
+def test_stale_result_is_served_on_error(monkeypatch, failure: str) -> None:
+    """
+    Tests that a stale crawl result is returned as it is when its revalidation fails,
+    instead of losing the data the item already had. (stale-if-error)
+    :param monkeypatch: pytest monkeypatch fixture
+    :param failure: (Parameter for test) How the revalidation fails
+    :return:
+    """
+    url = 'https://shop.example.com/products/1'
+    cached = CrawlResult(url=url, data={'title': 'Cached'}, etag='"v1"',
+                         expires_at=timezone.now() - timedelta(hours=1))
+
+    def ensure_available(url):
+        if failure == 'breaker':
+            raise TargetUnavailable(f'{url} is unavailable')
+
+    def fetch(url, headers=None, timeout=None, stream=False):
+        if failure == 'network':
+            raise requests.exceptions.ConnectionError('Connection refused')
+        response = requests.Response()
+        response.status_code = 503
+        response.url = url
+        response.elapsed = timedelta(milliseconds=10)
+        return response
+
+    monkeypatch.setattr(tasks, 'ensure_available', ensure_available)
+    monkeypatch.setattr(tasks, 'record_outcome', lambda url, outcome: None)
+    monkeypatch.setattr(tasks, 'fetch', fetch)
+
+    assert tasks.retrieve_data(url, cached=cached) == {'title': 'Cached'}
+    # Without a cached result there is nothing to serve
+    assert tasks.retrieve_data(url, use_cache=False) is None
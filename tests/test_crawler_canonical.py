@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from crawler.canonical import canonicalize_url, get_canonical_url, get_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.parametrize('variant', [
+    'https://shop.example.com/products/123',
+    'http://shop.example.com/products/123',
+    'https://SHOP.example.com:443/products/123/',
+    'https://www.shop.example.com/products/123?utm_source=newsletter&utm_medium=email',
+    'https://m.shop.example.com/products//123?fbclid=abc#reviews',
+])
+def test_url_variants_share_fingerprint(variant: str) -> None:
+    """
+    Tests that scheme, host case, default ports, www/mobile hosts, trailing slashes,
+    tracking parameters and fragments do not change the fingerprint of a URL.
+    :param variant: (Parameter for test) A spelling of the same product URL
+    :return:
+    """
+    assert get_fingerprint(variant) == get_fingerprint('https://shop.example.com/products/123')
+    assert len(get_fingerprint(variant)) == 64
+
+
+def test_meaningful_query_is_kept() -> None:
+    """
+    Tests that query parameters selecting a product are kept (in sorted order).
+    :return:
+    """
+    assert canonicalize_url('https://shop.example.com/item?variant=2&id=7&gclid=x') == \
+           'https://shop.example.com/item?id=7&variant=2'
+    assert get_fingerprint('https://shop.example.com/item?id=7') != get_fingerprint('https://shop.example.com/item?id=8')
+
+
+def test_invalid_port_is_ignored() -> None:
+    """
+    Tests that a port out of range, which URLValidator accepts, is left out of the canonical form
+    instead of raising.
+    :return:
+    """
+    assert canonicalize_url('https://shop.example.com:99999/item') == 'https://shop.example.com/item'
+    assert canonicalize_url('https://shop.example.com:8080/item') == 'https://shop.example.com:8080/item'
+
+
+def test_get_canonical_url() -> None:
+    """
+    Tests that the declared canonical URL is resolved against the page, and that declarations
+    pointing to the home page or to another site are ignored.
+    :return:
+    """
+    page = 'https://m.shop.example.com/p/1?ref_src=app'
+    assert get_canonical_url(page, {'canonical_url': '/products/1'}) == 'https://m.shop.example.com/products/1'
+    assert get_canonical_url(page, {'url': 'https://www.shop.example.com/products/1'}) == \
+           'https://www.shop.example.com/products/1'
+    assert get_canonical_url(page, {'canonical_url': 'https://shop.example.com/'}) is None
+    assert get_canonical_url(page, {'canonical_url': 'https://other.example.net/products/1'}) is None
@@ -0,0 +1,44 @@
+import logging
+import socket
+
+from crawler import client
+
+logger = logging.getLogger(__name__)
+
+
+def test_dns_cache_is_bounded_and_scoped(settings, monkeypatch) -> None:
+    """
+    Tests that the DNS cache of the crawler keeps at most CRAWLER_DNS_CACHE_SIZE answers, evicting
+    the least recently used one, drops expired answers, and leaves socket.getaddrinfo of the process alone.
+    :param settings: Django settings fixture
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    settings.CRAWLER_DNS_CACHE_TTL = 60
+    settings.CRAWLER_DNS_CACHE_SIZE = 2
+    lookups = []
+    now = [1000.0]
+
+    def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+
+    monkeypatch.setattr(client.socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(client.time, 'monotonic', lambda: now[0])
+    client.clear_dns_cache()
+    try:
+        for host in ('a.example.com', 'b.example.com', 'a.example.com', 'c.example.com', 'a.example.com'):
+            client._resolve(host, 443)
+        # b was the least recently used when c came in
+        assert lookups == ['a.example.com', 'b.example.com', 'c.example.com']
+        assert [key[0] for key in client._dns_cache] == ['c.example.com', 'a.example.com']
+
+        now[0] += 61
+        client._resolve('d.example.com', 443)
+        assert [key[0] for key in client._dns_cache] == ['d.example.com']
+    finally:
+        client.clear_dns_cache()
+
+    assert socket.getaddrinfo is getaddrinfo
+    client.get_session()
+    assert socket.getaddrinfo is getaddrinfo
@@ -0,0 +1,127 @@
+import logging
+from decimal import Decimal
+
+import pytest
+
+from account.models import WishListUser
+from crawler import tasks
+from crawler.enrichment import get_prices, merge_metadata
+from wishlist.models import WishItem, ItemSource
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = {
+    'title': 'Primary Title',
+    'description': 'Short',
+    'image': 'https://shop.example.com/small.png',
+    'image:width': '200', 'image:height': '200',
+    'price:amount': '19.99', 'price:currency': 'usd',
+}
+MIRROR = {
+    'title': 'Mirror Title',
+    'description': 'A much longer description of the product',
+    'image': ['https://mirror.example.com/large.png'],
+    'image:width': ['1200'], 'image:height': ['800'],
+    'products': [{'offers': [{'lowPrice': '15', 'highPrice': '1,299.50', 'priceCurrency': 'USD'},
+                             {'price': '9', 'priceCurrency': 'EUR'}]}],
+}
+
+
+def test_merge_metadata_precedence() -> None:
+    """
+    Tests that the merged metadata takes the title of the first page, the longest description,
+    the largest image and the price range in the currency of the first page declaring a price.
+    :return:
+    """
+    assert get_prices({'price:amount': 'free'}) == []
+    assert get_prices({'price:amount': '1e20'}) == []
+
+    merged = merge_metadata([PRIMARY, MIRROR])
+    assert merged['title'] == 'Primary Title'
+    assert merged['description'] == MIRROR['description']
+    assert merged['image'] == 'https://mirror.example.com/large.png'
+    assert merged['price_min'] == Decimal('15.00')
+    assert merged['price_max'] == Decimal('1299.50')
+    assert merged['price_currency'] == 'USD'
+
+    # Undeclared sizes leave the image to the first page
+    merged = merge_metadata([{'image': 'https://a.example.com/1.png'}, {'image': 'https://b.example.com/2.png'}])
+    assert merged == {'image': 'https://a.example.com/1.png'}
+
+
+@pytest.mark.django_db
+def test_enrich_item_fetches_all_sources_at_once(admin_user: WishListUser, monkeypatch) -> None:
+    """
+    Tests that all sources of an item are fetched in a single concurrent batch, and that the merged
+    metadata and the products of every source are saved with the item.
+    :param admin_user: A WishListUser instance (admin)
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    primary_url = 'https://shop.example.com/products/1'
+    mirror_url = 'https://mirror.example.com/p/1'
+    batches = []
+
+    def retrieve_data_many(urls):
+        batches.append(sorted(urls))
+        return {primary_url: PRIMARY, mirror_url: MIRROR}
+
+    monkeypatch.setattr(tasks, 'retrieve_data_many', retrieve_data_many)
+    monkeypatch.setattr(tasks, 'get_cached_result', lambda url: None)
+    monkeypatch.setattr(tasks, 'is_allowed', lambda url: True)
+    monkeypatch.setattr(tasks, 'acquire', lambda url, reserve=False: 0)
+
+    item = WishItem.objects.create(user=admin_user, title='')
+    for url, is_primary in ((primary_url, True), (mirror_url, False)):
+        source = ItemSource(wish_item=item, source_url=url, is_primary=is_primary)
+        source.set_fingerprint()
+        source.save()
+
+    tasks.enrich_item(item.pk, True)
+
+    assert batches == [sorted([primary_url, mirror_url])]
+    item.refresh_from_db()
+    assert item.enriched_title == 'Primary Title'
+    assert item.enriched_description == MIRROR['description']
+    assert (item.price_min, item.price_max, item.price_currency) == (Decimal('15.00'), Decimal('1299.50'), 'USD')
+    assert item.enriched_at is not None
+    assert not item.sources.filter(product__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_enrich_item_defers_only_reserved_sources(admin_user: WishListUser, monkeypatch) -> None:
+    """
+    Tests that a deferred enrichment fetches only the sources whose slot was reserved,
+    and never the sources robots.txt disallows.
+    :param admin_user: A WishListUser instance (admin)
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    primary_url = 'https://shop.example.com/products/1'
+    mirror_url = 'https://mirror.example.com/p/1'
+    blocked_url = 'https://blocked.example.com/p/1'
+    deferred = []
+    batches = []
+
+    def retrieve_data_many(urls):
+        batches.append(sorted(urls))
+        return {primary_url: PRIMARY, mirror_url: MIRROR}
+
+    monkeypatch.setattr(tasks, 'retrieve_data_many', retrieve_data_many)
+    monkeypatch.setattr(tasks, 'get_cached_result', lambda url: None)
+    monkeypatch.setattr(tasks, 'is_allowed', lambda url: url != blocked_url)
+    monkeypatch.setattr(tasks, 'acquire', lambda url, reserve=False: 2.0 if url == mirror_url else 0)
+    monkeypatch.setattr(tasks.enrich_item, 'apply_async', lambda args, kwargs, countdown: deferred.append(kwargs))
+
+    item = WishItem.objects.create(user=admin_user, title='')
+    for url, is_primary in ((primary_url, True), (mirror_url, False), (blocked_url, False)):
+        source = ItemSource(wish_item=item, source_url=url, is_primary=is_primary)
+        source.set_fingerprint()
+        source.save()
+
+    tasks.enrich_item(item.pk, True)
+    assert not batches
+    assert deferred == [{'reserved_urls': [primary_url, mirror_url]}]
+
+    tasks.enrich_item(item.pk, True, **deferred[0])
+    assert batches == [sorted([primary_url, mirror_url])]
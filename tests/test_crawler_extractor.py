@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+from crawler.extractor import extract_head
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_HEAD = b'''<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Sample Product - Sample Market</title>
+    <meta property="og:title" content="Sample Product">
+    <meta property="og:image" content="https://example.com/a.jpg">
+    <meta property="og:image" content="https://example.com/b.jpg">
+    <meta name="twitter:description" content="Twitter description">
+    <link rel="canonical" href="https://example.com/products/1">
+    <script type="application/ld+json">
+        {"@context": "https://schema.org", "@graph": [{"@type": "Product", "name": "Sample Product"}]}
+    </script>
+</head>
+<body>
+'''
+
+
+def split_chunks(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1024])
+def test_extract_head_collects_metadata(chunk_size: int) -> None:
+    """
+    Tests that the streaming extractor collects OpenGraph, Twitter, canonical and JSON-LD data
+    regardless of how the page is split into chunks.
+    :param chunk_size: (Parameter for test) The size of chunks fed to the extractor
+    :return:
+    """
+    metadata = extract_head(split_chunks(SAMPLE_HEAD, chunk_size), max_bytes=1024 * 1024)
+    data = metadata.to_data()
+
+    assert metadata.complete
+    assert data['title'] == 'Sample Product'
+    assert data['image'] == ['https://example.com/a.jpg', 'https://example.com/b.jpg']
+    assert data['description'] == 'Twitter description'
+    assert data['canonical_url'] == 'https://example.com/products/1'
+    assert data['products'][0]['name'] == 'Sample Product'
+
+
+def test_extract_head_stops_at_head_end() -> None:
+    """
+    Tests that the extractor stops consuming chunks once </head> is parsed.
+    :return:
+    """
+    consumed = []
+
+    def chunks():
+        for chunk in split_chunks(SAMPLE_HEAD + b'<p>body</p>' * 10000, 512):
+            consumed.append(chunk)
+            yield chunk
+
+    extract_head(chunks(), max_bytes=10 * 1024 * 1024)
+    assert sum(len(c) for c in consumed) < len(SAMPLE_HEAD) + 1024
+
+
+def test_extract_head_respects_byte_budget() -> None:
+    """
+    Tests that the extractor does not read more than the byte budget when </head> never comes.
+    :return:
+    """
+    page = b'<html><head><title>Endless</title>' + b'<meta name="x" content="y">' * 10000
+    buffer = bytearray()
+    metadata = extract_head(split_chunks(page, 4096), max_bytes=8192, buffer=buffer)
+
+    assert not metadata.complete
+    assert metadata.bytes_read == 8192
+    assert len(buffer) == 8192
+    assert metadata.to_data()['title'] == 'Endless'
+
+
+def test_extract_head_falls_back_to_title() -> None:
+    """
+    Tests that <title> is used when a page has no OpenGraph or Twitter title.
+    :return:
+    """
+    page = b'<html><head><title>Only Title</title><meta name="description" content="Desc"></head></html>'
+    data = extract_head([page], max_bytes=1024).to_data()
+
+    assert data['title'] == 'Only Title'
+    assert data['description'] == 'Desc'
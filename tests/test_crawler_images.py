@@ -0,0 +1,149 @@
+import logging
+from datetime import timedelta
+from io import BytesIO
+
+import pytest
+import requests
+from PIL import Image
+from requests.structures import CaseInsensitiveDict
+
+from crawler import images
+from crawler.crawler import sniff_image_type
+from crawler.images import ImageCandidate, ImageTooLarge, pick_image, probe_image, validate_image_headers
+from crawler.tasks import validate_page_headers
+
+logger = logging.getLogger(__name__)
+
+
+def encode_image(fmt: str, size: tuple[int, int] = (8, 8)) -> bytes:
+    buffer = BytesIO()
+    Image.new('RGB', size, color='red').save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('fmt, content_type', [
+    ('JPEG', 'image/jpeg'),
+    ('PNG', 'image/png'),
+    ('GIF', 'image/gif'),
+    ('WEBP', 'image/webp'),
+])
+def test_sniff_image_type(fmt: str, content_type: str) -> None:
+    """
+    Tests that image types are recognized from the magic bytes at the start of the file.
+    :param fmt: (Parameter for test) The format Pillow encodes the image in
+    :param content_type: (Parameter for test) The expected content type
+    :return:
+    """
+    assert sniff_image_type(encode_image(fmt)[:64]) == content_type
+
+
+def test_sniff_image_type_avif_brand() -> None:
+    """
+    Tests that AVIF is recognized by a compatible brand of the ftyp box, not only the major brand.
+    :return:
+    """
+    ftyp = (28).to_bytes(4, 'big') + b'ftypmif1' + b'\x00\x00\x00\x00' + b'mif1avifmiaf'
+    assert sniff_image_type(ftyp) == 'image/avif'
+
+
+@pytest.mark.parametrize('head', [
+    b'<!DOCTYPE html><html><head>',
+    b'%PDF-1.7\n',
+    b'<svg xmlns="http://www.w3.org/2000/svg">',
+    b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom',
+    b'',
+])
+def test_sniff_image_type_rejects_other_files(head: bytes) -> None:
+    """
+    Tests that pages, documents, SVG and videos are not taken for images.
+    :param head: (Parameter for test) The first bytes of the file
+    :return:
+    """
+    assert sniff_image_type(head) is None
+
+
+def test_probe_image_reads_only_the_header(monkeypatch) -> None:
+    """
+    Tests that a probe asks for the first bytes of the image only, and reads its dimensions from them
+    and its full size from the Content-Range header.
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    content = encode_image('PNG', (640, 480))
+    sent = {}
+
+    def fetch(url, headers=None, stream=False):
+        sent.update(headers)
+        response = requests.Response()
+        response.status_code = 206
+        response.headers = CaseInsensitiveDict({'content-type': 'image/png',
+                                                'content-range': f'bytes 0-1023/{len(content)}'})
+        response.raw = BytesIO(content[:1024])
+        response.elapsed = timedelta()
+        return response
+
+    monkeypatch.setattr(images, 'fetch', fetch)
+    monkeypatch.setattr(images, 'ensure_available', lambda url: None)
+    candidate = probe_image('https://example.com/a.png', probe_bytes=1024)
+
+    assert sent['Range'] == 'bytes=0-1023'
+    assert (candidate.format, candidate.width, candidate.height) == ('PNG', 640, 480)
+    assert candidate.size == len(content)
+
+
+def test_pick_image_within_budget(settings) -> None:
+    """
+    Tests that the largest image within the budget is picked over logos and oversized originals,
+    and that the smallest image is picked when none fits the budget.
+    :param settings: Django settings fixture
+    :return:
+    """
+    settings.CRAWLER_IMAGE_MAX_BYTES = 10_000_000
+    logo = ImageCandidate('https://example.com/logo.png', 'PNG', 64, 64, 2_000)
+    photo = ImageCandidate('https://example.com/photo.jpg', 'JPEG', 1200, 800, 300_000)
+    original = ImageCandidate('https://example.com/original.jpg', 'JPEG', 6000, 4000, 8_000_000)
+
+    assert pick_image([logo, original, photo], budget=1_000_000) == photo
+    assert pick_image([original, photo], budget=100_000) == photo
+    assert pick_image([], budget=100_000) is None
+
+
+def test_pick_image_prefers_first_on_ties() -> None:
+    """
+    Tests that the first of the candidates of the same area is picked.
+    :return:
+    """
+    first = ImageCandidate('https://example.com/first.jpg', 'JPEG', 800, 600, 100_000)
+    second = ImageCandidate('https://example.com/second.png', 'PNG', 600, 800, 200_000)
+
+    assert pick_image([first, second], budget=1_000_000) == first
+    assert pick_image([second, first], budget=1_000_000) == second
+
+
+@pytest.mark.parametrize('length, too_large', [
+    ('abc', False),
+    ('12, 12', False),
+    ('', False),
+    (' 64 ', False),
+    ('4096', True),
+])
+def test_malformed_content_length_is_unknown(settings, length: str, too_large: bool) -> None:
+    """
+    Tests that a malformed Content-Length is treated as unknown instead of failing the crawl,
+    while a valid one over the limit still rejects the response.
+    :param settings: Django settings fixture
+    :param length: Content-Length header of the response
+    :param too_large: Whether the response must be rejected for its size
+    :return:
+    """
+    settings.CRAWLER_PAGE_MAX_BYTES = 1024
+    response = requests.Response()
+    response.headers = CaseInsensitiveDict({'content-type': 'text/html', 'content-length': length})
+    assert (validate_page_headers(response) is not None) == too_large
+
+    response.headers['content-type'] = 'image/png'
+    if too_large:
+        with pytest.raises(ImageTooLarge):
+            validate_image_headers('https://example.com/a.png', response, 1024)
+    else:
+        validate_image_headers('https://example.com/a.png', response, 1024)
@@ -0,0 +1,46 @@
+import logging
+
+from prometheus_client import REGISTRY
+
+from crawler import metrics
+from crawler.metrics import BODY, OTHER_DOMAIN, MeteredBody, get_domain
+
+logger = logging.getLogger(__name__)
+
+
+def test_metered_body_counts_bytes_and_wait(settings) -> None:
+    """
+    Tests that a metered body passes its chunks through unchanged, and records their size
+    and the time spent waiting for them under the domain of the URL.
+    :param settings: Django settings fixture
+    :return:
+    """
+    url = 'https://www.metered.example.com/products/1'
+    labels = {'kind': 'page', 'domain': 'metered.example.com'}
+    before = REGISTRY.get_sample_value('crawler_transferred_bytes_total', labels) or 0
+
+    body = MeteredBody(iter([b'<html>', b'<head>', b'']), 'page', url)
+    assert b''.join(body) == b'<html><head>'
+    body.record()
+
+    assert body.size == 12
+    assert REGISTRY.get_sample_value('crawler_transferred_bytes_total', labels) == before + 12
+    assert REGISTRY.get_sample_value('crawler_stage_seconds_count',
+                                     {'stage': BODY, 'domain': 'metered.example.com'}) >= 1
+
+
+def test_domain_labels_are_bounded(settings, monkeypatch) -> None:
+    """
+    Tests that hosts beyond CRAWLER_METRICS_MAX_DOMAINS share a single label, while labelled hosts keep theirs.
+    :param settings: Django settings fixture
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    monkeypatch.setattr(metrics, '_domains', set())
+    settings.CRAWLER_METRICS_MAX_DOMAINS = 2
+
+    assert get_domain('https://a.example.com/1') == 'a.example.com'
+    assert get_domain(host='b.example.com') == 'b.example.com'
+    assert get_domain('https://c.example.com/1') == OTHER_DOMAIN
+    assert get_domain('https://www.a.example.com/2') == 'a.example.com'
+    assert get_domain('not a url') == OTHER_DOMAIN
@@ -0,0 +1,63 @@
+import logging
+
+import pytest
+
+from crawler import parsepool
+from crawler.parseworker import OK, TIMEOUT
+from crawler.parsepool import parse_isolated
+
+logger = logging.getLogger(__name__)
+
+PAGE = b'<html><head><meta property="og:title" content="Pooled Product"></head><body></body></html>'
+
+
+@pytest.fixture
+def parse_pool(settings):
+    """
+    Provides a fresh parse pool of a single process, and stops its processes afterwards.
+    :param settings: Django settings fixture
+    :return: Django settings fixture
+    """
+    settings.CRAWLER_PARSE_WORKERS = 1
+    parsepool.close_pool()
+    parsepool._owner_pid = None
+    yield settings
+    parsepool.close_pool()
+
+
+def test_parse_isolated_recycles_processes(parse_pool) -> None:
+    """
+    Tests that pages are parsed in a separate process, which is reused until CRAWLER_PARSE_MAX_TASKS,
+    and that pages over CRAWLER_PARSE_MAX_BYTES are truncated before parsing.
+    :param parse_pool: Settings of the parse pool
+    :return:
+    """
+    parse_pool.CRAWLER_PARSE_MAX_TASKS = 2
+    outcome = parse_isolated(PAGE)
+    assert (outcome.status, outcome.data, outcome.truncated) == (OK, {'title': 'Pooled Product'}, False)
+    first = parsepool._idle[0].process.pid
+
+    parse_pool.CRAWLER_PARSE_MAX_BYTES = 80
+    outcome = parse_isolated(PAGE + b'<!-- padding -->' * 10)
+    assert outcome.truncated and outcome.ok
+    assert not parsepool._idle
+
+    parse_isolated(PAGE)
+    assert parsepool._idle[0].process.pid != first
+
+
+def test_parse_isolated_kills_slow_parses(parse_pool) -> None:
+    """
+    Tests that a parse running past CRAWLER_PARSE_TIMEOUT is reported as a timeout, and that its process
+    is killed and replaced by the next parse.
+    :param parse_pool: Settings of the parse pool
+    :return:
+    """
+    parse_pool.CRAWLER_PARSE_TIMEOUT = 0.01
+    parse_pool.CRAWLER_PARSE_MAX_BYTES = 64 * 1024 * 1024
+    outcome = parse_isolated(b'<html><body>' + b'<div><span>x</span>' * 1_000_000 + b'</body></html>')
+    assert outcome.status == TIMEOUT
+    assert outcome.data is None
+
+    parse_pool.CRAWLER_PARSE_TIMEOUT = 10
+    assert parse_isolated(PAGE).data == {'title': 'Pooled Product'}
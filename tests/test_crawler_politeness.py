@@ -0,0 +1,74 @@
+import io
+import logging
+from collections import OrderedDict
+
+import requests
+
+from crawler import politeness
+from crawler.politeness import is_allowed
+
+logger = logging.getLogger(__name__)
+
+
+def test_robots_server_error_disallows_for_a_while(settings, monkeypatch) -> None:
+    """
+    Tests that a server error for robots.txt disallows the host until CRAWLER_ROBOTS_ERROR_TTL passes,
+    that a client error allows it, and that the parsed rules of at most CRAWLER_ROBOTS_CACHE_SIZE hosts are kept.
+    :param settings: Django settings fixture
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    settings.CRAWLER_RESPECT_ROBOTS = True
+    settings.CRAWLER_ROBOTS_ERROR_TTL = 60
+    settings.CRAWLER_ROBOTS_CACHE_SIZE = 2
+    statuses = {'down.example.com': 503, 'private.example.com': 403}
+    now = [1000.0]
+
+    def fetch(url, headers=None, timeout=None, stream=False):
+        response = requests.Response()
+        response.status_code = statuses.get(politeness.get_host(url), 200)
+        response.raw = io.BytesIO(b'User-agent: *\nAllow: /')
+        return response
+
+    monkeypatch.setattr(politeness, 'fetch', fetch)
+    monkeypatch.setattr(politeness, 'get_redis', lambda: None)
+    monkeypatch.setattr(politeness.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(politeness, '_robots', OrderedDict())
+
+    assert not is_allowed('https://down.example.com/products/1')
+    statuses.clear()
+    assert not is_allowed('https://down.example.com/products/1')
+    now[0] += 61
+    assert is_allowed('https://down.example.com/products/1')
+    # A client error means there are no rules (RFC 9309)
+    assert is_allowed('https://private.example.com/products/1')
+
+    for host in ('a.example.com', 'b.example.com'):
+        assert is_allowed(f'https://{host}/products/1')
+    assert list(politeness._robots) == ['a.example.com', 'b.example.com']
+
+
+def test_robots_body_is_capped(settings, monkeypatch) -> None:
+    """
+    Tests that only the first 500 KiB of robots.txt is read, so a huge file cannot exhaust the worker.
+    :param settings: Django settings fixture
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    settings.CRAWLER_RESPECT_ROBOTS = True
+    # Rules past the cap are ignored
+    body = b'User-agent: *\nDisallow: /private\n' + b'#' * politeness.ROBOTS_MAX_BYTES + b'\nDisallow: /'
+
+    def fetch(url, headers=None, timeout=None, stream=False):
+        assert stream
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(body)
+        return response
+
+    monkeypatch.setattr(politeness, 'fetch', fetch)
+    monkeypatch.setattr(politeness, 'get_redis', lambda: None)
+    monkeypatch.setattr(politeness, '_robots', OrderedDict())
+
+    assert not is_allowed('https://huge.example.com/private/1')
+    assert is_allowed('https://huge.example.com/products/1')
@@ -0,0 +1,44 @@
+import logging
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from account.models import WishListUser
+from crawler.canonical import get_fingerprint
+from crawler.tasks import get_refresh_priority
+from wishlist.models import WishItem, ItemSource, Product
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.django_db
+def test_refresh_priority_order(admin_user: WishListUser) -> None:
+    """
+    Tests that products never crawled come first, then products whose metadata changes often,
+    and that a product viewed recently by an owner is preferred over an equally stale one.
+    :param admin_user: A WishListUser instance (admin)
+    :return:
+    """
+    now = timezone.now()
+    three_days_ago = now - timedelta(days=3)
+    specs = {
+        'never-crawled': dict(last_crawled_at=None),
+        'changes-often': dict(last_crawled_at=three_days_ago, crawl_count=10, change_count=9),
+        'viewed': dict(last_crawled_at=three_days_ago, crawl_count=10, viewed=now - timedelta(hours=1)),
+        'rarely-changes': dict(last_crawled_at=three_days_ago, crawl_count=10),
+        'fresh': dict(last_crawled_at=now - timedelta(hours=1)),
+    }
+    for name, spec in specs.items():
+        url = f'https://example.com/{name}'
+        viewed = spec.pop('viewed', None)
+        product = Product.objects.create(fingerprint=get_fingerprint(url), url=url, title=name, **spec)
+        item = WishItem.objects.create(user=admin_user, title=name, last_viewed_at=viewed)
+        ItemSource.objects.create(wish_item=item, source_url=url, is_primary=True, product=product)
+
+    ordered = (Product.objects
+               .filter(url__startswith='https://example.com/')
+               .annotate(priority=get_refresh_priority(now))
+               .order_by('-priority')
+               .values_list('title', flat=True))
+    assert list(ordered) == list(specs.keys())
@@ -0,0 +1,106 @@
+import logging
+
+import fakeredis
+import pytest
+
+from account.models import WishListUser
+from crawler import singleflight, tasks
+from crawler.cache import get_url_key
+from crawler.models import StagedCrawl
+from wishlist.models import WishItem
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    def retry(self, **kwargs):
+        raise AssertionError('The crawl must not be deferred')
+
+
+@pytest.mark.parametrize('disallowed', [True, False])
+def test_failed_crawl_reschedules_waiters(monkeypatch, disallowed: bool) -> None:
+    """
+    Tests that the items which joined a crawl in flight are crawled again when the crawl
+    is disallowed or fails, instead of waiting for the flight to expire.
+    :param monkeypatch: pytest monkeypatch fixture
+    :param disallowed: Whether robots.txt disallows the URL, or the fetch fails
+    :return:
+    """
+    url = 'https://shop.example.com/products/1'
+    scheduled = []
+    monkeypatch.setattr(tasks, 'get_cached_result', lambda url: None)
+    monkeypatch.setattr(tasks, 'join_flight', lambda url, id: True)
+    monkeypatch.setattr(tasks, 'leave_flight', lambda url, id: [7, 8])
+    monkeypatch.setattr(tasks, 'is_allowed', lambda url: not disallowed)
+    monkeypatch.setattr(tasks, 'acquire', lambda url, reserve=False: 0)
+    monkeypatch.setattr(tasks, 'retrieve_data', lambda url, cached=None: None)
+    monkeypatch.setattr(tasks, 'schedule_crawl', lambda url, id, skip_image=False: scheduled.append((url, id)))
+
+    if disallowed:
+        assert tasks.retrieve_item_data(_Task(), url, 1) is None
+    else:
+        with pytest.raises(ValueError):
+            tasks.retrieve_item_data(_Task(), url, 1)
+    assert scheduled == [(url, 7), (url, 8)]
+
+
+@pytest.mark.django_db
+def test_failed_image_stage_reschedules_waiters(admin_user: WishListUser, monkeypatch) -> None:
+    """
+    Tests that the items which joined a crawl in flight are crawled again when the staged image
+    download fails after the page was crawled, as save_data never runs for it.
+    :param admin_user: A WishListUser instance (admin)
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    url = 'https://shop.example.com/products/1'
+    scheduled = []
+
+    def ingest_image(url, headers=None):
+        raise RuntimeError('Corrupted image')
+
+    monkeypatch.setattr(tasks, 'find_image_by_url', lambda url: None)
+    monkeypatch.setattr(tasks, 'is_allowed', lambda url: True)
+    monkeypatch.setattr(tasks, 'acquire', lambda url, reserve=False: 0)
+    monkeypatch.setattr(tasks, 'ingest_image', ingest_image)
+    monkeypatch.setattr(tasks, 'leave_flight', lambda url, id: [7] if id == item.pk else [])
+    monkeypatch.setattr(tasks, 'schedule_crawl', lambda url, id, skip_image=False: scheduled.append((url, id)))
+
+    item = WishItem.objects.create(user=admin_user, title='')
+    staged = StagedCrawl.objects.create(wish_item=item, url=url, data={'title': 'Title'},
+                                        image_url='https://shop.example.com/1.png')
+    with pytest.raises(RuntimeError):
+        tasks.retrieve_image_from_url(staged.pk)
+    assert scheduled == [(url, 7)]
+
+
+def test_vanished_leader_waiters_are_recovered(monkeypatch) -> None:
+    """
+    Tests that the waiters of a flight whose leader vanished are served by the next leader
+    before the flight expires, and re-scheduled by the sweep after it expired.
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(singleflight, 'get_redis', lambda: client)
+    for script in ('_join_script', '_leave_script', '_recover_script'):
+        monkeypatch.setattr(singleflight, script, None)
+    url = 'https://shop.example.com/products/1'
+
+    assert singleflight.join_flight(url, 1)
+    assert not singleflight.join_flight(url, 2)
+    assert singleflight.recover_flights() == {}
+
+    # The leader vanished, and its flight expired
+    client.delete(singleflight.FLIGHT_KEY_PREFIX + get_url_key(url))
+    client.zadd(singleflight.FLIGHTS_KEY, {url: 0})
+    assert singleflight.recover_flights() == {url: [2]}
+    assert singleflight.recover_flights() == {}
+
+    # The next leader serves the waiters left by the previous one
+    assert singleflight.join_flight(url, 3)
+    assert not singleflight.join_flight(url, 4)
+    client.delete(singleflight.FLIGHT_KEY_PREFIX + get_url_key(url))
+    assert singleflight.join_flight(url, 5)
+    assert singleflight.leave_flight(url, 5) == [4]
+    assert singleflight.recover_flights() == {}
@@ -0,0 +1,76 @@
+import logging
+import zlib
+
+import pytest
+
+from crawler.canonical import get_fingerprint
+from crawler.management.commands.reextract_snapshots import Command
+from crawler.models import PageSnapshot
+from crawler.snapshots import ZLIB, ZSTD, compress, decompress, save_snapshot
+from crawler.tasks import extract_snapshot
+from wishlist.models import Product
+
+logger = logging.getLogger(__name__)
+
+PAGE = (b'<html><head><title>Fallback</title>'
+        b'<meta property="og:title" content="Snapshot Product">'
+        b'<meta property="og:image" content="https://example.com/a.png">'
+        b'</head><body>' + b'<p>body</p>' * 100 + b'</body></html>')
+
+
+def test_snapshot_codecs_round_trip() -> None:
+    """
+    Tests that snapshot content survives compression with zstd, and that zlib snapshots written before
+    stay readable.
+    :return:
+    """
+    codec, compressed = compress(PAGE)
+    assert codec == ZSTD
+    assert len(compressed) < len(PAGE)
+    assert decompress(codec, compressed) == PAGE
+    assert decompress(ZLIB, zlib.compress(PAGE)) == PAGE
+    with pytest.raises(ValueError):
+        decompress('lz4', compressed)
+
+
+@pytest.mark.django_db
+def test_snapshot_is_reextracted_offline(settings) -> None:
+    """
+    Tests that a saved snapshot is capped, replaced by the next crawl of the URL, and yields the same
+    metadata as the crawl when extracted again.
+    :param settings: Django settings fixture
+    :return:
+    """
+    settings.CRAWLER_SNAPSHOT_MAX_BYTES = 300
+    url = 'https://example.com/products/snapshot'
+    save_snapshot(url, b'<html></html>')
+    save_snapshot(url + '?utm_source=mail', PAGE, 'utf-8')
+
+    snapshot = PageSnapshot.objects.get()
+    assert snapshot.size == 300
+    assert snapshot.encoding == 'utf-8'
+
+    content = decompress(snapshot.codec, bytes(snapshot.content))
+    data = extract_snapshot(snapshot.url, content, snapshot.encoding)
+    assert data['title'] == 'Snapshot Product'
+    assert data['image'] == 'https://example.com/a.png'
+
+
+@pytest.mark.django_db
+def test_reextracted_data_updates_products_by_fingerprint() -> None:
+    """
+    Tests that re-extracted data reaches the products of the page, found by the fingerprint of the
+    canonical URL the page declares or of the crawled URL.
+    :return:
+    """
+    url = 'https://shop.example.com/products/1?utm_source=mail'
+    canonical = 'https://shop.example.com/p/1'
+    crawled = Product.objects.create(fingerprint=get_fingerprint(url), url=url, data={'title': 'Old'})
+    declared = Product.objects.create(fingerprint=get_fingerprint(canonical), url=url, data={'title': 'Old'})
+    data = {'title': 'New', 'canonical_url': canonical}
+
+    Command().write_results({'key': (url, data)}, dry_run=False)
+
+    for product in (crawled, declared):
+        product.refresh_from_db()
+        assert (product.title, product.data) == ('New', data)
@@ -0,0 +1,48 @@
+import logging
+
+import pytest
+from rest_framework.status import (HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_304_NOT_MODIFIED,
+                                   HTTP_412_PRECONDITION_FAILED)
+from rest_framework.test import APIClient
+
+from account.models import WishListUser
+from list.models import ListModel
+from wishlist.models import WishItem
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.django_db
+def test_conditional_list_detail(authenticated_client: APIClient,
+                                 admin_user: WishListUser,
+                                 response_cache,
+                                 django_capture_on_commit_callbacks) -> None:
+    """
+    Tests that a revalidation of an unchanged list gets 304 Not Modified, that adding an item to the list
+    changes its ETag, and that a write with a stale If-Match gets 412.
+    :param authenticated_client: An authenticated APIClient instance
+    :param admin_user: A WishListUser instance (admin)
+    :param response_cache: In-memory Redis of the response cache
+    :param django_capture_on_commit_callbacks: Fixture running the on_commit callbacks of the test transaction
+    :return:
+    """
+    target = ListModel.objects.create(user=admin_user, title='Birthday')
+    url = f'/api/list/{target.uuid}/'
+    response = authenticated_client.get(url)
+    assert response.status_code == HTTP_200_OK
+    etag = response['ETag']
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_304_NOT_MODIFIED
+
+    with django_capture_on_commit_callbacks(execute=True):
+        target.items.add(WishItem.objects.create(user=admin_user, title='Camera'))
+    changed = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert changed.status_code == HTTP_200_OK
+    assert changed.data['item_count'] == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        patched = authenticated_client.patch(url, data={'title': 'Anniversary'}, format='json',
+                                             HTTP_IF_MATCH=changed['ETag'])
+    assert patched.status_code == HTTP_204_NO_CONTENT
+    stale = authenticated_client.patch(url, data={'title': 'Wedding'}, format='json', HTTP_IF_MATCH=etag)
+    assert stale.status_code == HTTP_412_PRECONDITION_FAILED
+    assert ListModel.objects.get(pk=target.pk).title == 'Anniversary'
@@ -0,0 +1,120 @@
+import logging
+
+import pytest
+from rest_framework.status import HTTP_202_ACCEPTED, HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST
+from rest_framework.test import APIClient
+
+from crawler import tasks
+from crawler.canonical import get_fingerprint
+from wishlist.models import WishItem, ItemSource, ImportJob, Product
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.django_db
+def test_import_wishlist_items(authenticated_client: APIClient) -> None:
+    """
+    Tests importing product URLs creates an item with a primary source for each unique URL,
+    and a job reporting the progress of the import.
+    :param authenticated_client: An authenticated APIClient instance
+    :return:
+    """
+    urls = ['https://example.com/products/1',
+            'https://example.com/products/2',
+            'https://example.com/products/1']
+    response = authenticated_client.post('/api/item/import',
+                                         data={'urls': urls},
+                                         format='json')
+    assert response.status_code == HTTP_202_ACCEPTED
+    assert response.data['total'] == 2
+
+    job = ImportJob.objects.get(uuid=response.data['uuid'])
+    sources = ItemSource.objects.filter(wish_item__user=job.user, source_url__in=urls, is_primary=True)
+    assert sources.count() == 2
+    assert not WishItem.objects.filter(pk__in=sources.values('wish_item'), title__gt='').exists()
+
+    response = authenticated_client.get(f'/api/item/import/{job.uuid}')
+    assert response.status_code == HTTP_200_OK
+    assert response.data['processed'] + response.data['failed'] <= response.data['total']
+
+
+@pytest.mark.django_db
+def test_import_rejects_invalid_urls(authenticated_client: APIClient) -> None:
+    """
+    Tests that an import with an invalid URL is rejected without creating any item.
+    :param authenticated_client: An authenticated APIClient instance
+    :return:
+    """
+    count = WishItem.objects.count()
+    response = authenticated_client.post('/api/item/import',
+                                         data={'urls': ['https://example.com/a', 'not a url']},
+                                         format='json')
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert WishItem.objects.count() == count
+
+
+@pytest.mark.django_db
+def test_imported_item_shows_product_metadata(authenticated_client: APIClient) -> None:
+    """
+    Tests that an imported item shows the crawled metadata of its product, and that fields
+    set by the owner take precedence over it.
+    :param authenticated_client: An authenticated APIClient instance
+    :return:
+    """
+    url = 'https://example.com/products/3'
+    response = authenticated_client.post('/api/item/import', data={'urls': [url]}, format='json')
+    assert response.status_code == HTTP_202_ACCEPTED
+
+    source = ItemSource.objects.get(source_url=url, is_primary=True)
+    product = Product.objects.create(fingerprint=get_fingerprint(url), url=url,
+                                     title='Crawled title', description='Crawled description')
+    source.product = product
+    source.save()
+
+    item_uuid = source.wish_item.uuid
+    response = authenticated_client.get(f'/api/item/{item_uuid}')
+    assert response.status_code == HTTP_200_OK
+    assert response.data['title'] == 'Crawled title'
+    assert response.data['description'] == 'Crawled description'
+
+    response = authenticated_client.patch(f'/api/item/{item_uuid}', data={'title': 'My title'}, format='json')
+    assert response.status_code == HTTP_204_NO_CONTENT
+    response = authenticated_client.get(f'/api/item/{item_uuid}')
+    assert response.data['title'] == 'My title'
+    assert response.data['description'] == 'Crawled description'
+
+
+@pytest.mark.django_db
+def test_failed_import_chunk_completes_job(authenticated_client: APIClient, monkeypatch) -> None:
+    """
+    Tests that a chunk which raises counts its items as failed, so the job completes
+    instead of staying running forever.
+    :param authenticated_client: An authenticated APIClient instance
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    urls = ['https://example.com/products/4', 'https://example.com/products/5']
+    response = authenticated_client.post('/api/item/import', data={'urls': urls}, format='json')
+    assert response.status_code == HTTP_202_ACCEPTED
+    job = ImportJob.objects.get(uuid=response.data['uuid'])
+    item_ids = list(ItemSource.objects
+                    .filter(wish_item__user=job.user, source_url__in=urls, is_primary=True)
+                    .values_list('wish_item_id', flat=True))
+
+    def retrieve_data_many(urls):
+        raise RuntimeError('Worker lost its connection')
+
+    monkeypatch.setattr(tasks, 'get_cached_result', lambda url: None)
+    monkeypatch.setattr(tasks, 'is_allowed', lambda url: True)
+    monkeypatch.setattr(tasks, 'acquire', lambda url, reserve=False: 0)
+    monkeypatch.setattr(tasks, 'retrieve_data_many', retrieve_data_many)
+    ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.Status.RUNNING, processed=0, failed=0,
+                                               finished_at=None)
+
+    with pytest.raises(RuntimeError):
+        tasks.import_chunk(job.pk, item_ids)
+
+    job.refresh_from_db()
+    assert job.failed == len(item_ids)
+    assert job.status == ImportJob.Status.COMPLETED
+    assert job.finished_at is not None
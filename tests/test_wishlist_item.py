@@ -1,11 +1,20 @@
 import logging
 
 import pytest
-from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK, HTTP_204_NO_CONTENT
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.status import (HTTP_201_CREATED, HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_304_NOT_MODIFIED,
+                                   HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_412_PRECONDITION_FAILED)
 from rest_framework.test import APIClient
 
 from account.models import WishListUser
-from wishlist.models import WishItem
+from crawler.canonical import get_fingerprint
+from list.models import ListModel
+from wishlist import cache
+from wishlist.models import WishItem, ItemSource, BlobImage, Product
+from wishlist.pagination import MAX_PAGE_SIZE
+from wishlist.serializers import WishListItemSerializer
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +80,105 @@ def test_retrieve_wishlist_items(authenticated_client: APIClient,
     assert response.status_code == HTTP_200_OK
     assert len(response.data['results']) > 0
 
+@pytest.mark.django_db
+def test_list_wishlist_items_query_count(authenticated_client: APIClient, admin_user: WishListUser) -> None:
+    """
+    Tests that a page of the wishlist costs the same number of queries whatever its size,
+    with the images, primary sources and products of the items in the page.
+    :param authenticated_client: An authenticated APIClient instance
+    :param admin_user: A WishListUser instance (admin)
+    :return:
+    """
+    for i in range(20):
+        url = f'https://example.com/products/{i}'
+        image = BlobImage.objects.create(sha256_hash=f'{i:064x}', image=f'images/{i}.png')
+        product = Product.objects.create(fingerprint=f'{i:064x}', url=url, title=f'Product {i}', image=image)
+        item = WishItem.objects.create(user=admin_user, title='' if i % 2 else f'Item {i}',
+                                       image=image if i % 3 == 0 else None)
+        ItemSource.objects.create(wish_item=item, source_url=url, is_primary=True, product=product)
+        ItemSource.objects.create(wish_item=item, source_url=url + '/mirror', is_primary=False)
+
+    counts = []
+    for limit in (2, 20):
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(f'/api/item/?limit={limit}')
+        assert response.status_code == HTTP_200_OK
+        assert len(response.data['results']) == limit
+        # Leave out the queries of the profiler (django-silk), which vary from request to request
+        counts.append(len([q for q in queries.captured_queries
+                           if 'silk_' not in q['sql'] and not q['sql'].startswith('EXPLAIN')]))
+
+    assert counts[0] == counts[1]
+    for result in response.data['results']:
+        assert result['title'] and result['image']
+        assert result['primary_source_url'].startswith('https://example.com/products/')
+        assert not result['primary_source_url'].endswith('/mirror')
+
+@pytest.mark.django_db
+def test_list_wishlist_items_by_cursor(authenticated_client: APIClient, admin_user: WishListUser) -> None:
+    """
+    Tests that cursor pages walk the whole wishlist in order without repeating or skipping items,
+    including items updated at the same instant, and that both pagination modes cap the page size.
+    :param authenticated_client: An authenticated APIClient instance
+    :param admin_user: A WishListUser instance (admin)
+    :return:
+    """
+    WishItem.objects.bulk_create([WishItem(user=admin_user, title=f'Item {i}') for i in range(7)])
+    # Ties on updated_at are broken by id
+    WishItem.objects.filter(user=admin_user).update(updated_at=timezone.now())
+    expected = list(WishItem.objects
+                    .filter(user=admin_user, deleted_at__isnull=True)
+                    .order_by('-updated_at', '-id')
+                    .values_list('uuid', flat=True))
+
+    seen = []
+    url = '/api/item/?pagination=cursor&limit=3'
+    while url:
+        response = authenticated_client.get(url)
+        assert response.status_code == HTTP_200_OK
+        assert 'count' not in response.data
+        seen.extend(r['uuid'] for r in response.data['results'])
+        url = response.data['next']
+    assert seen == [str(u) for u in expected]
+
+    assert authenticated_client.get('/api/item/?cursor=not-a-cursor').status_code == HTTP_404_NOT_FOUND
+    WishItem.objects.bulk_create([WishItem(user=admin_user, title=f'Bulk {i}') for i in range(120)])
+    for query in ('limit=1000', 'pagination=cursor&limit=1000'):
+        response = authenticated_client.get(f'/api/item/?{query}')
+        assert len(response.data['results']) == MAX_PAGE_SIZE
+
+@pytest.mark.django_db
+def test_listings_use_live_indexes(admin_user: WishListUser) -> None:
+    """
+    Tests that the planner answers the wishlist, list item and list listings from the partial indexes
+    of live rows, and the wishlist listing with an index-only scan.
+    (Sequential scans are disabled, as the tables of the test database are too small to use any index)
+    :param admin_user: A WishListUser instance (admin)
+    :return:
+    """
+    items = WishItem.objects.bulk_create([WishItem(user=admin_user, title=f'Item {i}') for i in range(50)])
+    target = ListModel.objects.create(user=admin_user, title='Indexed list')
+    target.items.add(*items)
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+
+    live_items = WishItem.objects.filter(user_id=admin_user.pk, deleted_at__isnull=True)
+    plan = WishListItemSerializer.setup_eager_loading(live_items).order_by('-updated_at', '-id')[:30].explain()
+    assert 'Index Only Scan using idx_item_live_updated' in plan
+
+    plan = (WishListItemSerializer.setup_eager_loading(target.items.filter(user_id=admin_user.pk,
+                                                                           deleted_at__isnull=True))
+            .order_by('-created_at', '-id')[:30]
+            .explain())
+    assert 'idx_item_live_created' in plan
+
+    plan = (ListModel.objects
+            .filter(user_id=admin_user.pk, is_deleted=False)
+            .order_by('-updated_at', '-id')
+            .only('uuid', 'title', 'image', 'updated_at')[:20]
+            .explain())
+    assert 'Index Only Scan using idx_list_live_updated' in plan
+
 @pytest.mark.django_db
 @pytest.mark.parametrize('test_property,test_input,test_expected',
                          [('is_starred', True, True),
@@ -150,3 +258,139 @@ def test_put_wishlist_item(authenticated_client: APIClient,
     assert response.data['is_starred'] == data['is_starred']
     assert response.data['sources'][0]['source_name'] != old_entity_sources['source_name']
     assert response.data['sources'][0]['uuid'] != old_entity_sources['uuid']
+
+@pytest.mark.django_db
+def test_create_wishlist_item_rejects_url_variants(authenticated_client: APIClient,
+                                                   sample_wishlist_data: dict) -> None:
+    """
+    Tests that two spellings of the same URL (tracking parameters, www host) are rejected as duplicates.
+    :param authenticated_client: An authenticated APIClient instance
+    :param sample_wishlist_data: A Dictionary containing sample wishlist item data
+    :return:
+    """
+    data = sample_wishlist_data.copy()
+    data['sources'] = [{'source_url': 'https://example.com/products/1', 'source_name': 'A'},
+                       {'source_url': 'https://www.example.com/products/1?utm_source=ad', 'source_name': 'B'}]
+    response = authenticated_client.post('/api/item/',
+                                         data=data,
+                                         content_type='application/json')
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_put_wishlist_item_rejects_rekeyed_url(authenticated_client: APIClient,
+                                               sample_wishlist_item: dict) -> None:
+    """
+    Tests that a source re-keyed to the canonical URL of its page still counts as a duplicate
+    of the URL the owner submitted.
+    :param authenticated_client: An authenticated APIClient instance
+    :param sample_wishlist_item: A sample wishlist item data
+    :return:
+    """
+    uuid = sample_wishlist_item['uuid']
+    source = sample_wishlist_item['sources'][0]
+    ItemSource.objects.filter(uuid=source['uuid']).update(
+        source_fingerprint=get_fingerprint('https://example.com/products/canonical'))
+
+    data = sample_wishlist_item.copy()
+    data['sources'] = [{'source_url': source['source_url'], 'source_name': 'Again'}]
+    response = authenticated_client.put(f'/api/item/{uuid}',
+                                        data=data,
+                                        content_type='application/json')
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_list_wishlist_items_cached_per_user(authenticated_client: APIClient,
+                                             sample_wishlist_item: dict,
+                                             response_cache,
+                                             django_capture_on_commit_callbacks) -> None:
+    """
+    Tests that a repeated listing is served from the response cache without any query,
+    and that a write through the API or from the crawler invalidates it.
+    :param authenticated_client: An authenticated APIClient instance
+    :param sample_wishlist_item: A sample wishlist item data
+    :param response_cache: In-memory Redis of the response cache
+    :param django_capture_on_commit_callbacks: Fixture running the on_commit callbacks of the test transaction
+    :return:
+    """
+    from wishlist.cache import bump_items
+    uuid = sample_wishlist_item['uuid']
+    first = authenticated_client.get('/api/item/?limit=5')
+    with CaptureQueriesContext(connection) as queries:
+        cached = authenticated_client.get('/api/item/?limit=5')
+    assert cached.status_code == HTTP_200_OK
+    assert cached.data == first.data
+    assert not [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'silk_' not in q['sql']]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        authenticated_client.patch(f'/api/item/{uuid}', data={'title': 'Renamed'}, content_type='application/json')
+    assert authenticated_client.get('/api/item/?limit=5').data['results'][0]['title'] == 'Renamed'
+
+    WishItem.objects.filter(uuid=uuid).update(title='Crawled')
+    assert authenticated_client.get('/api/item/?limit=5').data['results'][0]['title'] == 'Renamed'
+    with django_capture_on_commit_callbacks(execute=True):
+        bump_items(WishItem.objects.filter(uuid=uuid).values_list('pk', flat=True))
+    assert authenticated_client.get('/api/item/?limit=5').data['results'][0]['title'] == 'Crawled'
+
+def test_bump_is_chunked(response_cache, monkeypatch) -> None:
+    """
+    Tests that the versions of many users are bumped in chunks of BUMP_CHUNK_SIZE, and that every user is bumped.
+    :param response_cache: In-memory Redis backing the response cache
+    :param monkeypatch: pytest monkeypatch fixture
+    :return:
+    """
+    chunks = []
+    script = response_cache.register_script(cache.BUMP_SCRIPT)
+
+    def bump_script(keys, args, client):
+        chunks.append(len(keys))
+        return script(keys=keys, args=args, client=client)
+
+    monkeypatch.setattr(cache, 'BUMP_CHUNK_SIZE', 2)
+    monkeypatch.setattr(cache, '_bump_script', bump_script)
+
+    keys = [cache._get_key(user_id) for user_id in range(1, 6)]
+    cache._bump(keys)
+    assert chunks == [2, 2, 1]
+    assert [int(response_cache.hget(key, cache.VERSION_FIELD)) for key in keys] == [1] * 5
+
+@pytest.mark.django_db
+def test_conditional_requests(authenticated_client: APIClient,
+                              sample_wishlist_item: dict,
+                              response_cache,
+                              django_capture_on_commit_callbacks) -> None:
+    """
+    Tests that revalidations of an unchanged item or wishlist get 304 Not Modified, that a change
+    made by the crawler changes the validators, and that a write with a stale If-Match gets 412.
+    :param authenticated_client: An authenticated APIClient instance
+    :param sample_wishlist_item: A sample wishlist item data
+    :param response_cache: In-memory Redis of the response cache
+    :param django_capture_on_commit_callbacks: Fixture running the on_commit callbacks of the test transaction
+    :return:
+    """
+    from wishlist.cache import bump_items
+    url = f'/api/item/{sample_wishlist_item["uuid"]}'
+    for path in (url, '/api/item/'):
+        response = authenticated_client.get(path)
+        assert response.status_code == HTTP_200_OK and response['ETag'] and response['Last-Modified']
+        revalidated = authenticated_client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert revalidated.status_code == HTTP_304_NOT_MODIFIED
+        assert revalidated['ETag'] == response['ETag']
+        assert authenticated_client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code \
+               == HTTP_304_NOT_MODIFIED
+
+    etag = authenticated_client.get(url)['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        bump_items(WishItem.objects.filter(uuid=sample_wishlist_item['uuid']).values_list('pk', flat=True))
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == HTTP_200_OK
+
+    # Only changes of the item itself fail the precondition of a write
+    with django_capture_on_commit_callbacks(execute=True):
+        patched = authenticated_client.patch(url, data={'title': 'First'}, content_type='application/json',
+                                             HTTP_IF_MATCH=etag)
+    assert patched.status_code == HTTP_204_NO_CONTENT
+    stale = authenticated_client.patch(url, data={'title': 'Second'}, content_type='application/json',
+                                       HTTP_IF_MATCH=etag)
+    assert stale.status_code == HTTP_412_PRECONDITION_FAILED
+    assert authenticated_client.put(url, data={'title': 'Second'}, format='json',
+                                    HTTP_IF_MATCH=patched['ETag']).status_code == HTTP_200_OK
+    assert WishItem.objects.get(uuid=sample_wishlist_item['uuid']).title == 'Second'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WishlistConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wishlist'
+
+    def ready(self) -> None:
+        # Invalidation of the cached responses (See wishlist.cache)
+        from wishlist import signals
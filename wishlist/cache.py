@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import wraps
+from urllib.parse import urlencode
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from capellawish.redis import get_redis
+from wishlist.models import WishItem
+
+logger = logging.getLogger(__name__)
+
+# One hash per user: the version of their data under VERSION_FIELD, the time of its last change
+# under MODIFIED_FIELD, and the responses built at that version
+REDIS_KEY_PREFIX = 'wishlist:responses:'
+VERSION_FIELD = '_version'
+MODIFIED_FIELD = '_modified'
+
+# Stores a response only if no write bumped the version since the request read it,
+# and only while the user has fewer than the maximum number of cached responses.
+STORE_SCRIPT = """
+local version = redis.call('HGET', KEYS[1], ARGV[1]) or '0'
+if version ~= ARGV[2] or redis.call('HLEN', KEYS[1]) > tonumber(ARGV[6]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], version, ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+# Increments the version of each user and drops the responses built at the previous one.
+# The version survives the drop, so a response built before the write can never match it again.
+BUMP_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local version = redis.call('HINCRBY', key, ARGV[1], 1)
+    redis.call('DEL', key)
+    redis.call('HSET', key, ARGV[1], version, ARGV[3], ARGV[4])
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return #KEYS
+"""
+
+# Users bumped by one call of BUMP_SCRIPT, so a bulk write never blocks Redis with one long script
+BUMP_CHUNK_SIZE = 500
+
+# Starts the modification time of a hash which has none yet (new, or expired), and returns it.
+# A version restarting from 0 after an expiry gets a new time, so its validators differ from the old ones.
+INIT_SCRIPT = """
+redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return redis.call('HGET', KEYS[1], ARGV[1])
+"""
+
+_store_script = None
+_bump_script = None
+_init_script = None
+
+
+@dataclass
+class DataState:
+    """Version of the data of a user, the time it last changed (UNIX seconds), and a cached response if any."""
+    version: str
+    modified: int
+    payload: bytes | None = None
+
+    def get_digest(self, *parts) -> str:
+        """Digest of a representation built at this version, for its ETag; `parts` tell the representations apart."""
+        return hashlib.sha1(repr((self.version, self.modified) + parts).encode()).hexdigest()[:20]
+
+
+def _get_key(user_id: int) -> str:
+    return f'{REDIS_KEY_PREFIX}{user_id}'
+
+
+def get_cache_field(request: Request) -> str:
+    """Field of a response in the hash of its user: the absolute URL, with the query parameters sorted."""
+    query = urlencode(sorted((k, v) for k, values in request.query_params.lists() for v in values))
+    return f'{request.build_absolute_uri(request.path)}?{query}'
+
+
+def get_data_state(user_id: int, field: str | None = None) -> DataState | None:
+    """
+    Reads the version of the user's data, the time it last changed, and the cached response of `field` if given,
+    in a single round trip. (Two for the first read after the hash expires)
+    Returns None when Redis is unavailable, so nothing is cached nor validated.
+    """
+    global _init_script
+    client = get_redis()
+    if client is None:
+        return None
+    key = _get_key(user_id)
+    try:
+        version, modified, *payload = client.hmget(key, [VERSION_FIELD, MODIFIED_FIELD] + ([field] if field else []))
+        if modified is None:
+            if _init_script is None:
+                _init_script = client.register_script(INIT_SCRIPT)
+            modified = _init_script(keys=[key], args=[MODIFIED_FIELD, int(time.time()), settings.RESPONSE_CACHE_TTL])
+    except redis.RedisError as e:
+        logger.warning('Could not read cached response from Redis: %s', e)
+        return None
+    return DataState(version=(version or b'0').decode(), modified=int(modified), payload=payload[0] if payload else None)
+
+
+def store_response(user_id: int, field: str, version: str, data) -> None:
+    global _store_script
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        if _store_script is None:
+            _store_script = client.register_script(STORE_SCRIPT)
+        _store_script(keys=[_get_key(user_id)],
+                      args=[VERSION_FIELD, version, field, json.dumps(data, cls=DjangoJSONEncoder),
+                            settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_ENTRIES])
+    except redis.RedisError as e:
+        logger.warning('Could not write cached response to Redis: %s', e)
+
+
+def bump_versions(user_ids: Iterable[int]) -> None:
+    """
+    Invalidates the cached responses of the users, once the current transaction commits.
+    Every write to the items, sources, lists or list memberships of a user must end up here;
+    model signals cover saves and deletes, and bulk writes call it themselves.
+    """
+    keys = sorted({_get_key(user_id) for user_id in user_ids if user_id is not None})
+    if keys:
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys: list[str]) -> None:
+    global _bump_script
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        if _bump_script is None:
+            _bump_script = client.register_script(BUMP_SCRIPT)
+        args = [VERSION_FIELD, settings.RESPONSE_CACHE_TTL, MODIFIED_FIELD, int(time.time())]
+        pipe = client.pipeline(transaction=False)
+        for i in range(0, len(keys), BUMP_CHUNK_SIZE):
+            _bump_script(keys=keys[i:i + BUMP_CHUNK_SIZE], args=args, client=pipe)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error('Could not invalidate cached responses in Redis: %s', e)
+
+
+def bump_items(item_ids: Iterable[int]) -> None:
+    """Invalidates the cached responses of the owners of the items."""
+    item_ids = list(item_ids)
+    if item_ids:
+        bump_versions(WishItem.objects.filter(pk__in=item_ids).values_list('user_id', flat=True).distinct())
+
+
+def bump_products(product_ids: Iterable[int]) -> None:
+    """Invalidates the cached responses of the owners of items showing the products."""
+    product_ids = list(product_ids)
+    if product_ids:
+        bump_versions(WishItem.objects
+                      .filter(sources__product_id__in=product_ids)
+                      .values_list('user_id', flat=True)
+                      .distinct())
+
+
+def set_validators(response, etag: str, modified: int):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
+
+
+def cache_per_user(method):
+    """
+    Caches the successful responses of a GET handler per user and query parameters in Redis,
+    and validates them with an ETag and Last-Modified derived from the version of the user's data.
+    A hit, or a 304 Not Modified to a matching If-None-Match or If-Modified-Since, costs one Redis round trip,
+    without any database or serializer work.
+    Responses are dropped as soon as the version of the user's data is bumped. (See bump_versions)
+    """
+    @wraps(method)
+    def wrapper(self, request: Request, *args, **kwargs) -> Response:
+        if not settings.RESPONSE_CACHE_TTL or not request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+
+        field = get_cache_field(request)
+        state = get_data_state(request.user.pk, field)
+        if state is None:
+            return method(self, request, *args, **kwargs)
+
+        etag = quote_etag(state.get_digest(field))
+        not_modified = get_conditional_response(request, etag=etag, last_modified=state.modified)
+        if not_modified is not None:
+            return set_validators(not_modified, etag, state.modified)
+        if state.payload is not None:
+            return set_validators(Response(data=json.loads(state.payload), status=status.HTTP_200_OK),
+                                  etag, state.modified)
+
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            store_response(request.user.pk, field, state.version, response.data)
+            set_validators(response, etag, state.modified)
+        return response
+    return wrapper
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from wishlist.cache import get_data_state, set_validators
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource was modified since it was read.'
+    default_code = 'precondition_failed'
+
+
+def get_row_tag(updated_at: datetime) -> str:
+    """Tag of a version of a single row, from its updated_at in microseconds."""
+    return f'{int(updated_at.timestamp() * 1_000_000):x}'
+
+
+def is_conditional(request: Request) -> bool:
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def get_detail_validators(request: Request, updated_at: datetime) -> tuple[str, int] | None:
+    """
+    ETag and Last-Modified of a single item or list of the user.
+    The ETag is the tag of the row, which guards the writes (See check_if_match), followed by a digest of
+    the version of the user's data, which changes with what the row does not hold (sources, products, members).
+    Returns None when the version is unknown, so the response is sent without validators.
+    """
+    state = get_data_state(request.user.pk) if settings.RESPONSE_CACHE_TTL else None
+    if state is None:
+        return None
+    etag = quote_etag(f'{get_row_tag(updated_at)}-{state.get_digest(request.path)}')
+    return etag, max(state.modified, int(updated_at.timestamp()))
+
+
+def get_not_modified(request: Request, updated_at: datetime) -> HttpResponseBase | None:
+    """
+    Answers a conditional GET of a single item or list without loading nor serializing it.
+    Returns None when the representation must be sent.
+    """
+    validators = get_detail_validators(request, updated_at)
+    if validators is None:
+        return None
+    response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+    return None if response is None else set_validators(response, *validators)
+
+
+def check_if_match(request: Request, updated_at: datetime) -> None:
+    """
+    Raises PreconditionFailed when If-Match lists none of the tags of the row, so a write based on
+    a stale read does not overwrite the changes made since. The row must be locked by the caller.
+    """
+    header = request.headers.get('If-Match')
+    if not header:
+        return
+    etags = parse_etags(header)
+    if '*' in etags:
+        return
+    row_tag = get_row_tag(updated_at)
+    # Weak tags never match for writes
+    if not any(etag.startswith('"') and etag[1:-1].split('-')[0] == row_tag for etag in etags):
+        raise PreconditionFailed()
+
+
+def set_row_tag(response, updated_at: datetime):
+    """Tags the response of a write with the new version of the row, for the If-Match of the next write."""
+    response['ETag'] = quote_etag(get_row_tag(updated_at))
+    return response
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:39
+
+import hashlib
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_blob_urls_to_aliases(apps, schema_editor):
+    BlobImage = apps.get_model('wishlist', 'BlobImage')
+    ImageAlias = apps.get_model('wishlist', 'ImageAlias')
+    aliases = {}
+    for blob_id, url in BlobImage.objects.exclude(url__isnull=True).exclude(url='').values_list('id', 'url'):
+        url_hash = hashlib.sha256(url.encode()).hexdigest()
+        aliases.setdefault(url_hash, ImageAlias(url=url, url_hash=url_hash, blob_id=blob_id))
+    ImageAlias.objects.bulk_create(aliases.values(), batch_size=1000)
+
+
+def copy_aliases_to_blob_urls(apps, schema_editor):
+    BlobImage = apps.get_model('wishlist', 'BlobImage')
+    ImageAlias = apps.get_model('wishlist', 'ImageAlias')
+    for alias in ImageAlias.objects.order_by('-created_at').iterator():
+        BlobImage.objects.filter(id=alias.blob_id).update(url=alias.url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0005_blobimage_url_blobimage_idx_blobimage_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAlias',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('url', models.TextField(validators=[django.core.validators.URLValidator()])),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=512)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='wishlist.blobimage')),
+            ],
+        ),
+        migrations.RunPython(copy_blob_urls_to_aliases, reverse_code=copy_aliases_to_blob_urls),
+        migrations.RemoveIndex(
+            model_name='blobimage',
+            name='idx_blobimage_url',
+        ),
+        migrations.RemoveField(
+            model_name='blobimage',
+            name='url',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemsource',
+            name='change_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='itemsource',
+            name='crawl_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='itemsource',
+            name='last_crawled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='last_viewed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='itemsource',
+            index=models.Index(fields=['is_primary', 'last_crawled_at'], name='idx_item_source_crawled_at'),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:05
+
+import hashlib
+import logging
+import posixpath
+import re
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Frozen copy of crawler.canonical at the time of this migration, so later changes
+# to the canonicalization do not change what this migration does.
+TRACKING_PARAMS = {
+    'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'ttclid',
+    'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'spm', 'scm',
+    'ref_src', 'ref_url', 'srsltid', 'si', 'trk', 'trkid', 'campaign_id', 'ad_id', 'adgroup_id',
+    'n_media', 'n_query', 'n_rank', 'n_ad_group', 'n_ad', 'n_keyword_id', 'n_keyword', 'n_campaign_type',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_', 'itm_')
+EQUIVALENT_HOST_PREFIXES = ('www.', 'm.', 'mobile.')
+_MULTIPLE_SLASHES = re.compile(r'/{2,}')
+
+
+def is_tracking_param(key):
+    lowered = key.lower()
+    return lowered in TRACKING_PARAMS or lowered.startswith(TRACKING_PREFIXES)
+
+
+def get_fingerprint(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower().rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    for prefix in EQUIVALENT_HOST_PREFIXES:
+        if host.startswith(prefix) and host.count('.') > 1:
+            host = host.removeprefix(prefix)
+            break
+    try:
+        port = parts.port
+    except ValueError:
+        # Out of range (URLValidator accepts any five digits); such a URL can never be requested
+        port = None
+    if port and port not in (80, 443):
+        host = f'{host}:{port}'
+
+    path = quote(unquote(parts.path), safe="/:@!$&'()*+,;=-._~")
+    path = _MULTIPLE_SLASHES.sub('/', path)
+    path = posixpath.normpath(path) if path else '/'
+    path = '/' if path in ('.', '//') else path.rstrip('/') or '/'
+
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k))
+    canonical = urlunsplit(('https', host, path, urlencode(query), ''))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def fill_source_fingerprints(apps, schema_editor):
+    ItemSource = apps.get_model('wishlist', 'ItemSource')
+    kept = {}
+    merged = set()
+    duplicates = []
+    # Primary sources first, then the earliest, so they are kept when several spellings
+    # of a URL belong to the same item. The others are merged into them.
+    for source in (ItemSource.objects
+                   .order_by('wish_item_id', '-is_primary', 'id')
+                   .only('id', 'wish_item_id', 'source_url', 'source_name', 'description', 'is_primary')
+                   .iterator()):
+        source.source_fingerprint = get_fingerprint(source.source_url)
+        key = (source.wish_item_id, source.source_fingerprint)
+        if key not in kept:
+            kept[key] = source
+            continue
+        survivor = kept[key]
+        for field in ('source_name', 'description'):
+            if not getattr(survivor, field) and getattr(source, field):
+                setattr(survivor, field, getattr(source, field))
+                merged.add(key)
+        logger.warning('Merging source %s (%s) of item %s into source %s (%s)',
+                       source.id, source.source_url, source.wish_item_id, survivor.id, survivor.source_url)
+        duplicates.append(source.id)
+    ItemSource.objects.filter(id__in=duplicates).delete()
+    if duplicates and schema_editor.connection.vendor == 'postgresql':
+        # Fire the deferred foreign key checks of the deletion now; Postgres refuses to alter
+        # the table below while they are pending.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    ItemSource.objects.bulk_update(kept.values(), ['source_fingerprint'], batch_size=1000)
+    ItemSource.objects.bulk_update([kept[key] for key in merged], ['source_name', 'description'], batch_size=1000)
+    if duplicates:
+        logger.warning('Merged %s duplicate sources into the sources of the same items', len(duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0008_crawl_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemsource',
+            name='source_fingerprint',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_source_fingerprints, reverse_code=migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='itemsource',
+            name='unique_source_per_item',
+        ),
+        migrations.RemoveIndex(
+            model_name='itemsource',
+            name='idx_item_source_item_url',
+        ),
+        migrations.AddIndex(
+            model_name='itemsource',
+            index=models.Index(fields=['wish_item', 'source_fingerprint', 'is_primary'], name='idx_item_source_item_fp'),
+        ),
+        migrations.AddIndex(
+            model_name='itemsource',
+            index=models.Index(fields=['source_fingerprint'], name='idx_item_source_fp'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemsource',
+            constraint=models.UniqueConstraint(fields=['source_fingerprint', 'wish_item'], name='unique_source_per_item'),
+        ),
+    ]
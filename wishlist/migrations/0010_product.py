@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:10
+
+import hashlib
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def _first_value(value) -> str:
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return str(value) if value else ''
+
+
+def create_products(apps, schema_editor):
+    ItemSource = apps.get_model('wishlist', 'ItemSource')
+    Product = apps.get_model('wishlist', 'Product')
+    ImageAlias = apps.get_model('wishlist', 'ImageAlias')
+    CrawlResult = apps.get_model('crawler', 'CrawlResult')
+
+    # One product per fingerprint of the primary sources, with the history of its most crawled source
+    products = {}
+    for source in (ItemSource.objects
+                   .filter(is_primary=True)
+                   .order_by('source_fingerprint', '-crawl_count', 'id')
+                   .only('source_url', 'source_fingerprint', 'last_crawled_at', 'crawl_count', 'change_count')
+                   .iterator()):
+        if source.source_fingerprint in products:
+            continue
+        products[source.source_fingerprint] = Product(fingerprint=source.source_fingerprint,
+                                                      url=source.source_url,
+                                                      last_crawled_at=source.last_crawled_at,
+                                                      crawl_count=source.crawl_count,
+                                                      change_count=source.change_count)
+
+    # Crawl cache entries are keyed by the same fingerprint
+    for result in CrawlResult.objects.filter(url_key__in=products.keys()).only('url_key', 'data').iterator():
+        product = products[result.url_key]
+        product.data = result.data
+        product.title = _first_value(result.data.get('title'))[:400]
+        product.description = _first_value(result.data.get('description'))
+    images = {}
+    for product in products.values():
+        image = _first_value(product.data.get('image'))
+        if image:
+            images.setdefault(hashlib.sha256(image.encode()).hexdigest(), []).append(product)
+    for url_hash, blob_id in ImageAlias.objects.filter(url_hash__in=images.keys()).values_list('url_hash', 'blob_id'):
+        for product in images[url_hash]:
+            product.image_id = blob_id
+
+    Product.objects.bulk_create(products.values(), batch_size=1000)
+    # A single UPDATE, joining each primary source to its product by the fingerprint
+    (ItemSource.objects
+     .filter(is_primary=True)
+     .update(product=Subquery(Product.objects.filter(fingerprint=OuterRef('source_fingerprint')).values('id')[:1])))
+
+
+def restore_crawl_history(apps, schema_editor):
+    ItemSource = apps.get_model('wishlist', 'ItemSource')
+    Product = apps.get_model('wishlist', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    (ItemSource.objects
+     .filter(product__isnull=False)
+     .update(last_crawled_at=Subquery(product.values('last_crawled_at')[:1]),
+             crawl_count=Subquery(product.values('crawl_count')[:1]),
+             change_count=Subquery(product.values('change_count')[:1])))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0002_stagedcrawl'),
+        ('wishlist', '0009_itemsource_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('url', models.TextField(validators=[django.core.validators.URLValidator()])),
+                ('title', models.CharField(blank=True, max_length=400)),
+                ('description', models.TextField(blank=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('last_crawled_at', models.DateTimeField(blank=True, null=True)),
+                ('crawl_count', models.PositiveIntegerField(default=0)),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product_image', to='wishlist.blobimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_crawled_at'], name='idx_product_crawled_at')],
+            },
+        ),
+        migrations.AddField(
+            model_name='itemsource',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sources', to='wishlist.product'),
+        ),
+        migrations.AlterField(
+            model_name='wishitem',
+            name='title',
+            field=models.CharField(blank=True, max_length=400),
+        ),
+        migrations.RunPython(create_products, reverse_code=restore_crawl_history),
+        migrations.RemoveIndex(
+            model_name='itemsource',
+            name='idx_item_source_crawled_at',
+        ),
+        migrations.RemoveField(
+            model_name='itemsource',
+            name='change_count',
+        ),
+        migrations.RemoveField(
+            model_name='itemsource',
+            name='crawl_count',
+        ),
+        migrations.RemoveField(
+            model_name='itemsource',
+            name='last_crawled_at',
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0010_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishitem',
+            name='enriched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='enriched_description',
+            field=models.TextField(blank=True, default=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='enriched_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='wish_item_enriched_image', to='wishlist.blobimage'),
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='enriched_title',
+            field=models.CharField(blank=True, default='', max_length=400),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='price_currency',
+            field=models.CharField(blank=True, default='', max_length=3),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='price_max',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='wishitem',
+            name='price_min',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0011_wishitem_enrichment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wishitem',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='idx_item_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='wishitem',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='idx_item_user_created'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0012_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='wishitem',
+            name='idx_item_user_updated',
+        ),
+        migrations.RemoveIndex(
+            model_name='wishitem',
+            name='idx_item_user_created',
+        ),
+        migrations.AddIndex(
+            model_name='wishitem',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', '-updated_at', '-id'], include=('uuid', 'title', 'image', 'is_starred', 'completed_at', 'created_at', 'updated_at', 'enriched_title', 'enriched_image'), name='idx_item_live_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='wishitem',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', '-created_at', '-id'], include=('uuid', 'title', 'image', 'is_starred', 'completed_at', 'created_at', 'updated_at', 'enriched_title', 'enriched_image'), name='idx_item_live_created'),
+        ),
+    ]
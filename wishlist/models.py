@@ -1,17 +1,25 @@
+import hashlib
 import uuid
+from typing import override
 
 from django.core import validators
 from django.db import models
 from account.models import WishListUser
+from crawler.canonical import get_fingerprint
 
 # Create your models here.
 
+# Columns the wishlist listing reads besides the keys of its indexes
+LISTING_COLUMNS = ['uuid', 'title', 'image', 'is_starred', 'completed_at', 'created_at', 'updated_at',
+                   'enriched_title', 'enriched_image']
+
+
 class WishItem(models.Model):
     id = models.BigAutoField(primary_key=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
-    # Basic fields
-    title = models.CharField(max_length=400, blank=False)
+    # Basic fields (Empty fields are shown from the product of the primary source)
+    title = models.CharField(max_length=400, blank=True)
     description = models.TextField(blank=True)
 
     # Image field (optional)
@@ -32,6 +40,20 @@ class WishItem(models.Model):
     # Logical deletion field
     deleted_at = models.DateTimeField(auto_now=False, null=True)
 
+    # Last time the owner opened the item (Recently viewed items are refreshed by the crawler first)
+    last_viewed_at = models.DateTimeField(null=True, blank=True)
+
+    # Metadata merged from the crawls of all sources (See crawler.enrichment)
+    # Shown when the owner left a field empty, before the product of the primary source.
+    enriched_title = models.CharField(max_length=400, blank=True)
+    enriched_description = models.TextField(blank=True)
+    enriched_image = models.ForeignKey('wishlist.BlobImage', related_name='wish_item_enriched_image',
+                                       on_delete=models.SET_NULL, null=True, blank=True)
+    price_min = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    price_max = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    price_currency = models.CharField(max_length=3, blank=True)
+    enriched_at = models.DateTimeField(null=True, blank=True)
+
     # User
     user = models.ForeignKey('wishaccount.WishListUser', related_name='wish_item_user', on_delete=models.CASCADE)
 
@@ -40,8 +62,77 @@ class WishItem(models.Model):
             models.Index(fields=['uuid'], name='idx_item_uuid'),
             models.Index(fields=['user', 'is_public'], name='idx_item_is_public'),
             models.Index(fields=['user', 'is_starred'], name='idx_item_is_starred'),
+            # Live items of a user in the orders of the wishlist (updated_at) and of the items of a list
+            # (created_at), covering the columns of the listing for index-only scans.
+            # (See WishListItemSerializer.setup_eager_loading)
+            models.Index(fields=['user', '-updated_at', '-id'], name='idx_item_live_updated',
+                         condition=models.Q(deleted_at__isnull=True), include=LISTING_COLUMNS),
+            models.Index(fields=['user', '-created_at', '-id'], name='idx_item_live_created',
+                         condition=models.Q(deleted_at__isnull=True), include=LISTING_COLUMNS),
         ]
 
+    def get_primary_source(self) -> 'ItemSource | None':
+        """
+        Returns the primary source with its product, querying it once per instance.
+        Listings prefetch it into `primary_sources` for a whole page at once. (See WishListView)
+        """
+        if not hasattr(self, '_primary_source') and hasattr(self, 'primary_sources'):
+            self._primary_source = self.primary_sources[0] if self.primary_sources else None
+        if not hasattr(self, '_primary_source'):
+            self._primary_source = (ItemSource.objects
+                                    .select_related('product__image')
+                                    .filter(wish_item=self, is_primary=True)
+                                    .first())
+        return self._primary_source
+
+    def get_product(self) -> 'Product | None':
+        source = self.get_primary_source()
+        return source.product if source else None
+
+
+class Product(models.Model):
+    """
+    Crawled metadata of a product page, stored once however many items save the page.
+    Keyed by the fingerprint of the canonical URL of the page. (See crawler.canonical)
+    """
+    id = models.BigAutoField(primary_key=True)
+    fingerprint = models.CharField(max_length=64, unique=True)
+    url = models.TextField(blank=False, validators=[validators.URLValidator()])
+
+    title = models.CharField(max_length=400, blank=True)
+    description = models.TextField(blank=True)
+    image = models.ForeignKey('wishlist.BlobImage', related_name='product_image',
+                              on_delete=models.SET_NULL, null=True, blank=True)
+    # All extracted metadata (Same format as crawler.tasks.retrieve_data)
+    data = models.JSONField(default=dict, blank=True)
+
+    # Crawl history, used to schedule refreshes of the metadata
+    last_crawled_at = models.DateTimeField(null=True, blank=True)
+    crawl_count = models.PositiveIntegerField(default=0)
+    change_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_crawled_at'], name='idx_product_crawled_at'),
+        ]
+
+    def set_data(self, data: dict, count_change: bool = True) -> None:
+        """Replaces the metadata with a crawl result, counting it as a change if it differs from the last one."""
+        if count_change and self.last_crawled_at and self.data and data != self.data:
+            self.change_count += 1
+        self.data = data
+        self.title = _first_value(data.get('title'))[:400]
+        self.description = _first_value(data.get('description'))
+
+
+def _first_value(value) -> str:
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return str(value) if value else ''
+
 
 class ItemSource(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -49,31 +140,94 @@ class ItemSource(models.Model):
 
     # Note: Due to the base of URLField is CharField, using TextField with validator to allow more length than 200
     source_url = models.TextField(blank=False, validators=[validators.URLValidator()])
+    # Fingerprint of the canonical form of source_url, or of the canonical URL the page declares once crawled
+    # Lookups and uniqueness use this fixed-width column instead of the URL. (See crawler.canonical)
+    source_fingerprint = models.CharField(max_length=64, editable=False)
     source_name = models.CharField(max_length=300, blank=True)
     wish_item = models.ForeignKey(WishItem, related_name='sources', on_delete=models.CASCADE)
     description = models.TextField(blank=True)
     is_primary = models.BooleanField(default=False)
+    # Crawled metadata of the page (Primary sources only, once crawled)
+    product = models.ForeignKey(Product, related_name='sources', on_delete=models.SET_NULL, null=True, blank=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=['wish_item', 'source_url', 'is_primary'], name='idx_item_source_item_url'),
+            models.Index(fields=['wish_item', 'source_fingerprint', 'is_primary'], name='idx_item_source_item_fp'),
+            models.Index(fields=['source_fingerprint'], name='idx_item_source_fp'),
             models.Index(fields=['uuid'], name='idx_item_source_uuid'),
         ]
         constraints = [
-            models.UniqueConstraint(fields=['source_url', 'wish_item'], name='unique_source_per_item')
+            models.UniqueConstraint(fields=['source_fingerprint', 'wish_item'], name='unique_source_per_item')
         ]
 
+    @override
+    def save(self, *args, **kwargs) -> None:
+        # Note: bulk_create and bulk_update skip save(); set the fingerprint with set_fingerprint() there.
+        if not self.source_fingerprint:
+            self.set_fingerprint()
+        super().save(*args, **kwargs)
+
+    def set_fingerprint(self) -> None:
+        self.source_fingerprint = get_fingerprint(self.source_url)
+
+    def get_fingerprints(self) -> set[str]:
+        """Fingerprints the source matches: the stored one, which the crawler may re-key to the canonical URL
+        of the page, and the one of the URL the owner submitted."""
+        return {self.source_fingerprint, get_fingerprint(self.source_url)}
+
 
 class BlobImage(models.Model):
+    """Content-addressed image. There is exactly one blob per SHA-256 digest of the image data."""
     id = models.BigAutoField(primary_key=True)
     image = models.ImageField(upload_to='images/', blank=True, null=True)
     sha256_hash = models.CharField(max_length=120, unique=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    url = models.TextField(blank=False, validators=[validators.URLValidator()], null=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['sha256_hash'], name='idx_blobimage_sha256hash'),
             models.Index(fields=['uploaded_at'], name='idx_blobimage_uploaded_at'),
-            models.Index(fields=['url'], name='idx_blobimage_url'),
+        ]
+
+
+class ImageAlias(models.Model):
+    """A source URL an image blob was downloaded from. Many URLs can point to the same blob."""
+    id = models.BigAutoField(primary_key=True)
+    url = models.TextField(blank=False, validators=[validators.URLValidator()])
+    # Note: Hash of the URL instead of the URL itself, because B-tree index entries have a size limit
+    url_hash = models.CharField(max_length=64, unique=True)
+    etag = models.CharField(max_length=512, blank=True)
+    blob = models.ForeignKey(BlobImage, related_name='aliases', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def hash_url(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+
+class ImportJob(models.Model):
+    """A bulk import of product URLs into the wishlist of a user, with its progress."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        COMPLETED = 'completed'
+
+    id = models.BigAutoField(primary_key=True)
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey('wishaccount.WishListUser', related_name='import_job_user', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+
+    # Progress counters (processed + failed == total when the job is done)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['uuid'], name='idx_import_job_uuid'),
+            models.Index(fields=['user', 'created_at'], name='idx_import_job_user'),
         ]
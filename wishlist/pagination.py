@@ -1,11 +1,139 @@
-from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
+import base64
+import json
+from binascii import Error as BinasciiError
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Hard maximum of a page in both pagination modes
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages through a collection by the position of the last row of the previous page, as an opaque cursor
+    over (timestamp, id) in the order of `ordering`. A page costs an index range scan from the cursor
+    whatever its depth, and no COUNT(*). Only the next page is linked.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering: tuple[str, str] = ('-updated_at', '-id'),
+                 page_size: int = 30,
+                 max_page_size: int = MAX_PAGE_SIZE) -> None:
+        self.ordering = ordering
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.next_position = None
+        self.request = None
+
+    @classmethod
+    def is_requested(cls, request: Request) -> bool:
+        """Clients opt in with ?pagination=cursor on the first page; the links of the next pages carry the cursor."""
+        return cls.cursor_query_param in request.query_params or request.query_params.get('pagination') == 'cursor'
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, position: tuple) -> str:
+        value, pk = position
+        payload = json.dumps([value.isoformat(), pk], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request: Request) -> tuple | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (BinasciiError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list:
+        self.request = request
+        page_size = self.get_page_size(request)
+        field, pk_field = (f.lstrip('-') for f in self.ordering)
+        op, op_or_equal = ('lt', 'lte') if self.ordering[0].startswith('-') else ('gt', 'gte')
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position:
+            value, pk = position
+            # The first condition bounds the index range scan; the second skips the rows of the same timestamp
+            queryset = (queryset
+                        .filter(**{f'{field}__{op_or_equal}': value})
+                        .filter(Q(**{f'{field}__{op}': value}) | Q(**{f'{pk_field}__{op}': pk})))
+
+        rows = list(queryset[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = (getattr(rows[-1], field), getattr(rows[-1], pk_field)) if has_next else None
+        return rows
+
+    def get_next_link(self) -> str | None:
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
 
 
 class WishItemListPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, or keyset pagination over `keyset_ordering` when the client asks for it.
+    (See KeysetPagination.is_requested) Both modes cap the page at MAX_PAGE_SIZE.
+    """
     default_limit = 30
     limit_query_param = 'limit'
     offset_query_param = 'offset'
-    max_limit = None
+    max_limit = MAX_PAGE_SIZE
+    keyset_ordering = ('-updated_at', '-id')
+
+    def __init__(self) -> None:
+        self.keyset = None
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list | None:
+        if KeysetPagination.is_requested(request):
+            self.keyset = KeysetPagination(self.keyset_ordering, self.default_limit, self.max_limit)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data) -> Response:
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ListItemPagination(WishItemListPagination):
+    keyset_ordering = ('-created_at', '-id')
 
 
 class WishListPagination(WishItemListPagination):
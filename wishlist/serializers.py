@@ -2,8 +2,10 @@ from collections import Counter
 from typing import override
 
 from django.db import transaction
-from django.db.models import ImageField
+from django.db.models import ImageField, Prefetch, QuerySet
 from django.db.models.fields.files import ImageFieldFile
+from django.conf import settings
+from django.core import validators
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
@@ -11,10 +13,43 @@ from rest_framework.serializers import ModelSerializer, UUIDField
 from django.utils import timezone
 from hashlib import sha256
 
-from wishlist.models import WishItem, ItemSource, BlobImage
+from crawler.canonical import get_fingerprint
+from wishlist.models import LISTING_COLUMNS, WishItem, ItemSource, BlobImage, ImportJob
 import uuid
 
 
+def get_image_url(request, item: WishItem) -> str | None:
+    """
+    Absolute URL of the image of an item: the one its owner set, the one merged from all its sources,
+    or the one of its product, in that order.
+    """
+    image = item.image or item.enriched_image
+    if image is None:
+        product = item.get_product()
+        image = product.image if product else None
+    return None if image is None else request.build_absolute_uri(image.image.url)
+
+
+def fill_from_product(ret: dict, item: WishItem, fields: list[str]) -> dict:
+    """
+    Fills the empty fields of a serialized item with the metadata merged from all its sources,
+    or else with the crawled metadata of its product.
+    :param ret: The serialized item
+    :param item: The WishItem instance
+    :param fields: Names of the fields shared by WishItem and Product
+    :return: The serialized item
+    """
+    for f in fields:
+        if not ret.get(f):
+            ret[f] = getattr(item, f'enriched_{f}')
+    empty = [f for f in fields if not ret.get(f)]
+    product = item.get_product() if empty else None
+    if product:
+        for f in empty:
+            ret[f] = getattr(product, f)
+    return ret
+
+
 class BlobImageSerializer(ModelSerializer):
     """
     Serializer for BlobImage model to represent image data.
@@ -64,14 +99,36 @@ class WishListItemSerializer(ModelSerializer):
     image = SerializerMethodField(read_only=True)
     primary_source_url = SerializerMethodField(read_only=True)
 
-    def get_primary_source_url(self, obj) -> str | None:
-        target = ItemSource.objects.filter(wish_item=obj, is_primary=True).first()
+    def get_primary_source_url(self, obj: WishItem) -> str | None:
+        target = obj.get_primary_source()
         if not target:
             return None
         return target.source_url
 
-    def get_image(self, obj: BlobImage) -> str | None:
-        return None if obj.image is None else self.context.get('request').build_absolute_uri(obj.image.image.url)
+    def get_image(self, obj: WishItem) -> str | None:
+        return get_image_url(self.context.get('request'), obj)
+
+    @override
+    def to_representation(self, instance: WishItem):
+        ret = super().to_representation(instance)
+        return fill_from_product(ret, instance, ['title'])
+
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet) -> QuerySet:
+        """
+        Loads what the serializer reads for a whole page of items in the same few queries, whatever its size:
+        the items joined with their images, then the primary sources of the page joined with their products
+        and product images. (See WishItem.get_primary_source)
+        """
+        primary_sources = (ItemSource.objects
+                           .filter(is_primary=True)
+                           .select_related('product__image')
+                           .only('wish_item_id', 'source_url', 'is_primary',
+                                 'product__title', 'product__description', 'product__image__image'))
+        return (queryset
+                .only(*LISTING_COLUMNS)
+                .select_related('image', 'enriched_image')
+                .prefetch_related(Prefetch('sources', queryset=primary_sources, to_attr='primary_sources')))
 
     class Meta:
         model = WishItem
@@ -101,23 +158,25 @@ class WishListItemDetailSerializer(ModelSerializer):
 
     def validate_sources(self, attrs):
         sources = attrs
-        urls = [s.get('source_url') for s in sources if 'source_url' in s]
-        payload_dup = [u for u, c in Counter(urls).items() if c > 1]
-        if payload_dup:
-            raise ValidationError('Duplicate URLs are not allowed.')
-
-        # Check duplicates in database
         # TODO: Lock the rows on check
+        current = {}
         if getattr(self, 'instance', None):
-            queryset = (ItemSource.objects
-                        .only('uuid', 'source_url', 'wish_item')
-                        .filter(wish_item=self.context['instance'], source_url__in=urls))
-            existing_sources = [s['uuid'] for s in sources if 'uuid' in s]
-            if existing_sources:
-                queryset = queryset.exclude(id__in=existing_sources).distinct('source_url')
-            if queryset.exists():
-                rt = queryset.values_list('source_url', flat=True)
-                raise ValidationError('Duplicate URLs are not allowed.')
+            current = {s.uuid: s for s in (ItemSource.objects
+                                           .only('uuid', 'source_url', 'source_fingerprint', 'wish_item')
+                                           .filter(wish_item=self.context['instance']))}
+
+        # Spellings of the same URL (tracking parameters, mobile hosts, ...) count as duplicates,
+        # in the payload and in the database
+        claimed = []
+        for s in sources:
+            existing = current.pop(s.get('uuid'), None)
+            if 'source_url' in s:
+                claimed.append({get_fingerprint(s['source_url'])})
+            elif existing is not None:
+                claimed.append(existing.get_fingerprints())
+        claimed.extend(s.get_fingerprints() for s in current.values())
+        if any(c > 1 for c in Counter(f for forms in claimed for f in forms).values()):
+            raise ValidationError('Duplicate URLs are not allowed.')
         return attrs
 
     @override
@@ -142,6 +201,8 @@ class WishListItemDetailSerializer(ModelSerializer):
             if len(sources_data) > 0:
                 item_sources.append(ItemSource(wish_item=wish_item, is_primary=True, **sources_data[0]))
             item_sources.extend([ItemSource(wish_item=wish_item, is_primary=False, **sources_data[i]) for i in range(1, len(sources_data))])
+            for source in item_sources:
+                source.set_fingerprint()
             ItemSource.objects.bulk_create(item_sources)
         return wish_item
 
@@ -158,7 +219,7 @@ class WishListItemDetailSerializer(ModelSerializer):
         current_sources = dict((i.uuid, i) for i in instance.sources.all())
         prev_is_completed = instance.completed_at is not None
         new_is_completed = validated_data.pop('is_completed', None)
-        validated_data.pop('upload_image')
+        validated_data.pop('upload_image', False)
 
         if prev_is_completed and not new_is_completed:
             instance.completed_at = None
@@ -175,18 +236,24 @@ class WishListItemDetailSerializer(ModelSerializer):
                 item = current_sources.pop(src['uuid'])
                 for property in src.keys():
                     setattr(item, property, src[property])
+                if 'source_url' in src:
+                    item.set_fingerprint()
                 updated_items.append(item)
             else:
-                new_items.append(ItemSource(wish_item=instance, **src))
+                item = ItemSource(wish_item=instance, **src)
+                item.set_fingerprint()
+                new_items.append(item)
 
         # TODO: Raise Error if any issue occurs
         with transaction.atomic():
-            ItemSource.objects.bulk_create(new_items)
-            ItemSource.objects.select_for_update().bulk_update(updated_items,
-                                                               ['source_url', 'source_name', 'description'])
+            # Removed sources go first, so a new source may take over their URL
             if len(current_sources) > 0:
                 for src in current_sources.values():
                     src.delete()
+            ItemSource.objects.select_for_update().bulk_update(updated_items,
+                                                               ['source_url', 'source_fingerprint',
+                                                                'source_name', 'description'])
+            ItemSource.objects.bulk_create(new_items)
 
         instance.save()
         return instance
@@ -196,18 +263,21 @@ class WishListItemDetailSerializer(ModelSerializer):
     @override
     def to_representation(self, instance: WishItem):
         ret = super().to_representation(instance)
-        return ret
+        return fill_from_product(ret, instance, ['title', 'description'])
 
-    def get_image(self, obj: BlobImage) -> str | None:
-        return None if obj.image is None else self.context.get('request').build_absolute_uri(obj.image.image.url)
+    def get_image(self, obj: WishItem) -> str | None:
+        return get_image_url(self.context.get('request'), obj)
 
     class Meta:
         model = WishItem
         fields = ['uuid', 'title', 'description', 'is_public', 'is_completed', 'completed_at',
-                  'is_starred', 'created_at', 'updated_at', 'sources', 'image', 'upload_image']
+                  'is_starred', 'created_at', 'updated_at', 'sources', 'image', 'upload_image',
+                  'price_min', 'price_max', 'price_currency']
         read_only_fields = [
-            'uuid', 'created_at', 'updated_at', 'image'
+            'uuid', 'created_at', 'updated_at', 'image', 'price_min', 'price_max', 'price_currency'
         ]
+        # Items created through the API have their own title. (Imported items show the crawled one)
+        extra_kwargs = {'title': {'required': True, 'allow_blank': False}}
 
 
 class WishListItemPatchSerializer(ModelSerializer):
@@ -237,3 +307,25 @@ class WishListItemPatchSerializer(ModelSerializer):
         read_only_fields = [
             'uuid', 'created_at', 'updated_at', 'image'
         ]
+        extra_kwargs = {'title': {'allow_blank': False}}
+
+
+class ItemImportSerializer(serializers.Serializer):
+    urls = serializers.ListField(child=serializers.CharField(validators=[validators.URLValidator()]),
+                                 allow_empty=False,
+                                 max_length=settings.WISHLIST_IMPORT_MAX_URLS)
+    is_public = serializers.BooleanField(required=False, default=False)
+
+    def validate_urls(self, attrs: list[str]) -> list[str]:
+        # Keep the order of the payload, but import each URL once, including its other spellings.
+        unique = {}
+        for url in attrs:
+            unique.setdefault(get_fingerprint(url), url.strip())
+        return list(unique.values())
+
+
+class ImportJobSerializer(ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ['uuid', 'status', 'total', 'processed', 'failed', 'created_at', 'finished_at']
+        read_only_fields = fields
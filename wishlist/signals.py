@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wishlist.cache import bump_items, bump_versions
+from wishlist.models import ItemSource, WishItem
+
+# Writes which do not change any cached response
+UNCACHED_FIELDS = frozenset({'last_viewed_at'})
+
+
+@receiver(post_save, sender=WishItem)
+@receiver(post_delete, sender=WishItem)
+def invalidate_item(sender, instance: WishItem, update_fields=None, **kwargs) -> None:
+    if update_fields and UNCACHED_FIELDS.issuperset(update_fields):
+        return
+    bump_versions([instance.user_id])
+
+
+@receiver(post_save, sender=ItemSource)
+@receiver(post_delete, sender=ItemSource)
+def invalidate_source(sender, instance: ItemSource, **kwargs) -> None:
+    bump_items([instance.wish_item_id])
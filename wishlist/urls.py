@@ -1,9 +1,12 @@
 from django.urls.conf import include, path
 
-from wishlist.views import WishListView, WishListItemDetailView, WishListItemImageViewSet
+from wishlist.views import (WishListView, WishListItemDetailView, WishListItemImageViewSet,
+                            WishListImportView, WishListImportDetailView)
 
 urlpatterns = [
     path('', WishListView.as_view(), name='wishlist'),
+    path('import', WishListImportView.as_view(), name='wishlist-import'),
+    path('import/<str:uuid>', WishListImportDetailView.as_view(), name='wishlist-import-detail'),
     path('<str:uuid>', WishListItemDetailView.as_view(), name='wishlist-item-detail'),
     path('<str:uuid>/image', WishListItemImageViewSet.as_view({ 'put': 'up' }),
          name='wishlist-item-image')
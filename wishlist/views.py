@@ -1,4 +1,5 @@
 import logging
+from datetime import timedelta
 from typing import override
 from django.db import IntegrityError, transaction
 from django.db.models import QuerySet
@@ -13,11 +14,16 @@ from rest_framework.response import Response
 from django.utils import timezone
 from rest_framework.viewsets import ModelViewSet
 
-from wishlist.models import WishItem, BlobImage, ItemSource
+from wishlist.cache import bump_versions, cache_per_user, set_validators
+from wishlist.conditional import (check_if_match, get_detail_validators, get_not_modified, is_conditional,
+                                  set_row_tag)
+from wishlist.models import WishItem, BlobImage, ItemSource, ImportJob
 from wishlist.pagination import WishItemListPagination
 from wishlist.serializers import (WishListItemPatchSerializer, WishListItemSerializer,
-                                  WishListItemDetailSerializer, BlobImageUploadSerializer)
-from crawler.tasks import retrieve_data_from_url
+                                  WishListItemDetailSerializer, BlobImageUploadSerializer,
+                                  ItemImportSerializer, ImportJobSerializer)
+from crawler.canonical import get_fingerprint
+from crawler.tasks import enrich_item, schedule_crawl, start_import
 
 from django.conf import settings
 
@@ -37,14 +43,14 @@ class WishListView(GenericAPIView):
 
     @override
     def get_queryset(self) -> QuerySet:
-        return (WishItem.objects
-                .filter(deleted_at__isnull=True)
-                .filter(user_id=self.request.user.pk)
-                .only(*['uuid', 'title', 'completed_at', 'is_starred', 'updated_at', 'image']))
+        return WishListItemSerializer.setup_eager_loading(WishItem.objects
+                                                          .filter(deleted_at__isnull=True)
+                                                          .filter(user_id=self.request.user.pk))
 
     def _parse_str_to_bool(self, value: str) -> bool:
         return value.lower() == 'true'
 
+    @cache_per_user
     def get(self, request: Request, *args, **kwargs) -> Response:
         '''
         Retrieve the list of wishlist items for the authenticated user.
@@ -55,7 +61,7 @@ class WishListView(GenericAPIView):
         '''
 
         ## TODO: Add ordering options with query params
-        qs = self.get_queryset().order_by('-updated_at')
+        qs = self.get_queryset().order_by('-updated_at', '-id')
 
         starred = request.query_params.get('starred', None)
         if starred:
@@ -99,13 +105,78 @@ class WishListView(GenericAPIView):
         primary_source = sources.filter(is_primary=True).first()
 
         if primary_source and settings.USE_METADATA_CRAWLER:
-            retrieve_data_from_url.apply_async(args=(primary_source.source_url,
-                                                    res.pk,
-                                                    True if has_image_upload else False))
+            if settings.CRAWLER_ENRICH_ALL_SOURCES and sources.count() > 1:
+                enrich_item.apply_async(args=(res.pk, True if has_image_upload else False))
+            else:
+                schedule_crawl(primary_source.source_url, res.pk, True if has_image_upload else False)
 
+        # Sources are bulk created, without signals
+        bump_versions([request.user.pk])
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
 
+class WishListImportView(GenericAPIView):
+    """
+    View to import many product URLs into the wishlist at once.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ItemImportSerializer
+
+    @extend_schema(
+        request=ItemImportSerializer,
+        responses={202: ImportJobSerializer},
+        description="Create a wishlist item for each URL, and crawl their metadata in the background.",
+    )
+    def post(self, request: Request, *args, **kwargs) -> Response:
+        '''
+        Import product URLs as wishlist items of the authenticated user.
+        Items are created immediately without a title; they show the crawled title of their product
+        once the import job processes them.
+        :param request:
+        :param args:
+        :param kwargs:
+        :return:
+        '''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        urls = serializer.validated_data['urls']
+
+        with transaction.atomic():
+            job = ImportJob.objects.create(user=request.user, total=len(urls))
+            items = WishItem.objects.bulk_create(
+                [WishItem(user=request.user, is_public=serializer.validated_data['is_public'])
+                 for url in urls])
+            ItemSource.objects.bulk_create(
+                [ItemSource(wish_item=item, source_url=url, source_fingerprint=get_fingerprint(url), is_primary=True)
+                 for item, url in zip(items, urls)])
+            bump_versions([request.user.pk])
+
+        if settings.USE_METADATA_CRAWLER:
+            item_ids = [item.pk for item in items]
+            transaction.on_commit(lambda: start_import(job.pk, item_ids))
+        else:
+            job.status = ImportJob.Status.COMPLETED
+            job.processed = job.total
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'processed', 'finished_at'])
+
+        return Response(data=ImportJobSerializer(instance=job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class WishListImportDetailView(GenericAPIView):
+    """
+    View to check the progress of an import job.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ImportJobSerializer
+    queryset = ImportJob.objects.all()
+
+    def get(self, request: Request, uuid: str, *args, **kwargs) -> Response:
+        job = get_object_or_404(self.get_queryset(), uuid=uuid, user=request.user)
+        serializer = self.get_serializer(instance=job)
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
 class WishListItemDetailView(GenericAPIView):
     """
     View to manage a specific wishlist item.
@@ -116,52 +187,76 @@ class WishListItemDetailView(GenericAPIView):
     serializer_class = WishListItemDetailSerializer
     queryset = WishItem.objects.all()
 
+    def _mark_viewed(self, item: WishItem) -> None:
+        # Written at most once an hour, and without touching updated_at (used for ordering)
+        now = timezone.now()
+        if item.last_viewed_at is None or item.last_viewed_at < now - timedelta(hours=1):
+            WishItem.objects.filter(pk=item.pk).update(last_viewed_at=now)
+
     def get(self, request: Request, uuid: str, *args, **kwargs) -> Response:
+        if is_conditional(request):
+            # Revalidation reads only the columns of the validators
+            current = get_object_or_404(self.get_queryset().only('updated_at', 'last_viewed_at'),
+                                        uuid=uuid,
+                                        deleted_at__isnull=True,
+                                        user=request.user)
+            not_modified = get_not_modified(request, current.updated_at)
+            if not_modified is not None:
+                self._mark_viewed(current)
+                return not_modified
+
         requested_item = get_object_or_404(self.get_queryset(),
                                            uuid=uuid,
                                            deleted_at__isnull=True,
                                            user=request.user)
+        self._mark_viewed(requested_item)
 
         serializer = self.get_serializer(instance=requested_item)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        response = Response(data=serializer.data, status=status.HTTP_200_OK)
+        validators = get_detail_validators(request, requested_item.updated_at)
+        return response if validators is None else set_validators(response, *validators)
 
     def put(self, request: Request, uuid: str, *args, **kwargs) -> Response:
         # Updated items, deleted items, and added items should be handled here.
-        target = get_object_or_404(self.get_queryset(),
-                                   uuid=uuid,
-                                   deleted_at__isnull=True,
-                                   user__id=request.user.id)
-
-        # Merge the existing data with the new data
-        serializer = self.get_serializer(instance=target, data=request.data, partial=True)
-        serializer.is_valid(raise_exception=True)
-
         try:
             with transaction.atomic():
+                # Locked, so no other write slips in between the If-Match check and the save
+                target = get_object_or_404(self.get_queryset().select_for_update(),
+                                           uuid=uuid,
+                                           deleted_at__isnull=True,
+                                           user__id=request.user.id)
+                check_if_match(request, target.updated_at)
+
+                # Merge the existing data with the new data
+                serializer = self.get_serializer(instance=target, data=request.data, partial=True)
+                serializer.is_valid(raise_exception=True)
                 serializer.save()
+                # Sources are bulk updated, without signals
+                bump_versions([request.user.pk])
         except IntegrityError as e:
             logger.exception('Integrity Error occurred')
             raise APIException('Internal server error')
 
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return set_row_tag(Response(data=serializer.data, status=status.HTTP_200_OK), target.updated_at)
 
     def patch(self, request: Request, uuid: str, *args, **kwargs) -> Response:
-        target = get_object_or_404(self.get_queryset(),
-                                   uuid=uuid,
-                                   deleted_at__isnull=True,
-                                   user__id=request.user.id)
-        serializer = WishListItemPatchSerializer(instance=target, data=request.data, partial=True)
-        serializer.is_valid(raise_exception=True)
-
         try:
             with transaction.atomic():
+                target = get_object_or_404(self.get_queryset().select_for_update(),
+                                           uuid=uuid,
+                                           deleted_at__isnull=True,
+                                           user__id=request.user.id)
+                check_if_match(request, target.updated_at)
+
+                serializer = WishListItemPatchSerializer(instance=target, data=request.data, partial=True)
+                serializer.is_valid(raise_exception=True)
                 serializer.save()
         except IntegrityError:
             transaction.rollback()
             logger.exception('Integrity Error occurred')
             raise APIException(code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return set_row_tag(Response(status=status.HTTP_204_NO_CONTENT), target.updated_at)
 
     def delete(self, request: Request, uuid: str, *args, **kwargs) -> Response:
         target = get_object_or_404(self.get_queryset().only('uuid', 'deleted_at'),